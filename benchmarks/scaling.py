@@ -0,0 +1,181 @@
+"""Scaling benchmarks for bimorph mirror analysis on synthetic data.
+
+Sweeps the number of actuators, slit positions and repeat measurements one at a
+time, timing reading the csv file, the unrestrained, sparse and restrained solves
+and plotting. The large actuator sweep scales the slit positions with the number
+of actuators, as on a long mirror. Results are written as json, and can be
+compared against a previous run to spot regressions::
+
+    python benchmarks/scaling.py --output baseline.json
+    python benchmarks/scaling.py --output new.json --compare baseline.json
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    find_voltage_corrections_with_restraints,
+)
+from bimorph_mirror_analysis.plots import MirrorSurfacePlot
+from bimorph_mirror_analysis.read_file import read_scan_matrix
+from bimorph_mirror_analysis.sparse import find_sparse_voltage_corrections
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+# (num_actuators, num_slit_positions, repeats) for each sweep
+FULL_SWEEPS = {
+    "actuators": [(n, 1000, 1) for n in (8, 16, 32, 64, 128, 256)],
+    "slit_positions": [(8, m, 1) for m in (10**2, 10**3, 10**4, 10**5)],
+    "repeats": [(16, 1000, r) for r in (1, 2, 4, 8)],
+    "large_actuators": [(n, 20 * n, 1) for n in (64, 128, 256, 512)],
+}
+QUICK_SWEEPS = {
+    "actuators": [(n, 200, 1) for n in (8, 16, 32)],
+    "slit_positions": [(8, m, 1) for m in (10**2, 10**3, 10**4)],
+    "repeats": [(8, 200, r) for r in (1, 4)],
+    "large_actuators": [(n, 20 * n, 1) for n in (32, 64)],
+}
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_case(
+    num_actuators: int,
+    num_slit_positions: int,
+    repeats: int,
+    directory: Path,
+    repeat: int,
+    max_restrained_actuators: int,
+) -> dict[str, Any]:
+    file_path = str(directory / f"{num_actuators}_{num_slit_positions}_{repeats}.csv")
+    generate_bluesky_plan_output(
+        num_actuators, num_slit_positions, repeats=repeats, noise=0.01, seed=0
+    ).to_csv(file_path, index=False)
+
+    result: dict[str, Any] = {
+        "num_actuators": num_actuators,
+        "num_slit_positions": num_slit_positions,
+        "repeats": repeats,
+    }
+    result["read"] = best_time(lambda: read_scan_matrix(file_path), repeat)
+
+    scans, initial_voltages, increment = read_scan_matrix(file_path)
+    slit_positions = scans.slit_positions
+    data = scans.centroids
+    result["unrestrained"] = best_time(
+        lambda: find_voltage_corrections(data, increment), repeat
+    )
+    result["sparse"] = best_time(
+        lambda: find_sparse_voltage_corrections(data, increment), repeat
+    )
+
+    if num_actuators <= max_restrained_actuators:
+        # tight enough that the unrestrained solution does not fit
+        result["restrained"] = best_time(
+            lambda: find_voltage_corrections_with_restraints(
+                data, increment, initial_voltages, (-200, 200), 50
+            ),
+            1,
+        )
+    else:
+        result["restrained"] = None
+
+    corrections = find_voltage_corrections(data, increment)
+    predicted = data[:, 0] + np.diff(data, axis=1) / increment @ corrections
+
+    def plot():
+        mirror_plot = MirrorSurfacePlot(
+            slit_positions, data[:, 0], predicted, downsample=True
+        )
+        mirror_plot.save_plot(str(directory / "plot.png"))
+        plt.close(mirror_plot.fig)
+
+    result["plot"] = best_time(plot, repeat)
+    return result
+
+
+def compare(results: list[dict[str, Any]], baseline: list[dict[str, Any]]):
+    keys = ("num_actuators", "num_slit_positions", "repeats")
+    previous = {tuple(r[k] for k in keys): r for r in baseline}
+    stages = ("read", "unrestrained", "sparse", "restrained", "plot")
+    print(f"{'case':>20}  " + "  ".join(f"{s:>12}" for s in stages))
+    for result in results:
+        case = tuple(result[k] for k in keys)
+        if case not in previous:
+            continue
+        ratios = [
+            f"{result[s] / previous[case][s]:>11.2f}x"
+            if result[s] is not None and previous[case].get(s)
+            else f"{'-':>12}"
+            for s in stages
+        ]
+        print(f"{'/'.join(map(str, case)):>20}  " + "  ".join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="a previous results file to compare to")
+    parser.add_argument("--quick", action="store_true", help="run smaller sweeps")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--max-restrained-actuators",
+        type=int,
+        default=64,
+        help="skip the slow restrained solve above this many actuators",
+    )
+    args = parser.parse_args()
+
+    sweeps = QUICK_SWEEPS if args.quick else FULL_SWEEPS
+    cases = sorted({case for sweep in sweeps.values() for case in sweep})
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for case in cases:
+            result = benchmark_case(
+                *case, Path(directory), args.repeat, args.max_restrained_actuators
+            )
+            print(
+                ", ".join(
+                    f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}"
+                    for k, v in result.items()
+                )
+            )
+            results.append(result)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "machine": platform.platform(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "sweeps": {k: [list(c) for c in v] for k, v in sweeps.items()},
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"The benchmark results have been saved to {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
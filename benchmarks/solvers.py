@@ -0,0 +1,145 @@
+"""Time each solver backend to calibrate the auto solver policy.
+
+Each solver the auto policy can choose is timed on synthetic pencil beam scans over
+a grid of numbers of slit positions and actuators. The restrained solvers are timed
+with constraints tight enough that the unrestrained solution does not fit them. The
+results are written as json, by default to the copy bundled with the package which
+select_solver reads::
+
+    python benchmarks/solvers.py
+    python benchmarks/solvers.py --output timings.json --quick
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from bimorph_mirror_analysis.maths import SOLVERS, process_pencil_beam_scans
+from bimorph_mirror_analysis.read_file import read_scan_matrix
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+DEFAULT_OUTPUT = (
+    Path(__file__).parent.parent
+    / "src"
+    / "bimorph_mirror_analysis"
+    / "solver_timings.json"
+)
+
+# (num_slit_positions, num_actuators) for each case, leaving out the cases whose
+# synthetic csv file, with a column per actuator, would not fit in memory
+FULL_GRID = [
+    (m, n)
+    for m in (100, 1000, 10000)
+    for n in (8, 16, 32, 64, 128, 256)
+    if n < m and m * n <= 10000 * 128
+]
+QUICK_GRID = [(m, n) for m in (100, 1000) for n in (8, 32)]
+# the solvers the auto policy chooses between, and the regularised solver it falls
+# back to for ill-conditioned scans
+TIMED_SOLVERS = ("pinv", "lstsq", "regularized", "sparse", "qp", "slsqp")
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    times: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_case(
+    num_slit_positions: int,
+    num_actuators: int,
+    directory: Path,
+    repeat: int,
+    max_slsqp_actuators: int,
+) -> dict[str, Any]:
+    file_path = str(directory / f"{num_actuators}_{num_slit_positions}.csv")
+    generate_bluesky_plan_output(
+        num_actuators, num_slit_positions, noise=0.01, seed=0
+    ).to_csv(file_path, index=False)
+    scans, initial_voltages, increment = read_scan_matrix(file_path)
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        scans, increment
+    )
+    constraints = {
+        "initial_voltages": initial_voltages,
+        "voltage_range": (-200, 200),
+        "max_consecutive_voltage_difference": 50,
+    }
+
+    times: dict[str, float | None] = {}
+    for name in TIMED_SOLVERS:
+        solver = SOLVERS[name]
+        if name == "slsqp" and num_actuators > max_slsqp_actuators:
+            times[name] = None
+            continue
+        times[name] = best_time(
+            lambda solver=solver: solver["solve"](
+                interaction_matrix,
+                desired_corrections,
+                constraints if solver["constrained"] else None,  # type: ignore
+                None,
+            ),
+            1 if solver["constrained"] else repeat,
+        )
+    return {
+        "num_slit_positions": num_slit_positions,
+        "num_actuators": num_actuators,
+        "times": times,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT))
+    parser.add_argument("--quick", action="store_true", help="run a smaller grid")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--max-slsqp-actuators",
+        type=int,
+        default=64,
+        help="skip the slow SLSQP solve above this many actuators",
+    )
+    args = parser.parse_args()
+
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for case in QUICK_GRID if args.quick else FULL_GRID:
+            result = benchmark_case(
+                *case, Path(directory), args.repeat, args.max_slsqp_actuators
+            )
+            print(
+                f"{case[0]} slit positions, {case[1]} actuators: "
+                + ", ".join(
+                    f"{name}={seconds:.4f}" if seconds is not None else f"{name}=-"
+                    for name, seconds in result["times"].items()
+                )
+            )
+            results.append(result)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "machine": platform.platform(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+        f.write("\n")
+    print(f"The solver timings have been saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
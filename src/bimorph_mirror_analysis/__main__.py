@@ -1,21 +1,43 @@
 """Interface for ``python -m bimorph_mirror_analysis``."""
 
 import datetime
+import os
+import time
 
 import numpy as np
+import pandas as pd
 import typer
 
-from bimorph_mirror_analysis.maths import (
-    check_voltages_fit_constraints,
-    find_voltage_corrections,
-    find_voltage_corrections_with_restraints,
+from bimorph_mirror_analysis.aggregation import InteractionMatrixAccumulator
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.basis import SmoothInfluenceModel
+from bimorph_mirror_analysis.columnar import EXTENSIONS, export_analysis
+from bimorph_mirror_analysis.failure import (
+    evaluate_actuator_failures,
+    find_voltage_corrections_with_frozen_actuators,
 )
-from bimorph_mirror_analysis.plots import (
-    InfluenceFunctionPlot,
-    MirrorSurfacePlot,
-    PencilBeamScanPlot,
+from bimorph_mirror_analysis.history import (
+    CalibrationHistory,
+    interaction_matrix_drift,
+)
+from bimorph_mirror_analysis.maths import SOLVERS, process_pencil_beam_scans
+from bimorph_mirror_analysis.plot_data import (
+    collect_plot_data,
+    load_plot_data,
+    save_plot_data,
+)
+from bimorph_mirror_analysis.profiling import Profiler, profile_stage, profiling
+from bimorph_mirror_analysis.quantize import find_quantized_voltage_corrections
+from bimorph_mirror_analysis.ramp import plan_voltage_ramp, save_voltage_ramp
+from bimorph_mirror_analysis.read_file import read_baseline_scan
+from bimorph_mirror_analysis.recalibration import IncrementalRecalibration
+from bimorph_mirror_analysis.robust import find_robust_voltage_corrections
+from bimorph_mirror_analysis.scan_planning import select_slit_positions
+from bimorph_mirror_analysis.sweep import sweep_constraints as find_constraint_sweep
+from bimorph_mirror_analysis.uncertainty import (
+    bootstrap_voltage_corrections,
+    cross_validate_voltage_corrections,
 )
-from bimorph_mirror_analysis.read_file import read_bluesky_plan_output
 
 from . import __version__
 
@@ -53,20 +75,122 @@ If the --human-readable flag is not supplied, the table is not saved.",
         help="The minimum and maximum\
  values for slit positions that should be considered when performing the analysis",
     ),
+    profile: bool = typer.Option(
+        False,
+        help="Print the time and peak memory of each analysis stage, and save them\
+ to a json trace.",
+    ),
+    history: str | None = typer.Option(
+        None,
+        help="The path to a calibration history database to record this run in.\
+ Requires --mirror-id.",
+    ),
+    mirror_id: str | None = typer.Option(
+        None,
+        help="The name of the mirror being calibrated, used by --history.",
+    ),
+    warm_start: bool = typer.Option(
+        False,
+        help="Start the restrained optimisation from the voltages of the latest\
+ calibration of the mirror in --history.",
+    ),
+    weighted: bool = typer.Option(
+        False,
+        help="Weight each slit position by the inverse variance of its repeated\
+ measurements.",
+    ),
+    basis_functions: int | None = typer.Option(
+        None,
+        help="Fit the influence functions to this many smooth basis functions, to\
+ smooth out noise in the pencil beam scans.",
+    ),
+    basis: str = typer.Option(
+        "legendre", help="The smooth basis to use, legendre or bspline."
+    ),
+    influence_model: str | None = typer.Option(
+        None,
+        help="The path to a model saved by fit-influence-functions, to rebuild the\
+ interaction matrix from at the slit positions of this scan, in place of the raw\
+ differences of the scans.",
+    ),
+    solver: str | None = typer.Option(
+        None,
+        help=f"The solver backend to use, auto or one of {', '.join(SOLVERS)}. If\
+ not supplied, the pseudo-inverse is used, followed by slsqp if its solution does\
+ not fit the constraints.",
+    ),
+    columnar_output: str | None = typer.Option(
+        None,
+        help="A path stem to also save the pencil beam scans, interaction matrix,\
+ predicted centroids and voltages to as columnar tables with the run metadata, for\
+ example results/run writes results/run_scans.parquet and so on. Requires pyarrow.",
+    ),
+    columnar_format: str = typer.Option(
+        "parquet",
+        help="The format of the columnar tables, parquet or arrow for Arrow IPC files\
+ which can be memory-mapped.",
+    ),
 ):
+    if history is not None and mirror_id is None:
+        raise typer.BadParameter("--mirror-id is required with --history")
+    if warm_start and history is None:
+        raise typer.BadParameter("--history is required with --warm-start")
+    if basis not in ("legendre", "bspline"):
+        raise typer.BadParameter(f"basis must be legendre or bspline, got {basis}")
+    if influence_model is not None and basis_functions is not None:
+        raise typer.BadParameter(
+            "--influence-model and --basis-functions can't be used together"
+        )
+    if influence_model is not None and not os.path.exists(influence_model):
+        raise typer.BadParameter(f"There is no influence model at {influence_model}")
+    if solver is not None and solver != "auto" and solver not in SOLVERS:
+        raise typer.BadParameter(
+            f"solver must be auto or one of {', '.join(SOLVERS)}, got {solver}"
+        )
+    if columnar_format not in EXTENSIONS:
+        raise typer.BadParameter(
+            f"columnar-format must be parquet or arrow, got {columnar_format}"
+        )
     file_type = file_path.split(".")[-1]
-    if human_readable is not None:
-        pivoted, *_ = read_bluesky_plan_output(file_path)
-        pivoted.to_csv(human_readable)
-        print(f"The human-readable file has been written to {human_readable}")
-
-    optimal_voltages = calculate_optimal_voltages(
+    # one session for the whole command, so the file is read and the interaction
+    # matrix built once
+    analysis = BimorphAnalysis(
         file_path,
         voltage_range=voltage_range,
         max_consecutive_voltage_difference=max_consecutive_voltage_difference,
         baseline_voltage_scan=baseline_voltage_scan,
         slit_range=slit_range,
+        weighted=weighted,
+        num_basis_functions=basis_functions,
+        basis=basis,  # type: ignore
+        saved_influence_model=(
+            None
+            if influence_model is None
+            else SmoothInfluenceModel.load(influence_model)
+        ),
+        solver=solver,
     )
+    start = time.perf_counter()
+    with profiling(profile) as profiler:
+        if warm_start and history is not None and mirror_id is not None:
+            _warm_start(analysis, history, mirror_id)
+        if human_readable is not None:
+            analysis.pivoted.to_csv(human_readable)
+            print(f"The human-readable file has been written to {human_readable}")
+
+        optimal_voltages = calculate_optimal_voltages(
+            file_path,
+            voltage_range=voltage_range,
+            max_consecutive_voltage_difference=max_consecutive_voltage_difference,
+            baseline_voltage_scan=baseline_voltage_scan,
+            slit_range=slit_range,
+            weighted=weighted,
+            num_basis_functions=basis_functions,
+            basis=basis,
+            solver=solver,
+            analysis=analysis,
+        )
+    elapsed = time.perf_counter() - start
     optimal_voltages = np.round(optimal_voltages, 2)
     date = datetime.datetime.now().date()
 
@@ -84,6 +208,80 @@ _optimal_voltages_{date}.csv"
         f"The optimal voltages are: [{', '.join([str(i) for i in optimal_voltages])}]"
     )
 
+    if columnar_output is not None:
+        paths = export_analysis(
+            analysis,
+            optimal_voltages,
+            columnar_output,
+            columnar_format,  # type: ignore
+        )
+        print(f"The columnar tables have been saved to {', '.join(paths.values())}")
+
+    if history is not None and mirror_id is not None:
+        timings = {"calculate_optimal_voltages": elapsed}
+        if profiler is not None:
+            for record in profiler.records:
+                timings[record["name"]] = record["wall_time"]
+        _record_calibration(history, mirror_id, analysis, optimal_voltages, timings)
+
+    if profiler is not None:
+        _report_profile(
+            profiler, f"{file_path.replace(f'.{file_type}', '')}_profile_{date}.json"
+        )
+
+
+def _warm_start(analysis: BimorphAnalysis, history: str, mirror_id: str):
+    record = None
+    if os.path.exists(history):
+        with CalibrationHistory(history) as store:
+            record = store.latest(mirror_id)
+    if record is None:
+        print(f"There is no calibration of {mirror_id} to warm start from")
+    elif record["optimal_voltages"].shape != analysis.initial_voltages.shape:
+        print(
+            f"The latest calibration of {mirror_id} has a different number of\
+ actuators, so it is not used as a warm start"
+        )
+    else:
+        analysis.initial_guess = record["optimal_voltages"] - analysis.initial_voltages
+        print(f"Warm starting from the calibration from {record['created_at']}")
+
+
+def _record_calibration(
+    history: str,
+    mirror_id: str,
+    analysis: BimorphAnalysis,
+    optimal_voltages: np.typing.NDArray[np.float64],
+    timings: dict[str, float],
+):
+    predicted_centroids = analysis.predicted_centroids(
+        optimal_voltages - analysis.initial_voltages
+    )
+    with CalibrationHistory(history) as store:
+        run_id = store.record(
+            mirror_id,
+            analysis.slit_positions,
+            analysis.interaction_matrix,
+            analysis.baseline_centroids,
+            analysis.initial_voltages,
+            optimal_voltages,
+            voltage_range=analysis.voltage_range,
+            max_consecutive_voltage_difference=(
+                analysis.max_consecutive_voltage_difference
+            ),
+            baseline_voltage_scan=analysis.baseline_voltage_scan,
+            residual=float(np.std(predicted_centroids)),
+            timings=timings,
+            source_file=analysis.file_path,
+        )
+    print(f"The calibration has been recorded in {history} with id {run_id}")
+
+
+def _report_profile(profiler: Profiler, trace_path: str):
+    print(profiler.summary())
+    profiler.write_json(trace_path)
+    print(f"The profile trace has been saved to {trace_path}")
+
 
 def calculate_optimal_voltages(
     file_path: str,
@@ -91,6 +289,11 @@ def calculate_optimal_voltages(
     max_consecutive_voltage_difference: int,
     baseline_voltage_scan: int = 0,
     slit_range: tuple[float, float] | None = None,
+    weighted: bool = False,
+    num_basis_functions: int | None = None,
+    basis: str = "legendre",
+    solver: str | None = None,
+    analysis: BimorphAnalysis | None = None,
 ) -> np.typing.NDArray[np.float64]:
     """Calculate the optimal voltages for the bimorph mirror actuators.
 
@@ -101,51 +304,79 @@ def calculate_optimal_voltages(
  between two consecutive actuators
         baseline_voltage_scan: The index of the pencil beam scan which had no increment\
  applied
+        slit_range: The minimum and maximum values for slit positions that should be\
+ considered when performing the analysis
+        weighted: Whether to weight each slit position by the inverse variance of\
+ its repeated measurements
+        num_basis_functions: If supplied, the influence functions are fitted to this\
+ many smooth basis functions
+        basis: The smooth basis, "legendre" or "bspline"
+        solver: The solver backend, "auto" or a name in SOLVERS. If not supplied, the\
+ pseudo-inverse is used, followed by SLSQP if its solution does not fit the\
+ constraints.
+        analysis: An analysis session of the file with these parameters to reuse,\
+ so that its cached stages are shared with the caller. If not supplied, a new one\
+ is created.
 
     Returns:
         The optimal voltages for the bimorph mirror actuators.
     """
-    pivoted, initial_voltages, increment = read_bluesky_plan_output(file_path)
-
-    if slit_range is not None:
-        pivoted_in_range = pivoted[  # type: ignore
-            (pivoted["slit_position_x"] >= slit_range[0])
-            & (pivoted["slit_position_x"] <= slit_range[1])  # type: ignore
-        ]
-        data = pivoted_in_range[pivoted_in_range.columns[1:]].to_numpy()  # type: ignore
-
-    else:
-        data = pivoted[pivoted.columns[1:]].to_numpy()  # type: ignore
-
-    voltage_adjustments = find_voltage_corrections(
-        data,  # type: ignore
-        increment,
-        baseline_voltage_scan=baseline_voltage_scan,
-    )
-    optimal_voltages = initial_voltages + voltage_adjustments
-    if check_voltages_fit_constraints(
-        optimal_voltages, voltage_range, max_consecutive_voltage_difference
-    ):
-        return optimal_voltages
+    if analysis is None:
+        analysis = BimorphAnalysis(
+            file_path,
+            voltage_range=voltage_range,
+            max_consecutive_voltage_difference=max_consecutive_voltage_difference,
+            baseline_voltage_scan=baseline_voltage_scan,
+            slit_range=slit_range,
+            weighted=weighted,
+            num_basis_functions=num_basis_functions,
+            basis=basis,  # type: ignore
+            solver=solver,
+        )
+    with profile_stage("calculate_optimal_voltages") as details:
+        if solver is not None:
+            result = analysis.solver_result
+            details["solver_path"] = result["solver"]
+            print(
+                f"The {result['solver']} solver found the voltages in\
+ {1000 * result['elapsed']:.1f} ms"
+            )
+            if result["fits_constraints"] is False:
+                print("These voltages do not fit the constraints")
+            return analysis.optimal_voltages
+        if analysis.unrestrained_voltages_fit_constraints:
+            details["solver_path"] = "unrestrained"
+            return analysis.optimal_voltages
 
-    else:
+        details["solver_path"] = "restrained"
         print("The optimal voltages calculated with multiple linear regression are:")
-        print(optimal_voltages)
+        print(analysis.initial_voltages + analysis.unrestrained_voltage_corrections)
         print(
             "However, these do not fit the constraints provided. Using an iterative\
  approach to find the optimal voltages which fit the constraints"
         )
-        voltage_adjustments = find_voltage_corrections_with_restraints(
-            data,  # type: ignore
-            increment,
-            initial_voltages,
-            voltage_range,
-            max_consecutive_voltage_difference,
-            baseline_voltage_scan=baseline_voltage_scan,
-        )
-        optimal_voltages = initial_voltages + voltage_adjustments
+        return analysis.optimal_voltages
 
-        return optimal_voltages
+
+def read_optimal_voltages(
+    file_path: str, num_actuators: int
+) -> np.typing.NDArray[np.float64]:
+    """Read optimal voltages previously saved by calculate_voltages.
+
+    Args:
+        file_path: The path to the file of optimal voltages
+        num_actuators: The number of actuators the voltages are expected for
+
+    Returns:
+        The optimal voltages for the bimorph mirror actuators.
+    """
+    voltages = np.atleast_1d(np.loadtxt(file_path, dtype=np.float64))
+    if voltages.shape != (num_actuators,):
+        raise ValueError(
+            f"{file_path} contains {voltages.size} voltages, but the scan has\
+ {num_actuators} actuators"
+        )
+    return voltages
 
 
 def version_callback(value: bool):
@@ -171,67 +402,872 @@ on the bimorph mirror."
         help="The index of the pencil beam scan which had no increment applied.",
         default=0,
     ),
+    downsample: bool = typer.Option(
+        False,
+        help="Downsample dense scans to the pixel width of the figure before\
+ plotting, keeping the minimum and maximum of each pixel column.",
+    ),
+    voltages_path: str | None = typer.Option(
+        None,
+        help="The path to optimal voltages previously saved by calculate-voltages.\
+ If supplied, the voltages are not recalculated.",
+    ),
+    profile: bool = typer.Option(
+        False,
+        help="Print the time and peak memory of each analysis stage, and save them\
+ to a json trace in the output directory.",
+    ),
+    weighted: bool = typer.Option(
+        False,
+        help="Weight each slit position by the inverse variance of its repeated\
+ measurements.",
+    ),
+    basis_functions: int | None = typer.Option(
+        None,
+        help="Fit the influence functions to this many smooth basis functions, to\
+ smooth out noise in the pencil beam scans.",
+    ),
+    basis: str = typer.Option(
+        "legendre", help="The smooth basis to use, legendre or bspline."
+    ),
+    defer_rendering: bool = typer.Option(
+        False,
+        help="Only save the plot data to plot_data.npz in the output directory, to\
+ be drawn later with the render command.",
+    ),
 ):
+    if basis not in ("legendre", "bspline"):
+        raise typer.BadParameter(f"basis must be legendre or bspline, got {basis}")
     # add trailing slash to output_dir if not present
     if output_dir[-1] != "/":
         output_dir += "/"
 
-    pivoted, initial_voltages, increment = read_bluesky_plan_output(file_path)
-    pencil_beam_scan_cols = [
-        col for col in pivoted.columns if "pencil_beam_scan" in col
-    ]
-    slit_positions: np.typing.NDArray[np.float64] = pivoted[
-        "slit_position_x"
-    ].to_numpy()  # type: ignore
-
-    for col in pencil_beam_scan_cols:
-        i = int(col.split("_")[-1])
-        plot = PencilBeamScanPlot(pivoted, i)
-        plot.save_plot(output_dir + "pencil_beam_scan_" + str(i) + ".png")
-    print(f"Pencil Beam Scan plots have been saved to {output_dir}")
-
-    data: np.typing.NDArray[np.float64] = pivoted[pivoted.columns[1:]].to_numpy()  # type: ignore
-    responses = np.diff(
-        data, axis=1
-    )  # calculate the response of each actuator by subtracting previous pencil beam
-    interation_matrix = responses / increment  # response per unit charge
-
-    for actuator_num in range(responses.shape[1]):
-        centroids = interation_matrix[:, actuator_num]
-        plot = InfluenceFunctionPlot(slit_positions, centroids, actuator_num)
-        plot.save_plot(output_dir + f"actuator_{actuator_num}_influence_function.png")
-    print(f"influence function plots have been saved to {output_dir}")
-
-    # Add in predicted centroid positions using restrained and unrestrained voltage
-    # corrections once the other prs are merged
-    unrestrained_voltage_corrections = find_voltage_corrections(
-        data, increment, baseline_voltage_scan=baseline_voltage_scan
-    )
-    restrained_voltage_corrections = find_voltage_corrections_with_restraints(
-        data,
-        increment,
-        initial_voltages,
+    with profiling(profile) as profiler:
+        analysis = BimorphAnalysis(
+            file_path,
+            voltage_range=voltage_range,
+            max_consecutive_voltage_difference=max_consecutive_voltage_difference,
+            baseline_voltage_scan=baseline_voltage_scan,
+            weighted=weighted,
+            num_basis_functions=basis_functions,
+            basis=basis,  # type: ignore
+        )
+        if voltages_path is not None:
+            restrained_voltage_corrections = (
+                read_optimal_voltages(voltages_path, len(analysis.initial_voltages))
+                - analysis.initial_voltages
+            )
+        else:
+            # only runs the restrained optimisation if the unrestrained solution does
+            # not already fit the constraints
+            restrained_voltage_corrections = analysis.optimal_voltage_corrections
+        plot_data = collect_plot_data(analysis, restrained_voltage_corrections)
+
+        if defer_rendering:
+            bundle_path = output_dir + "plot_data.npz"
+            save_plot_data(plot_data, bundle_path)
+            print(
+                f"The plot data has been saved to {bundle_path}, draw it with the\
+ render command"
+            )
+        else:
+            # matplotlib is only imported to draw, so deferring does not load it
+            from bimorph_mirror_analysis.plots import render_plots
+
+            render_plots(plot_data, output_dir, downsample=downsample)
+            print(f"Pencil Beam Scan plots have been saved to {output_dir}")
+            print(f"influence function plots have been saved to {output_dir}")
+            print(f"The mirror surface plot has been saved to {output_dir}")
+
+    if profiler is not None:
+        _report_profile(profiler, output_dir + "profile.json")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def render(
+    bundle_path: str = typer.Argument(
+        help="The path to a plot-data bundle saved by generate-plots\
+ --defer-rendering."
+    ),
+    output_dir: str = typer.Argument(
+        help="The directory to save the output plots to.",
+    ),
+    downsample: bool = typer.Option(
+        False,
+        help="Downsample dense scans to the pixel width of the figure before\
+ plotting, keeping the minimum and maximum of each pixel column.",
+    ),
+):
+    """Draw the plots from a plot-data bundle."""
+    from bimorph_mirror_analysis.plots import render_plots
+
+    if output_dir[-1] != "/":
+        output_dir += "/"
+    paths = render_plots(load_plot_data(bundle_path), output_dir, downsample=downsample)
+    print(f"{len(paths)} plots have been saved to {output_dir}")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def plan_slit_positions(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    tolerance: float = typer.Option(
+        0.01,
+        help="The largest allowed relative difference between the voltage\
+ corrections from the selected slit positions and from all slit positions.",
+    ),
+    criterion: str = typer.Option(
+        "D", help="The optimal design criterion to use, D or A."
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the selected slit positions to, optional.",
+    ),
+    time_per_point: float | None = typer.Option(
+        None,
+        help="The time taken to measure one slit position in one pencil beam scan,\
+ in seconds. If supplied, the expected time saving is reported.",
+    ),
+):
+    """Select a subset of slit positions to measure in the next pencil beam scans."""
+    if criterion not in ("D", "A"):
+        raise typer.BadParameter(f"criterion must be D or A, got {criterion}")
+    analysis = BimorphAnalysis(file_path, baseline_voltage_scan=baseline_voltage_scan)
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        analysis.data, analysis.voltage_increment, baseline_voltage_scan
+    )
+    selected, error = select_slit_positions(
+        interaction_matrix,
+        desired_corrections,
+        tolerance=tolerance,
+        criterion=criterion,  # type: ignore
+    )
+    slit_positions = analysis.slit_positions[selected]
+
+    if output_path is None:
+        file_type = file_path.split(".")[-1]
+        date = datetime.datetime.now().date()
+        output_path = f"{file_path.replace(f'.{file_type}', '')}\
+_slit_positions_{date}.csv"
+    np.savetxt(output_path, slit_positions)
+    print(f"The selected slit positions have been saved to {output_path}")
+
+    num_slit_positions = len(analysis.slit_positions)
+    print(
+        f"Selected {len(selected)} of {num_slit_positions} slit positions\
+ ({1 - len(selected) / num_slit_positions:.0%} fewer measurements), with a relative\
+ difference of {error:.2g} in the voltage corrections"
+    )
+    if time_per_point is not None:
+        num_scans = analysis.data.shape[1]
+        saving = (num_slit_positions - len(selected)) * num_scans * time_per_point
+        print(f"The expected time saving is {saving:.0f} seconds")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def estimate_uncertainty(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    num_resamples: int = typer.Option(2000, help="The number of bootstrap resamples."),
+    confidence_level: float = typer.Option(
+        0.95, help="The confidence level of the intervals."
+    ),
+    method: str = typer.Option(
+        "rows",
+        help="What to resample, rows to resample slit positions or residuals to\
+ resample the residuals of the fit.",
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+    seed: int | None = typer.Option(None, help="The seed for the resampling."),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the confidence intervals to, optional. If not\
+ supplied, they are only printed.",
+    ),
+):
+    """Estimate confidence intervals for the unrestrained voltage corrections."""
+    if method not in ("rows", "residuals"):
+        raise typer.BadParameter(f"method must be rows or residuals, got {method}")
+    analysis = BimorphAnalysis(
+        file_path, baseline_voltage_scan=baseline_voltage_scan, slit_range=slit_range
+    )
+    intervals = bootstrap_voltage_corrections(
+        analysis.data,
+        analysis.voltage_increment,
+        baseline_voltage_scan=baseline_voltage_scan,
+        num_resamples=num_resamples,
+        confidence_level=confidence_level,
+        method=method,  # type: ignore
+        seed=seed,
+    )
+    table = pd.DataFrame(
+        {
+            "actuator": np.arange(1, len(intervals["corrections"]) + 1),
+            "correction": intervals["corrections"],
+            "standard_error": intervals["standard_error"],
+            "lower": intervals["lower"],
+            "upper": intervals["upper"],
+        }
+    )
+    print(
+        f"{confidence_level:.0%} confidence intervals from {num_resamples} resamples\
+ of the {method}:"
+    )
+    print(table.round(2).to_string(index=False))
+    if output_path is not None:
+        table.to_csv(output_path, index=False)
+        print(f"The confidence intervals have been saved to {output_path}")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def cross_validate(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+    num_influential: int = typer.Option(
+        5, help="The number of most influential slit positions to report."
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the leverage and leave-one-out residual of each slit\
+ position to, optional.",
+    ),
+):
+    """Cross-validate the unrestrained voltage corrections, leaving out each slit\
+ position in turn."""
+    analysis = BimorphAnalysis(
+        file_path, baseline_voltage_scan=baseline_voltage_scan, slit_range=slit_range
+    )
+    validation = cross_validate_voltage_corrections(
+        analysis.data,
+        analysis.voltage_increment,
+        baseline_voltage_scan=baseline_voltage_scan,
+        num_influential=num_influential,
+    )
+    print(f"RMS residual: {validation['rms_error']:.4g}")
+    print(f"Leave-one-out RMS residual: {validation['cv_rms_error']:.4g}")
+    table = pd.DataFrame(
+        {
+            "slit_position_x": analysis.slit_positions,
+            "leverage": validation["leverage"],
+            "residual": validation["residuals"],
+            "loo_residual": validation["loo_residuals"],
+            "cooks_distance": validation["cooks_distance"],
+            "high_leverage": validation["high_leverage"],
+        }
+    )
+    if num_influential > 0:
+        print("The most influential slit positions:")
+        print(table.iloc[validation["influential_rows"]].to_string(index=False))
+    if output_path is not None:
+        table.to_csv(output_path, index=False)
+        print(f"The cross-validation has been saved to {output_path}")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def sweep_constraints(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    voltage_range: list[str] = typer.Option(  # noqa: B008
+        ...,
+        help="A minimum and maximum voltage separated by a comma, e.g. -1000,1000.\
+ Can be given several times.",
+    ),
+    max_consecutive_voltage_difference: list[int] = typer.Option(  # noqa: B008
+        ...,
+        help="A maximum voltage difference allowed between two consecutive\
+ actuators. Can be given several times.",
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+    max_workers: int | None = typer.Option(
+        None, help="The number of processes to use, one per CPU if not supplied."
+    ),
+    output_path: str | None = typer.Option(
+        None, help="The path to save the table of results to, optional."
+    ),
+    plot_path: str | None = typer.Option(
+        None, help="The path to save the Pareto front plot to, optional."
+    ),
+):
+    """Solve the restrained problem over a grid of constraints."""
+    voltage_ranges: list[tuple[int, int]] = []
+    for value in voltage_range:
+        try:
+            voltage_min, voltage_max = (int(v) for v in value.split(","))
+        except ValueError:
+            raise typer.BadParameter(
+                f"voltage range must be two integers separated by a comma, got {value}"
+            ) from None
+        voltage_ranges.append((voltage_min, voltage_max))
+
+    analysis = BimorphAnalysis(
+        file_path, baseline_voltage_scan=baseline_voltage_scan, slit_range=slit_range
+    )
+    table = find_constraint_sweep(
+        analysis.data,
+        analysis.voltage_increment,
+        analysis.initial_voltages,
+        voltage_ranges,
+        max_consecutive_voltage_difference,
+        baseline_voltage_scan=baseline_voltage_scan,
+        max_workers=max_workers,
+    )
+    summary = table.drop(columns="voltage_corrections")
+    print(summary.to_string(index=False))
+    if output_path is not None:
+        table["voltage_corrections"] = table["voltage_corrections"].map(  # type: ignore
+            lambda v: " ".join(f"{i:.2f}" for i in v)  # type: ignore
+        )
+        table.to_csv(output_path, index=False)
+        print(f"The sweep results have been saved to {output_path}")
+    if plot_path is not None:
+        from bimorph_mirror_analysis.plots import ParetoFrontPlot
+
+        ParetoFrontPlot(summary).save_plot(plot_path)
+        print(f"The Pareto front plot has been saved to {plot_path}")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def robust_voltages(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    loss: str = typer.Option(
+        "huber",
+        help="The robust loss, huber to shrink the weight of bad slit positions or\
+ tukey to ignore the worst of them entirely.",
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the output optimal voltages to, optional.",
+    ),
+):
+    """Calculate voltages with a fit which is resistant to bad centroids."""
+    if loss not in ("huber", "tukey"):
+        raise typer.BadParameter(f"loss must be huber or tukey, got {loss}")
+    analysis = BimorphAnalysis(
+        file_path, baseline_voltage_scan=baseline_voltage_scan, slit_range=slit_range
+    )
+    fit = find_robust_voltage_corrections(
+        analysis.data,
+        analysis.voltage_increment,
+        baseline_voltage_scan=baseline_voltage_scan,
+        loss=loss,  # type: ignore
+    )
+    if not fit["converged"]:
+        print(f"The robust fit did not converge after {fit['iterations']} iterations")
+
+    downweighted = fit["downweighted"]
+    if len(downweighted):
+        print(f"{len(downweighted)} slit positions were down-weighted as outliers:")
+        for row in downweighted:
+            print(
+                f"  slit position {analysis.slit_positions[row]}, weight\
+ {fit['weights'][row]:.3f}"
+            )
+    else:
+        print("No slit positions were down-weighted")
+
+    optimal_voltages = np.round(analysis.initial_voltages + fit["corrections"], 2)
+    if output_path is None:
+        file_type = file_path.split(".")[-1]
+        date = datetime.datetime.now().date()
+        output_path = f"{file_path.replace(f'.{file_type}', '')}\
+_robust_voltages_{date}.csv"
+    np.savetxt(output_path, optimal_voltages, fmt="%.2f")
+    print(f"The optimal voltages have been saved to {output_path}")
+    print(
+        f"The optimal voltages are: [{', '.join([str(i) for i in optimal_voltages])}]"
+    )
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def fit_influence_functions(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    model_path: str = typer.Argument(
+        help="The path to save the basis coefficients to, as a .npz file."
+    ),
+    basis_functions: int = typer.Option(
+        12, help="The number of smooth basis functions."
+    ),
+    basis: str = typer.Option(
+        "legendre", help="The smooth basis to use, legendre or bspline."
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+):
+    """Fit the influence functions to a smooth basis and save the coefficients."""
+    if basis not in ("legendre", "bspline"):
+        raise typer.BadParameter(f"basis must be legendre or bspline, got {basis}")
+    analysis = BimorphAnalysis(
+        file_path,
+        slit_range=slit_range,
+        num_basis_functions=basis_functions,
+        basis=basis,  # type: ignore
+    )
+    model = analysis.influence_model
+    assert model is not None
+    model.save(model_path)
+
+    raw = np.diff(analysis.data, axis=1) / analysis.voltage_increment
+    rms = np.sqrt(np.mean((analysis.interaction_matrix - raw) ** 2))
+    print(f"The basis coefficients have been saved to {model_path}")
+    print(
+        f"{model.coefficients.size} coefficients in place of {raw.size} matrix\
+ entries ({raw.size / model.coefficients.size:.1f}x smaller), with an RMS\
+ difference of {rms:.3g} from the raw influence functions"
+    )
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def plan_ramp(
+    file_path: str = typer.Argument(
+        help="The path to the csv file of pencil beam scans, whose initial voltages\
+ the ramp starts from."
+    ),
+    voltages_path: str = typer.Argument(
+        help="The path to the voltages to ramp to, as saved by calculate-voltages."
+    ),
+    voltage_range: tuple[int, int] = typer.Argument(
+        help="The minimum and maximum values a voltage can take. expects two integers\
+ separated by a space"
+    ),
+    max_consecutive_voltage_difference: int = typer.Argument(
+        help="The maximum voltage difference allowed between two consecutive actuators\
+ on the bimorph mirror."
+    ),
+    max_step: float = typer.Option(
+        50.0,
+        help="The largest change in the voltage of any actuator in one step.",
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the ramp to, optional.",
+    ),
+):
+    """Plan the steps to safely ramp the actuators to new voltages."""
+    analysis = BimorphAnalysis(file_path)
+    target_voltages = read_optimal_voltages(
+        voltages_path, len(analysis.initial_voltages)
+    )
+    ramp = plan_voltage_ramp(
+        analysis.initial_voltages,
+        target_voltages,
         voltage_range,
         max_consecutive_voltage_difference,
+        max_step,
+    )
+    if output_path is None:
+        file_type = voltages_path.split(".")[-1]
+        output_path = f"{voltages_path.replace(f'.{file_type}', '')}_ramp.csv"
+    save_voltage_ramp(ramp, output_path)
+    print(f"The ramp of {len(ramp) - 1} steps has been saved to {output_path}")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def quantize_voltages(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    voltage_range: tuple[int, int] = typer.Argument(
+        help="The minimum and maximum values a voltage can take. expects two integers\
+ separated by a space"
+    ),
+    max_consecutive_voltage_difference: int = typer.Argument(
+        help="The maximum voltage difference allowed between two consecutive actuators\
+ on the bimorph mirror."
+    ),
+    voltage_step: float = typer.Option(
+        1.0,
+        help="The resolution of the power supplies, the voltages found are multiples\
+ of it.",
+    ),
+    time_limit: float = typer.Option(
+        1.0,
+        help="The number of seconds after which the best voltages found so far are\
+ used.",
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the output optimal voltages to, optional.",
+    ),
+):
+    """Calculate the best voltages the power supplies can set exactly."""
+    if voltage_step <= 0:
+        raise typer.BadParameter(f"voltage-step must be positive, got {voltage_step}")
+    analysis = BimorphAnalysis(
+        file_path, baseline_voltage_scan=baseline_voltage_scan, slit_range=slit_range
+    )
+    try:
+        result = find_quantized_voltage_corrections(
+            analysis.data,
+            analysis.voltage_increment,
+            analysis.initial_voltages,
+            voltage_range,
+            max_consecutive_voltage_difference,
+            voltage_step,
+            baseline_voltage_scan=baseline_voltage_scan,
+            time_limit=time_limit,
+        )
+    except TimeoutError:
+        # the search was cut short, which does not show the constraints can't be met
+        print(
+            f"The search stopped after {time_limit} s before finding voltages on a grid\
+ of {voltage_step} V, try a longer --time-limit"
+        )
+        raise typer.Exit(code=1) from None
+    except ValueError as e:
+        print(e)
+        raise typer.Exit(code=1) from None
+    if result["optimal"]:
+        print(f"The best voltages on a grid of {voltage_step} V were found")
+    else:
+        print(
+            f"The search stopped after {time_limit} s, the voltages may not be the\
+ best on the grid"
+        )
+    print(
+        f"The RMS residual is {result['residual']:.4g}, against\
+ {result['continuous_residual']:.4g} for continuous voltages"
+    )
+
+    optimal_voltages = result["voltages"]
+    if output_path is None:
+        file_type = file_path.split(".")[-1]
+        date = datetime.datetime.now().date()
+        output_path = f"{file_path.replace(f'.{file_type}', '')}\
+_quantized_voltages_{date}.csv"
+    np.savetxt(output_path, optimal_voltages, fmt="%.2f")
+    print(f"The optimal voltages have been saved to {output_path}")
+    print(
+        f"The optimal voltages are: [{', '.join([str(i) for i in optimal_voltages])}]"
+    )
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def what_if(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    frozen_actuator: list[int] = typer.Option(  # noqa: B008
+        [],
+        help="An actuator, numbered from 1, to hold at its current voltage. Can be\
+ given several times.",
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+    weighted: bool = typer.Option(
+        False,
+        help="Weight each slit position by the inverse variance of its repeated\
+ measurements.",
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the residual penalty of losing each actuator to,\
+ optional.",
+    ),
+):
+    """Show how much worse the correction gets when actuators fail."""
+    analysis = BimorphAnalysis(
+        file_path,
+        baseline_voltage_scan=baseline_voltage_scan,
+        slit_range=slit_range,
+        weighted=weighted,
+    )
+    num_actuators = len(analysis.initial_voltages)
+    if any(not 1 <= actuator <= num_actuators for actuator in frozen_actuator):
+        raise typer.BadParameter(
+            f"frozen actuators must be between 1 and {num_actuators}, got\
+ {frozen_actuator}"
+        )
+    failures = evaluate_actuator_failures(
+        analysis.data,
+        analysis.voltage_increment,
+        baseline_voltage_scan=baseline_voltage_scan,
+        weights=analysis.weights,
+    )
+    table = pd.DataFrame(
+        {
+            "actuator": np.arange(1, num_actuators + 1),
+            "residual": failures["failure_residuals"],
+            "penalty": failures["penalties"],
+        }
+    )
+    print(f"RMS residual with every actuator working: {failures['residual']:.4g}")
+    print("RMS residual after the failure of each actuator:")
+    print(table.to_string(index=False, float_format="{:.4g}".format))
+    if output_path is not None:
+        table.to_csv(output_path, index=False)
+        print(f"The failure penalties have been saved to {output_path}")
+
+    if frozen_actuator:
+        fit = find_voltage_corrections_with_frozen_actuators(
+            analysis.data,
+            analysis.voltage_increment,
+            [actuator - 1 for actuator in frozen_actuator],
+            baseline_voltage_scan=baseline_voltage_scan,
+            weights=analysis.weights,
+        )
+        optimal_voltages = np.round(analysis.initial_voltages + fit["corrections"], 2)
+        print(
+            f"With actuators {', '.join(str(i) for i in sorted(set(frozen_actuator)))}\
+ frozen, the RMS residual is {fit['residual']:.4g}, {fit['penalty']:.4g} worse"
+        )
+        voltages = ", ".join([str(i) for i in optimal_voltages])
+        print(f"The optimal voltages are: [{voltages}]")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def accumulate_interaction_matrix(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    state_path: str = typer.Argument(
+        help="The path to the accumulated interaction matrices, as a .npz file. It is\
+ created if it does not exist."
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+):
+    """Add the interaction matrix of a session to a running average."""
+    analysis = BimorphAnalysis(file_path, baseline_voltage_scan=baseline_voltage_scan)
+    if os.path.exists(state_path):
+        accumulator = InteractionMatrixAccumulator.load(state_path)
+    else:
+        accumulator = InteractionMatrixAccumulator(
+            analysis.slit_positions, len(analysis.initial_voltages)
+        )
+    accumulator.add_scans(
+        analysis.scans_in_slit_range,
+        analysis.voltage_increment,
         baseline_voltage_scan=baseline_voltage_scan,
     )
-    unrestrained_centroid_corrections = np.matmul(
-        interation_matrix, unrestrained_voltage_corrections
+    accumulator.save(state_path)
+    print(
+        f"The interaction matrix has been averaged over {accumulator.count} sessions\
+ and saved to {state_path}"
+    )
+    if accumulator.count > 1:
+        print(
+            f"The largest standard error of the mean interaction matrix is\
+ {np.max(accumulator.standard_error):.3g}"
+        )
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def merge_interaction_matrices(
+    output_path: str = typer.Argument(
+        help="The path to save the merged interaction matrices to."
+    ),
+    state_paths: list[str] = typer.Argument(  # noqa: B008
+        help="The paths to the accumulated interaction matrices to merge."
+    ),
+):
+    """Merge interaction matrices accumulated separately."""
+    accumulator = InteractionMatrixAccumulator.load(state_paths[0])
+    for state_path in state_paths[1:]:
+        accumulator.merge(InteractionMatrixAccumulator.load(state_path))
+    accumulator.save(output_path)
+    print(
+        f"{accumulator.count} sessions from {len(state_paths)} files have been merged\
+ into {output_path}"
+    )
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def start_recalibration(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    state_path: str = typer.Argument(
+        help="The path to save the recalibration state to, as a .npz file."
+    ),
+    baseline_voltage_scan: int = typer.Option(
+        help="The index of the pencil beam scan which had no increment applied.",
+        default=0,
+    ),
+    drift_threshold: float = typer.Option(
+        0.2,
+        help="The relative error in the predicted change of the centroids above\
+ which a full set of pencil beam scans is needed.",
+    ),
+    interaction_matrix_path: str | None = typer.Option(
+        None,
+        help="The path to interaction matrices accumulated by\
+ accumulate-interaction-matrix, whose mean is used in place of the interaction\
+ matrix of this file, optional.",
+    ),
+):
+    """Store the interaction matrix from a full set of pencil beam scans."""
+    analysis = BimorphAnalysis(file_path, baseline_voltage_scan=baseline_voltage_scan)
+    if interaction_matrix_path is not None:
+        accumulator = InteractionMatrixAccumulator.load(interaction_matrix_path)
+        if not np.array_equal(accumulator.slit_positions, analysis.slit_positions):
+            raise ValueError(
+                f"The slit positions in {file_path} do not match those in\
+ {interaction_matrix_path}"
+            )
+        interaction_matrix = accumulator.interaction_matrix
+    else:
+        interaction_matrix, _ = process_pencil_beam_scans(
+            analysis.data, analysis.voltage_increment, baseline_voltage_scan
+        )
+    recalibration = IncrementalRecalibration(
+        analysis.slit_positions,
+        interaction_matrix,
+        analysis.baseline_centroids,
+        analysis.initial_voltages,
+        drift_threshold=drift_threshold,
     )
-    restrained_centroid_corrections = np.matmul(
-        interation_matrix, restrained_voltage_corrections
+    recalibration.save(state_path)
+    print(f"The recalibration state has been saved to {state_path}")
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def recalibrate(
+    state_path: str = typer.Argument(
+        help="The path to the recalibration state saved by start-recalibration."
+    ),
+    baseline_scan_path: str = typer.Argument(
+        help="The path to the csv file of a single pencil beam scan, measured after\
+ the last correction was applied."
+    ),
+    output_path: str | None = typer.Option(
+        None,
+        help="The path to save the output optimal voltages to, optional.",
+    ),
+):
+    """Update the stored interaction matrix from a new baseline scan."""
+    recalibration = IncrementalRecalibration.load(state_path)
+    slit_positions, centroids, voltages = read_baseline_scan(baseline_scan_path)
+    if not np.allclose(slit_positions, recalibration.slit_positions):
+        raise ValueError(
+            f"The slit positions in {baseline_scan_path} do not match those in\
+ {state_path}"
+        )
+
+    drift = recalibration.update(voltages, centroids)
+    recalibration.save(state_path)
+    print(f"The relative drift of the interaction matrix is {drift:.3g}")
+    if recalibration.needs_full_rescan:
+        print(
+            f"The drift is above the threshold of {recalibration.drift_threshold},\
+ a full set of pencil beam scans should be taken"
+        )
+
+    optimal_voltages = np.round(voltages + recalibration.voltage_corrections(), 2)
+    if output_path is None:
+        file_type = baseline_scan_path.split(".")[-1]
+        date = datetime.datetime.now().date()
+        output_path = f"{baseline_scan_path.replace(f'.{file_type}', '')}\
+_optimal_voltages_{date}.csv"
+    np.savetxt(output_path, optimal_voltages, fmt="%.2f")
+    print(f"The optimal voltages have been saved to {output_path}")
+    print(
+        f"The optimal voltages are: [{', '.join([str(i) for i in optimal_voltages])}]"
     )
 
-    baseline_centroids = pivoted[f"pencil_beam_scan_{baseline_voltage_scan}"].to_numpy()  # type: ignore
 
-    plot = MirrorSurfacePlot(
-        slit_positions,
-        baseline_centroids,  # type: ignore
-        baseline_centroids + unrestrained_centroid_corrections,
-        baseline_centroids + restrained_centroid_corrections,
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def check_drift(
+    file_path: str = typer.Argument(help="The path to the csv file to be read."),
+    history: str = typer.Argument(help="The path to the calibration history."),
+    mirror_id: str = typer.Argument(help="The name of the mirror."),
+    drift_threshold: float = typer.Option(
+        0.2,
+        help="The relative change in the interaction matrix above which the mirror\
+ is reported to have drifted.",
+    ),
+    slit_range: tuple[float, float] | None = typer.Option(
+        None,
+        help="The minimum and maximum\
+ values for slit positions that should be considered when performing the analysis",
+    ),
+):
+    """Compare new pencil beam scans with the latest stored calibration."""
+    if not os.path.exists(history):
+        raise typer.BadParameter(f"There is no calibration history at {history}")
+    with CalibrationHistory(history) as store:
+        record = store.latest(mirror_id)
+    if record is None:
+        raise typer.BadParameter(f"{history} has no calibrations of {mirror_id}")
+
+    analysis = BimorphAnalysis(file_path, slit_range=slit_range)
+    drift = interaction_matrix_drift(
+        record, analysis.slit_positions, analysis.interaction_matrix
+    )
+    print(
+        f"The interaction matrix has changed by {drift:.3g} relative to the\
+ calibration from {record['created_at']}"
     )
-    plot.save_plot(output_dir + "mirror_surface_plot.png")
-    print(f"The mirror surface plot has been saved to {output_dir}")
+    if drift > drift_threshold:
+        print(
+            f"The drift is above the threshold of {drift_threshold}, the mirror\
+ should be recalibrated"
+        )
+
+
+@app.command(name=None, context_settings={"ignore_unknown_options": True})
+def list_calibrations(
+    history: str = typer.Argument(help="The path to the calibration history."),
+    mirror_id: str | None = typer.Option(
+        None, help="Only list calibrations of this mirror."
+    ),
+):
+    """List the calibrations stored in a calibration history."""
+    if not os.path.exists(history):
+        raise typer.BadParameter(f"There is no calibration history at {history}")
+    with CalibrationHistory(history) as store:
+        runs = store.runs(mirror_id)
+    for run in runs:
+        print(
+            f"{run['id']}  {run['mirror_id']}  {run['created_at']}\
+  residual={run['residual']:.4g}  {run['source_file']}"
+        )
 
 
 @app.callback()
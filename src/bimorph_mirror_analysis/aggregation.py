@@ -0,0 +1,167 @@
+import numpy as np
+from scipy.linalg import lstsq
+
+from bimorph_mirror_analysis.maths import process_pencil_beam_scans
+from bimorph_mirror_analysis.scan_matrix import ScanData, ScanMatrix, centroid_matrix
+
+
+class InteractionMatrixAccumulator:
+    """A running mean and variance of the interaction matrices of repeated sessions.
+
+    Each calibration session on a mirror gives a noisy interaction matrix. Only the
+    number of sessions, the mean matrix and the sum of squared deviations from it
+    are kept, updated with Welford's algorithm as each session is added, so the raw
+    scans do not need to be kept. Accumulators of separate sessions combine exactly
+    with merge, for example when each worker accumulates a share of the sessions.
+
+    Args:
+        slit_positions: The slit positions of the pencil beam scans
+        num_actuators: The number of actuators on the mirror
+    """
+
+    def __init__(self, slit_positions: np.typing.ArrayLike, num_actuators: int):
+        self.slit_positions: np.typing.NDArray[np.float64] = np.asarray(
+            slit_positions, dtype=np.float64
+        )
+        shape = (len(self.slit_positions), num_actuators + 1)
+        self.count = 0
+        self.mean: np.typing.NDArray[np.float64] = np.zeros(shape)
+        self.squared_deviations: np.typing.NDArray[np.float64] = np.zeros(shape)
+
+    @property
+    def interaction_matrix(self) -> np.typing.NDArray[np.float64]:
+        """The mean interaction matrix, with its leading column of ones."""
+        if self.count == 0:
+            raise ValueError("No interaction matrices have been added")
+        return self.mean
+
+    @property
+    def variance(self) -> np.typing.NDArray[np.float64]:
+        """The sample variance of each element of the interaction matrices, NaN\
+ until two have been added."""
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan)
+        return self.squared_deviations / (self.count - 1)
+
+    @property
+    def standard_error(self) -> np.typing.NDArray[np.float64]:
+        """The standard error of each element of the mean interaction matrix."""
+        return np.sqrt(self.variance / self.count)
+
+    def add(self, interaction_matrix: np.typing.NDArray[np.float64]):
+        """Add the interaction matrix of one session.
+
+        Args:
+            interaction_matrix: The interaction matrix with its leading column of\
+ ones, as returned by process_pencil_beam_scans
+        """
+        if interaction_matrix.shape != self.mean.shape:
+            raise ValueError(
+                f"interaction_matrix has shape {interaction_matrix.shape}, expected\
+ {self.mean.shape}"
+            )
+        self.count += 1
+        delta = interaction_matrix - self.mean
+        self.mean += delta / self.count
+        self.squared_deviations += delta * (interaction_matrix - self.mean)
+
+    def add_scans(
+        self,
+        data: ScanData,
+        voltage_increment: float,
+        baseline_voltage_scan: int = 0,
+    ):
+        """Add the interaction matrix of one session from its pencil beam scans.
+
+        Args:
+            data: A matrix of beamline centroid data, with rows of different slit\
+ positions and columns of pencil beam scans at different actuator voltages, or a\
+ ScanMatrix, whose slit positions must match
+            voltage_increment: The voltage increment applied to the actuators between\
+ pencil beam scans
+            baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+                centroid calculation
+        """
+        if isinstance(data, ScanMatrix) and not np.array_equal(
+            data.slit_positions, self.slit_positions
+        ):
+            raise ValueError("The slit positions of the scans do not match")
+        interaction_matrix, _ = process_pencil_beam_scans(
+            centroid_matrix(data), voltage_increment, baseline_voltage_scan
+        )
+        self.add(interaction_matrix)
+
+    def merge(self, other: "InteractionMatrixAccumulator"):
+        """Combine the sessions of another accumulator into this one.
+
+        Args:
+            other: An accumulator for the same slit positions and actuators
+        """
+        if other.mean.shape != self.mean.shape or not np.array_equal(
+            other.slit_positions, self.slit_positions
+        ):
+            raise ValueError(
+                "The accumulators are for different slit positions or actuators"
+            )
+        count = self.count + other.count
+        if count == 0:
+            return
+        # Chan et al.'s pairwise update of the mean and squared deviations
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.squared_deviations = (
+            self.squared_deviations
+            + other.squared_deviations
+            + delta**2 * (self.count * other.count / count)
+        )
+        self.count = count
+
+    def voltage_corrections(
+        self, baseline_centroids: np.typing.NDArray[np.float64]
+    ) -> np.typing.NDArray[np.float64]:
+        """Calculate the unrestrained voltage corrections with the mean interaction\
+ matrix.
+
+        Args:
+            baseline_centroids: The centroids measured at the current voltages
+
+        Returns:
+            An array of voltage corrections required to move the centroids to the
+            target position.
+        """
+        desired_corrections = np.mean(baseline_centroids) - baseline_centroids
+        corrections = lstsq(self.interaction_matrix, desired_corrections)[0]  # type: ignore
+        return np.round(corrections[1:], decimals=2)  # type: ignore
+
+    def save(self, file_path: str):
+        """Save the accumulator to a numpy .npz file.
+
+        Args:
+            file_path: The path to save the accumulator to, used as it is
+        """
+        # written through a file handle, as np.savez would add .npz to the path
+        with open(file_path, "wb") as f:
+            np.savez(
+                f,
+                slit_positions=self.slit_positions,
+                count=self.count,
+                mean=self.mean,
+                squared_deviations=self.squared_deviations,
+            )
+
+    @classmethod
+    def load(cls, file_path: str) -> "InteractionMatrixAccumulator":
+        """Load an accumulator saved by save.
+
+        Args:
+            file_path: The path to the .npz file
+
+        Returns:
+            The accumulator.
+        """
+        with np.load(file_path) as state:
+            accumulator = cls(state["slit_positions"], state["mean"].shape[1] - 1)
+            accumulator.count = int(state["count"])
+            accumulator.mean = state["mean"]
+            accumulator.squared_deviations = state["squared_deviations"]
+        return accumulator
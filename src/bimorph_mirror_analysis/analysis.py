@@ -0,0 +1,422 @@
+from collections.abc import Callable
+from functools import cached_property
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+from bimorph_mirror_analysis.basis import SmoothInfluenceModel
+from bimorph_mirror_analysis.maths import (
+    SolverResult,
+    check_voltages_fit_constraints,
+    find_voltage_corrections,
+    find_voltage_corrections_with_restraints,
+    slit_position_weights,
+    solve_voltage_corrections,
+)
+from bimorph_mirror_analysis.profiling import profile_stage
+from bimorph_mirror_analysis.read_file import (
+    read_scan_matrix,
+    read_scan_matrix_with_statistics,
+)
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+
+# cached stages which depend on each parameter, and so must be recomputed when it
+# changes. The loaded scan itself never depends on a parameter.
+_SLIT_RANGE_STAGES = (
+    "scans_in_slit_range",
+    "slit_positions",
+    "data",
+    "influence_model",
+    "interaction_matrix",
+    "_solver_data",
+    "_slit_position_weights",
+    "unrestrained_voltage_corrections",
+    "restrained_voltage_corrections",
+    "solver_result",
+)
+_BASELINE_STAGES = (
+    "_solver_data",
+    "unrestrained_voltage_corrections",
+    "restrained_voltage_corrections",
+    "solver_result",
+)
+_BASIS_STAGES = (
+    "influence_model",
+    "interaction_matrix",
+    "_solver_data",
+    "unrestrained_voltage_corrections",
+    "restrained_voltage_corrections",
+    "solver_result",
+)
+_CONSTRAINT_STAGES = ("restrained_voltage_corrections", "solver_result")
+_SOLVER_STAGES = ("solver_result",)
+
+
+class BimorphAnalysis:
+    """An analysis session for a single bluesky pencil beam scan file.
+
+    Each stage of the analysis (reading the file, selecting the slit range,
+    building the interaction matrix and solving for the voltage corrections) is
+    computed the first time it is needed and then cached. Changing a parameter
+    only discards the stages which depend on it, so, for example, changing the
+    constraints re-runs the restrained optimisation without reading the file again.
+
+    Args:
+        file_path: The path to the csv file to be read
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference allowed\
+ between two consecutive actuators
+        baseline_voltage_scan: The index of the pencil beam scan which had no\
+ increment applied
+        slit_range: The minimum and maximum values for slit positions that should be\
+ considered when performing the analysis
+        initial_guess: The voltage corrections to start the restrained optimisation\
+ from, for example from a previous calibration
+        weighted: Whether to weight each slit position by the inverse variance of\
+ its repeated measurements
+        num_basis_functions: If supplied, the influence functions are fitted to this\
+ many smooth basis functions, and the smooth model is used in place of the raw\
+ differences of the scans
+        basis: The smooth basis, "legendre" or "bspline"
+        saved_influence_model: A smooth model of the influence functions from an\
+ earlier calibration, as saved by SmoothInfluenceModel.save, to rebuild the\
+ interaction matrix from at the slit positions of this scan. It is used in place of\
+ num_basis_functions and basis
+        callback: Called with the current voltage corrections after each iteration\
+ of the restrained optimisation, see find_voltage_corrections_with_restraints
+        solver: If supplied, the optimal voltages are found by\
+ solve_voltage_corrections with this solver, "auto" or a name in SOLVERS, rather than\
+ by the pseudo-inverse followed by SLSQP if its solution does not fit the constraints
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        voltage_range: tuple[int, int] | None = None,
+        max_consecutive_voltage_difference: int | None = None,
+        baseline_voltage_scan: int = 0,
+        slit_range: tuple[float, float] | None = None,
+        initial_guess: np.typing.NDArray[np.float64] | None = None,
+        weighted: bool = False,
+        num_basis_functions: int | None = None,
+        basis: Literal["legendre", "bspline"] = "legendre",
+        saved_influence_model: SmoothInfluenceModel | None = None,
+        callback: Callable[[np.typing.NDArray[np.float64]], None] | None = None,
+        solver: str | None = None,
+    ):
+        self.file_path = file_path
+        self._voltage_range = voltage_range
+        self._max_consecutive_voltage_difference = max_consecutive_voltage_difference
+        self._baseline_voltage_scan = baseline_voltage_scan
+        self._slit_range = slit_range
+        self._initial_guess = initial_guess
+        self._weighted = weighted
+        self._num_basis_functions = num_basis_functions
+        self._basis: Literal["legendre", "bspline"] = basis
+        self._saved_influence_model = saved_influence_model
+        self.callback = callback
+        self._solver = solver
+
+    def _invalidate(self, stages: tuple[str, ...]):
+        for stage in stages:
+            self.__dict__.pop(stage, None)
+
+    @property
+    def voltage_range(self) -> tuple[int, int] | None:
+        return self._voltage_range
+
+    @voltage_range.setter
+    def voltage_range(self, value: tuple[int, int] | None):
+        self._voltage_range = value
+        self._invalidate(_CONSTRAINT_STAGES)
+
+    @property
+    def max_consecutive_voltage_difference(self) -> int | None:
+        return self._max_consecutive_voltage_difference
+
+    @max_consecutive_voltage_difference.setter
+    def max_consecutive_voltage_difference(self, value: int | None):
+        self._max_consecutive_voltage_difference = value
+        self._invalidate(_CONSTRAINT_STAGES)
+
+    @property
+    def baseline_voltage_scan(self) -> int:
+        return self._baseline_voltage_scan
+
+    @baseline_voltage_scan.setter
+    def baseline_voltage_scan(self, value: int):
+        self._baseline_voltage_scan = value
+        self._invalidate(_BASELINE_STAGES)
+
+    @property
+    def slit_range(self) -> tuple[float, float] | None:
+        return self._slit_range
+
+    @slit_range.setter
+    def slit_range(self, value: tuple[float, float] | None):
+        self._slit_range = value
+        self._invalidate(_SLIT_RANGE_STAGES)
+
+    @property
+    def initial_guess(self) -> np.typing.NDArray[np.float64] | None:
+        return self._initial_guess
+
+    @initial_guess.setter
+    def initial_guess(self, value: np.typing.NDArray[np.float64] | None):
+        self._initial_guess = value
+        self._invalidate(_CONSTRAINT_STAGES)
+
+    @property
+    def weighted(self) -> bool:
+        return self._weighted
+
+    @weighted.setter
+    def weighted(self, value: bool):
+        self._weighted = value
+        self._invalidate(_BASELINE_STAGES)
+
+    @property
+    def num_basis_functions(self) -> int | None:
+        return self._num_basis_functions
+
+    @num_basis_functions.setter
+    def num_basis_functions(self, value: int | None):
+        self._num_basis_functions = value
+        self._invalidate(_BASIS_STAGES)
+
+    @property
+    def basis(self) -> Literal["legendre", "bspline"]:
+        return self._basis
+
+    @basis.setter
+    def basis(self, value: Literal["legendre", "bspline"]):
+        self._basis = value
+        self._invalidate(_BASIS_STAGES)
+
+    @property
+    def saved_influence_model(self) -> SmoothInfluenceModel | None:
+        return self._saved_influence_model
+
+    @saved_influence_model.setter
+    def saved_influence_model(self, value: SmoothInfluenceModel | None):
+        self._saved_influence_model = value
+        self._invalidate(_BASIS_STAGES)
+
+    @property
+    def solver(self) -> str | None:
+        return self._solver
+
+    @solver.setter
+    def solver(self, value: str | None):
+        self._solver = value
+        self._invalidate(_SOLVER_STAGES)
+
+    @cached_property
+    def _scan(self) -> tuple[ScanMatrix, np.typing.NDArray[np.float64], float]:
+        if self.weighted:
+            # the statistics come from the same pass, so read the file only once
+            return self._scan_with_statistics[:3]
+        with profile_stage("read_bluesky_plan_output"):
+            return read_scan_matrix(self.file_path)
+
+    @cached_property
+    def _scan_with_statistics(
+        self,
+    ) -> tuple[
+        ScanMatrix,
+        np.typing.NDArray[np.float64],
+        float,
+        np.typing.NDArray[np.int64],
+        np.typing.NDArray[np.float64],
+    ]:
+        with profile_stage("read_bluesky_plan_output"):
+            return read_scan_matrix_with_statistics(self.file_path)
+
+    @property
+    def scans(self) -> ScanMatrix:
+        """The pencil beam scans, over all slit positions."""
+        return self._scan[0]
+
+    @property
+    def pivoted(self) -> pd.DataFrame:
+        """The pivoted pencil beam scans, over all slit positions, as a DataFrame\
+ built on each access."""
+        return self.scans.to_dataframe()
+
+    @property
+    def initial_voltages(self) -> np.typing.NDArray[np.float64]:
+        """The voltages of the actuators in the baseline scan."""
+        return np.asarray(self._scan[1], dtype=np.float64)
+
+    @property
+    def voltage_increment(self) -> float:
+        """The voltage increment applied to the actuators between scans."""
+        return self._scan[2]
+
+    @cached_property
+    def scans_in_slit_range(self) -> ScanMatrix:
+        """The pencil beam scans within the slit range, as a view of scans."""
+        return self.scans.select_slit_range(self.slit_range)
+
+    @cached_property
+    def slit_positions(self) -> np.typing.NDArray[np.float64]:
+        """The slit positions within the slit range."""
+        return self.scans_in_slit_range.slit_positions
+
+    @cached_property
+    def data(self) -> np.typing.NDArray[np.float64]:
+        """The centroid matrix within the slit range, one column per scan."""
+        return self.scans_in_slit_range.centroids
+
+    @cached_property
+    def influence_model(self) -> SmoothInfluenceModel | None:
+        """The smooth basis model of the influence functions, or None if the raw\
+ differences of the scans are used."""
+        if self.saved_influence_model is not None:
+            num_actuators = self.data.shape[1] - 1
+            if self.saved_influence_model.num_actuators != num_actuators:
+                raise ValueError(
+                    f"The saved influence model has\
+ {self.saved_influence_model.num_actuators} actuators, but the scan has\
+ {num_actuators}"
+                )
+            return self.saved_influence_model
+        if self.num_basis_functions is None:
+            return None
+        return SmoothInfluenceModel.fit(
+            self.slit_positions,
+            np.diff(self.data, axis=1) / self.voltage_increment,
+            self.num_basis_functions,
+            self.basis,
+        )
+
+    @cached_property
+    def interaction_matrix(self) -> np.typing.NDArray[np.float64]:
+        """The response of the centroids per unit voltage on each actuator."""
+        if self.influence_model is not None:
+            return self.influence_model.interaction_matrix(self.slit_positions)
+        return np.diff(self.data, axis=1) / self.voltage_increment
+
+    @cached_property
+    def _solver_data(self) -> np.typing.NDArray[np.float64]:
+        # the solvers take pencil beam scans, so rebuild them from the smooth model
+        if self.influence_model is None:
+            return self.data
+        return self.influence_model.centroid_data(
+            self.slit_positions,
+            self.baseline_centroids,
+            self.voltage_increment,
+            self.baseline_voltage_scan,
+        )
+
+    @cached_property
+    def _slit_position_weights(self) -> np.typing.NDArray[np.float64]:
+        scans, _, _, counts, variances = self._scan_with_statistics
+        rows = scans.slit_range_rows(self.slit_range)
+        return slit_position_weights(counts[rows].astype(np.float64), variances[rows])
+
+    @property
+    def weights(self) -> np.typing.NDArray[np.float64] | None:
+        """The weight of each slit position within the slit range, or None if the\
+ analysis is unweighted."""
+        if not self.weighted:
+            return None
+        return self._slit_position_weights
+
+    @property
+    def baseline_centroids(self) -> np.typing.NDArray[np.float64]:
+        """The centroids of the baseline scan within the slit range."""
+        return self.data[:, self.baseline_voltage_scan]
+
+    @cached_property
+    def unrestrained_voltage_corrections(self) -> np.typing.NDArray[np.float64]:
+        """The voltage corrections found by multiple linear regression."""
+        return find_voltage_corrections(
+            self._solver_data,
+            self.voltage_increment,
+            baseline_voltage_scan=self.baseline_voltage_scan,
+            weights=self.weights,
+        )
+
+    @cached_property
+    def restrained_voltage_corrections(self) -> np.typing.NDArray[np.float64]:
+        """The voltage corrections found by SLSQP, respecting the constraints."""
+        voltage_range, max_diff = self._constraints()
+        return find_voltage_corrections_with_restraints(
+            self._solver_data,
+            self.voltage_increment,
+            self.initial_voltages,
+            voltage_range,
+            max_diff,
+            baseline_voltage_scan=self.baseline_voltage_scan,
+            initial_guess=self.initial_guess,
+            weights=self.weights,
+            callback=self.callback,
+        )
+
+    @cached_property
+    def solver_result(self) -> SolverResult:
+        """The voltage corrections found by the chosen solver, with the name of the\
+ solver which ran and how long it took."""
+        voltage_range, max_diff = self._constraints()
+        return solve_voltage_corrections(
+            self._solver_data,
+            self.voltage_increment,
+            self.initial_voltages,
+            voltage_range,
+            max_diff,
+            solver="auto" if self.solver is None else self.solver,
+            baseline_voltage_scan=self.baseline_voltage_scan,
+            initial_guess=self.initial_guess,
+            weights=self.weights,
+        )
+
+    @property
+    def unrestrained_voltages_fit_constraints(self) -> bool:
+        """Whether the unrestrained solution already fits the constraints."""
+        voltage_range, max_diff = self._constraints()
+        return check_voltages_fit_constraints(
+            self.initial_voltages + self.unrestrained_voltage_corrections,
+            voltage_range,
+            max_diff,
+        )
+
+    @property
+    def optimal_voltage_corrections(self) -> np.typing.NDArray[np.float64]:
+        """The unrestrained corrections if they fit the constraints, otherwise the\
+ restrained corrections, or the corrections of the chosen solver if one is set."""
+        if self.solver is not None:
+            return self.solver_result["corrections"]
+        if self.unrestrained_voltages_fit_constraints:
+            return self.unrestrained_voltage_corrections
+        return self.restrained_voltage_corrections
+
+    @property
+    def optimal_voltages(self) -> np.typing.NDArray[np.float64]:
+        """The optimal voltages for the bimorph mirror actuators."""
+        return self.initial_voltages + self.optimal_voltage_corrections
+
+    def predicted_centroids(
+        self, voltage_corrections: np.typing.NDArray[np.float64]
+    ) -> np.typing.NDArray[np.float64]:
+        """Predict the centroids after applying the given voltage corrections.
+
+        Args:
+            voltage_corrections: The voltage corrections to apply to the actuators
+
+        Returns:
+            The predicted centroid at each slit position within the slit range.
+        """
+        return self.baseline_centroids + np.matmul(
+            self.interaction_matrix, voltage_corrections
+        )
+
+    def _constraints(self) -> tuple[tuple[int, int], int]:
+        max_diff = self.max_consecutive_voltage_difference
+        if self.voltage_range is None or max_diff is None:
+            raise ValueError(
+                "voltage_range and max_consecutive_voltage_difference must be set to\
+ apply the constraints"
+            )
+        return self.voltage_range, max_diff
@@ -0,0 +1,290 @@
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import Executor
+from typing import Literal, TypedDict, TypeVar
+
+import numpy as np
+
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.maths import find_voltage_corrections_with_restraints
+
+T = TypeVar("T")
+
+
+class ProgressEvent(TypedDict):
+    name: str
+    stage: str
+    message: str
+    iteration: int | None
+    voltages: np.typing.NDArray[np.float64] | None
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+class _Cancelled(Exception):
+    """Raised in the worker thread to stop a solve whose caller has gone away."""
+
+
+class _Progress:
+    """Passes progress events from the worker thread to the event loop, and stops
+    the worker at its next check once the caller is cancelled."""
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        name: str,
+        callback: ProgressCallback | None,
+    ):
+        self.loop = loop
+        self.name = name
+        self.callback = callback
+        self.cancelled = threading.Event()
+        self.iterations = 0
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise _Cancelled(f"The analysis of {self.name} was cancelled")
+
+    def emit(
+        self,
+        stage: str,
+        message: str,
+        iteration: int | None = None,
+        voltages: np.typing.NDArray[np.float64] | None = None,
+    ):
+        self.check()
+        if self.callback is None:
+            return
+        event: ProgressEvent = {
+            "name": self.name,
+            "stage": stage,
+            "message": message,
+            "iteration": iteration,
+            "voltages": voltages,
+        }
+        self.loop.call_soon_threadsafe(self.callback, event)
+
+    def iteration(self, voltage_corrections: np.typing.NDArray[np.float64]):
+        self.iterations += 1
+        self.emit(
+            "iteration",
+            f"SLSQP iteration {self.iterations}",
+            iteration=self.iterations,
+        )
+
+
+async def _run_in_executor(
+    work: Callable[[], T],
+    progress: _Progress,
+    timeout: float | None,
+    executor: Executor | None,
+) -> T:
+    future = progress.loop.run_in_executor(executor, work)
+    try:
+        return await asyncio.wait_for(future, timeout)
+    finally:
+        # the worker thread cannot be interrupted, so if the caller was cancelled
+        # or timed out it stops itself at its next progress event
+        progress.cancelled.set()
+
+
+async def find_voltage_corrections_with_restraints_async(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    initial_voltages: np.typing.NDArray[np.float64],
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    baseline_voltage_scan: int = 0,
+    initial_guess: np.typing.NDArray[np.float64] | None = None,
+    weights: np.typing.NDArray[np.float64] | None = None,
+    progress: ProgressCallback | None = None,
+    timeout: float | None = None,
+    executor: Executor | None = None,
+    name: str = "",
+) -> np.typing.NDArray[np.float64]:
+    """Run find_voltage_corrections_with_restraints without blocking the event loop.
+
+    The optimisation runs in an executor, and stops after its current iteration if
+    the awaiting task is cancelled or the timeout expires.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        initial_voltages: The initial voltages of the actuators in the baseline scan
+        voltage_range: The minimum and maximum values a voltage can take.
+        max_consecutive_voltage_difference: The maximum voltage difference between two
+            consecutive actuators on the bimorph mirror.
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation.
+        initial_guess: The voltage corrections to start the optimisation from
+        weights: The weight of each slit position in the least squares fit
+        progress: Called on the event loop with a ProgressEvent after each iteration
+        timeout: The number of seconds to wait before raising TimeoutError, or None\
+ to wait until the optimisation finishes
+        executor: The executor to run the optimisation in, the event loop's default\
+ thread pool if not supplied
+        name: The name of the mirror, included in each ProgressEvent
+
+    Returns:
+        An array of voltage corrections required to move the centroid of each pencil
+        beam scan to the target position.
+    """
+    tracker = _Progress(asyncio.get_running_loop(), name, progress)
+
+    def work() -> np.typing.NDArray[np.float64]:
+        return find_voltage_corrections_with_restraints(
+            data,
+            voltage_increment,
+            initial_voltages,
+            voltage_range,
+            max_consecutive_voltage_difference,
+            baseline_voltage_scan=baseline_voltage_scan,
+            initial_guess=initial_guess,
+            weights=weights,
+            callback=tracker.iteration,
+        )
+
+    return await _run_in_executor(work, tracker, timeout, executor)
+
+
+async def calculate_optimal_voltages_async(
+    file_path: str,
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    baseline_voltage_scan: int = 0,
+    slit_range: tuple[float, float] | None = None,
+    weighted: bool = False,
+    num_basis_functions: int | None = None,
+    basis: Literal["legendre", "bspline"] = "legendre",
+    progress: ProgressCallback | None = None,
+    timeout: float | None = None,
+    executor: Executor | None = None,
+    name: str | None = None,
+) -> np.typing.NDArray[np.float64]:
+    """Calculate the optimal voltages without blocking the event loop.
+
+    As calculate_optimal_voltages in the command line interface, but the file is
+    read and the voltages are solved for in an executor, and each stage is reported
+    as a ProgressEvent rather than printed. Several mirrors can be calibrated
+    concurrently from one event loop, for example with asyncio.gather.
+
+    Args:
+        file_path: The path to the csv file to be read
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference allowed\
+ between two consecutive actuators
+        baseline_voltage_scan: The index of the pencil beam scan which had no increment\
+ applied
+        slit_range: The minimum and maximum values for slit positions that should be\
+ considered when performing the analysis
+        weighted: Whether to weight each slit position by the inverse variance of\
+ its repeated measurements
+        num_basis_functions: If supplied, the influence functions are fitted to this\
+ many smooth basis functions
+        basis: The smooth basis, "legendre" or "bspline"
+        progress: Called on the event loop with a ProgressEvent at each stage and after\
+ each iteration of the restrained optimisation
+        timeout: The number of seconds to wait before raising TimeoutError, or None\
+ to wait until the analysis finishes
+        executor: The executor to run the analysis in, the event loop's default\
+ thread pool if not supplied
+        name: The name of the mirror, included in each ProgressEvent. The file path if\
+ not supplied.
+
+    Returns:
+        The optimal voltages for the bimorph mirror actuators.
+    """
+    tracker = _Progress(
+        asyncio.get_running_loop(), file_path if name is None else name, progress
+    )
+
+    def work() -> np.typing.NDArray[np.float64]:
+        analysis = BimorphAnalysis(
+            file_path,
+            voltage_range=voltage_range,
+            max_consecutive_voltage_difference=max_consecutive_voltage_difference,
+            baseline_voltage_scan=baseline_voltage_scan,
+            slit_range=slit_range,
+            weighted=weighted,
+            num_basis_functions=num_basis_functions,
+            basis=basis,
+            callback=tracker.iteration,
+        )
+        tracker.emit("read", f"Reading {file_path}")
+        initial_voltages = analysis.initial_voltages
+        tracker.emit("unrestrained", "Solving by multiple linear regression")
+        if analysis.unrestrained_voltages_fit_constraints:
+            optimal_voltages = analysis.optimal_voltages
+        else:
+            tracker.emit(
+                "restrained",
+                "The unrestrained voltages do not fit the constraints, solving with\
+ SLSQP",
+                voltages=initial_voltages + analysis.unrestrained_voltage_corrections,
+            )
+            optimal_voltages = analysis.optimal_voltages
+        tracker.emit(
+            "done", "The optimal voltages have been found", voltages=optimal_voltages
+        )
+        return optimal_voltages
+
+    return await _run_in_executor(work, tracker, timeout, executor)
+
+
+async def stream_optimal_voltages(
+    file_path: str,
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    baseline_voltage_scan: int = 0,
+    slit_range: tuple[float, float] | None = None,
+    weighted: bool = False,
+    num_basis_functions: int | None = None,
+    basis: Literal["legendre", "bspline"] = "legendre",
+    timeout: float | None = None,
+    executor: Executor | None = None,
+    name: str | None = None,
+) -> AsyncIterator[ProgressEvent]:
+    """Calculate the optimal voltages, yielding each ProgressEvent as it happens.
+
+    The arguments are as calculate_optimal_voltages_async. The last event has the
+    stage "done" and carries the optimal voltages. Closing the iterator early
+    cancels the analysis.
+    """
+    queue: asyncio.Queue[ProgressEvent] = asyncio.Queue()
+    task = asyncio.create_task(
+        calculate_optimal_voltages_async(
+            file_path,
+            voltage_range,
+            max_consecutive_voltage_difference,
+            baseline_voltage_scan=baseline_voltage_scan,
+            slit_range=slit_range,
+            weighted=weighted,
+            num_basis_functions=num_basis_functions,
+            basis=basis,
+            progress=queue.put_nowait,
+            timeout=timeout,
+            executor=executor,
+            name=name,
+        )
+    )
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                get.cancel()
+                break
+            event = get.result()
+            yield event
+            if event["stage"] == "done":
+                break
+        # raise any error from the analysis, once the queued events are yielded
+        while not queue.empty():
+            yield queue.get_nowait()
+        await task
+    finally:
+        task.cancel()
@@ -0,0 +1,210 @@
+from typing import Literal
+
+import numpy as np
+from numpy.polynomial import legendre
+from scipy.interpolate import BSpline
+
+from bimorph_mirror_analysis.profiling import profile_stage
+
+_SPLINE_DEGREE = 3
+
+
+def basis_matrix(
+    slit_positions: np.typing.NDArray[np.float64],
+    domain: tuple[float, float],
+    num_basis_functions: int,
+    basis: Literal["legendre", "bspline"] = "legendre",
+) -> np.typing.NDArray[np.float64]:
+    """Evaluate a smooth basis at the given slit positions.
+
+    Args:
+        slit_positions: The slit positions to evaluate the basis at
+        domain: The first and last slit position the basis covers
+        num_basis_functions: The number of basis functions
+        basis: "legendre" for Legendre polynomials, or "bspline" for cubic B-splines\
+ with evenly spaced knots
+
+    Returns:
+        A matrix with rows of slit positions and columns of basis functions.
+    """
+    slit_positions = np.asarray(slit_positions, dtype=np.float64)
+    start, stop = domain
+    if np.any(slit_positions < start) or np.any(slit_positions > stop):
+        raise ValueError(
+            f"The slit positions must be within the domain of the basis, {domain}"
+        )
+    # map the domain onto [-1, 1]
+    x = (2 * slit_positions - start - stop) / ((stop - start) or 1.0)
+
+    if basis == "legendre":
+        return legendre.legvander(x, num_basis_functions - 1)  # type: ignore
+    if basis == "bspline":
+        if num_basis_functions <= _SPLINE_DEGREE:
+            raise ValueError(
+                f"At least {_SPLINE_DEGREE + 1} basis functions are needed for cubic\
+ B-splines, got {num_basis_functions}"
+            )
+        interior = np.linspace(-1, 1, num_basis_functions - _SPLINE_DEGREE + 1)
+        knots = np.concatenate(
+            (
+                np.full(_SPLINE_DEGREE, -1.0),
+                interior,
+                np.full(_SPLINE_DEGREE, 1.0),
+            )
+        )
+        return BSpline.design_matrix(x, knots, _SPLINE_DEGREE).toarray()  # type: ignore
+    raise ValueError(f"basis must be 'legendre' or 'bspline', got {basis!r}")
+
+
+class SmoothInfluenceModel:
+    """Influence functions stored as coefficients of a small smooth basis.
+
+    Each column of the interaction matrix, the influence function of one actuator,
+    is approximated by a weighted sum of a few Legendre polynomials or B-splines.
+    Only the coefficients are stored, so the memory does not grow with the number
+    of slit positions, and the interaction matrix can be rebuilt at any slit
+    positions within the fitted range. Fitting to a small basis also smooths out
+    the noise in the differences of the pencil beam scans.
+
+    Args:
+        coefficients: The coefficients of the basis functions, with rows of basis\
+ functions and columns of actuators
+        domain: The first and last slit position the model covers
+        basis: "legendre" or "bspline", see basis_matrix
+    """
+
+    def __init__(
+        self,
+        coefficients: np.typing.NDArray[np.float64],
+        domain: tuple[float, float],
+        basis: Literal["legendre", "bspline"] = "legendre",
+    ):
+        self.coefficients: np.typing.NDArray[np.float64] = np.asarray(
+            coefficients, dtype=np.float64
+        )
+        self.domain = (float(domain[0]), float(domain[1]))
+        self.basis: Literal["legendre", "bspline"] = basis
+
+    @classmethod
+    def fit(
+        cls,
+        slit_positions: np.typing.NDArray[np.float64],
+        interaction_matrix: np.typing.NDArray[np.float64],
+        num_basis_functions: int = 12,
+        basis: Literal["legendre", "bspline"] = "legendre",
+    ) -> "SmoothInfluenceModel":
+        """Fit the influence functions of every actuator to the basis at once.
+
+        Args:
+            slit_positions: The slit positions of the pencil beam scans
+            interaction_matrix: The interaction matrix, with rows of slit positions\
+ and columns of actuators, without the column of ones
+            num_basis_functions: The number of basis functions
+            basis: "legendre" or "bspline", see basis_matrix
+
+        Returns:
+            The fitted model.
+        """
+        if num_basis_functions < 1 or num_basis_functions > len(slit_positions):
+            raise ValueError(
+                f"num_basis_functions must be between 1 and the number of slit\
+ positions, {len(slit_positions)}, got {num_basis_functions}"
+            )
+        domain = (float(np.min(slit_positions)), float(np.max(slit_positions)))
+        with profile_stage("fit_smooth_influence_model") as details:
+            details["basis"] = basis
+            details["num_basis_functions"] = num_basis_functions
+            design = basis_matrix(slit_positions, domain, num_basis_functions, basis)
+            # every actuator is a separate right hand side of the same fit
+            coefficients = np.linalg.lstsq(design, interaction_matrix)[0]
+        return cls(coefficients, domain, basis)  # type: ignore
+
+    @property
+    def num_actuators(self) -> int:
+        return self.coefficients.shape[1]
+
+    @property
+    def num_basis_functions(self) -> int:
+        return self.coefficients.shape[0]
+
+    def interaction_matrix(
+        self, slit_positions: np.typing.NDArray[np.float64]
+    ) -> np.typing.NDArray[np.float64]:
+        """Rebuild the interaction matrix at the given slit positions.
+
+        Args:
+            slit_positions: The slit positions, within the domain of the model
+
+        Returns:
+            The interaction matrix, with rows of slit positions and columns of
+            actuators, without the column of ones.
+        """
+        design = basis_matrix(
+            slit_positions, self.domain, self.num_basis_functions, self.basis
+        )
+        return design @ self.coefficients
+
+    def centroid_data(
+        self,
+        slit_positions: np.typing.NDArray[np.float64],
+        baseline_centroids: np.typing.NDArray[np.float64],
+        voltage_increment: float,
+        baseline_voltage_scan: int = 0,
+    ) -> np.typing.NDArray[np.float64]:
+        """Build pencil beam scans from the baseline scan and the smooth model.
+
+        The result has the same layout as the measured data, so it can be passed to
+        find_voltage_corrections and find_voltage_corrections_with_restraints in its
+        place. The baseline scan is kept as measured, and every other scan differs
+        from it by the smooth influence functions.
+
+        Args:
+            slit_positions: The slit positions of the baseline scan
+            baseline_centroids: The centroids of the baseline scan
+            voltage_increment: The voltage increment applied to the actuators between\
+ pencil beam scans
+            baseline_voltage_scan: The index of the baseline scan
+
+        Returns:
+            A matrix of centroids, with rows of slit positions and columns of pencil
+            beam scans.
+        """
+        responses = voltage_increment * self.interaction_matrix(slit_positions)
+        offsets = np.hstack(
+            (np.zeros((len(slit_positions), 1)), np.cumsum(responses, axis=1))
+        )
+        return baseline_centroids[:, np.newaxis] + (
+            offsets - offsets[:, [baseline_voltage_scan]]
+        )
+
+    def save(self, file_path: str):
+        """Save the model to a numpy .npz file.
+
+        Args:
+            file_path: The path to save the model to, used as it is
+        """
+        # written through a file handle, as np.savez would add .npz to the path
+        with open(file_path, "wb") as f:
+            np.savez(
+                f,
+                coefficients=self.coefficients,
+                domain=np.array(self.domain),
+                basis=np.array(self.basis),
+            )
+
+    @classmethod
+    def load(cls, file_path: str) -> "SmoothInfluenceModel":
+        """Load a model saved by save.
+
+        Args:
+            file_path: The path to the .npz file
+
+        Returns:
+            The model.
+        """
+        with np.load(file_path) as state:
+            return cls(
+                state["coefficients"],
+                (float(state["domain"][0]), float(state["domain"][1])),
+                str(state["basis"]),  # type: ignore
+            )
@@ -0,0 +1,178 @@
+import datetime
+import json
+from typing import Any, Literal
+
+import numpy as np
+
+from bimorph_mirror_analysis import __version__
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.profiling import profile_stage
+
+ColumnarFormat = Literal["parquet", "arrow"]
+
+# the file extension of each format
+EXTENSIONS: dict[str, str] = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# the key of the run metadata in the schema metadata of each table
+METADATA_KEY = b"bimorph_mirror_analysis"
+
+
+def _import_pyarrow() -> Any:
+    try:
+        import pyarrow  # type: ignore
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is needed for columnar output, install it with\
+ pip install bimorph-mirror-analysis[arrow]"
+        ) from e
+    return pyarrow
+
+
+def write_columnar(
+    columns: dict[str, np.typing.NDArray[Any]],
+    file_path: str,
+    file_format: ColumnarFormat = "parquet",
+    metadata: dict[str, Any] | None = None,
+):
+    """Write columns of equal length to a Parquet or Arrow IPC file.
+
+    Args:
+        columns: The columns of the table, by name
+        file_path: The path to write the table to
+        file_format: "parquet", or "arrow" for an uncompressed Arrow IPC file which\
+ can be memory-mapped
+        metadata: Run metadata to embed in the schema of the table, as json
+    """
+    if file_format not in EXTENSIONS:
+        raise ValueError(f"file_format must be parquet or arrow, got {file_format!r}")
+    pa = _import_pyarrow()
+    table = pa.table(
+        {name: pa.array(values) for name, values in columns.items()},
+        metadata={METADATA_KEY: json.dumps(metadata or {})},
+    )
+    if file_format == "parquet":
+        import pyarrow.parquet as pq  # type: ignore
+
+        pq.write_table(table, file_path)  # type: ignore
+    else:
+        with pa.ipc.new_file(file_path, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_columnar(file_path: str) -> tuple[Any, dict[str, Any]]:
+    """Read a table written by write_columnar, memory-mapping the file.
+
+    Args:
+        file_path: The path to a .parquet or .arrow file
+
+    Returns:
+        A tuple of the pyarrow Table and its run metadata. The columns of an Arrow
+        IPC file are read straight from the memory map, without copying.
+    """
+    pa = _import_pyarrow()
+    if file_path.endswith(EXTENSIONS["parquet"]):
+        import pyarrow.parquet as pq  # type: ignore
+
+        table = pq.read_table(file_path, memory_map=True)  # type: ignore
+    elif file_path.endswith(EXTENSIONS["arrow"]):
+        table = pa.ipc.open_file(pa.memory_map(file_path)).read_all()
+    else:
+        raise ValueError(f"{file_path} is not a .parquet or .arrow file")
+    schema_metadata = table.schema.metadata or {}  # type: ignore
+    return table, json.loads(schema_metadata.get(METADATA_KEY, b"{}"))  # type: ignore
+
+
+def analysis_metadata(analysis: BimorphAnalysis) -> dict[str, Any]:
+    """Describe the run which produced an analysis, for embedding in its output.
+
+    Args:
+        analysis: The analysis session
+
+    Returns:
+        A json-serialisable dictionary of the input file, the analysis parameters,
+        the package version and the time of the run.
+    """
+    return {
+        "source_file": analysis.file_path,
+        "created": datetime.datetime.now().isoformat(),
+        "version": __version__,
+        "voltage_increment": float(analysis.voltage_increment),
+        "voltage_range": analysis.voltage_range,
+        "max_consecutive_voltage_difference": (
+            analysis.max_consecutive_voltage_difference
+        ),
+        "baseline_voltage_scan": analysis.baseline_voltage_scan,
+        "slit_range": analysis.slit_range,
+        "weighted": analysis.weighted,
+        "num_basis_functions": analysis.num_basis_functions,
+        "basis": analysis.basis,
+        "solver": analysis.solver,
+    }
+
+
+def export_analysis(
+    analysis: BimorphAnalysis,
+    optimal_voltages: np.typing.NDArray[np.float64],
+    path_stem: str,
+    file_format: ColumnarFormat = "parquet",
+    metadata: dict[str, Any] | None = None,
+) -> dict[str, str]:
+    """Write the results of an analysis as columnar tables.
+
+    Four tables are written, each with the run metadata embedded: the pivoted
+    pencil beam scans, the interaction matrix and the baseline and predicted
+    centroids, each with a row per slit position, and the voltages, with a row per
+    actuator. The values are written in full float64 precision.
+
+    Args:
+        analysis: The analysis session
+        optimal_voltages: The voltages to report and predict the centroids for
+        path_stem: The start of the path of each file, to which the name of the\
+ table and the extension are added
+        file_format: "parquet" or "arrow"
+        metadata: Extra metadata to embed, added to that from analysis_metadata
+
+    Returns:
+        The path each table was written to, by the name of the table.
+    """
+    if file_format not in EXTENSIONS:
+        raise ValueError(f"file_format must be parquet or arrow, got {file_format!r}")
+    run_metadata = analysis_metadata(analysis) | (metadata or {})
+    scans = analysis.scans_in_slit_range
+    channels = [f"voltage_channel_{i + 1}" for i in range(len(optimal_voltages))]
+    corrections = optimal_voltages - analysis.initial_voltages
+    tables: dict[str, dict[str, np.typing.NDArray[Any]]] = {
+        "scans": {
+            "slit_position_x": scans.slit_positions,
+            **{
+                f"pencil_beam_scan_{scan_id}": scans.centroids[:, i]
+                for i, scan_id in enumerate(scans.scan_ids)
+            },
+        },
+        "interaction_matrix": {
+            "slit_position_x": scans.slit_positions,
+            **{
+                channel: analysis.interaction_matrix[:, i]
+                for i, channel in enumerate(channels)
+            },
+        },
+        "predicted_centroids": {
+            "slit_position_x": scans.slit_positions,
+            "baseline_centroid": analysis.baseline_centroids,
+            "predicted_centroid": analysis.predicted_centroids(corrections),
+        },
+        "voltages": {
+            "voltage_channel": np.array(channels),
+            "initial_voltage": analysis.initial_voltages,
+            "voltage_correction": corrections,
+            "optimal_voltage": np.asarray(optimal_voltages, dtype=np.float64),
+        },
+    }
+
+    paths: dict[str, str] = {}
+    with profile_stage("export_analysis") as details:
+        for name, columns in tables.items():
+            paths[name] = f"{path_stem}_{name}{EXTENSIONS[file_format]}"
+            write_columnar(columns, paths[name], file_format, run_metadata)
+        details["file_format"] = file_format
+    return paths
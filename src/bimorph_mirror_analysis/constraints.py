@@ -0,0 +1,129 @@
+from collections.abc import Callable
+from functools import partial
+
+import numpy as np
+
+from bimorph_mirror_analysis.profiling import profile_stage
+
+
+def voltages_fit_constraints(
+    voltages: np.typing.ArrayLike,
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    tolerance: float = 0.0,
+) -> np.typing.NDArray[np.bool_]:
+    """Check many sets of voltages against the constraints at once.
+
+    Args:
+        voltages: The voltages of the actuators, along the last axis. Any leading\
+ axes are sets of voltages to check separately, for example one row per candidate
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference, rising or\
+ falling, between two consecutive actuators on the bimorph mirror
+        tolerance: How far a set of voltages may exceed the constraints and still\
+ fit them
+
+    Returns:
+        A boolean array, with the shape of the leading axes of voltages, which is True
+        for the sets of voltages which fit the constraints.
+    """
+    voltages = np.asarray(voltages, dtype=np.float64)
+    within_range = np.all(
+        (voltages >= voltage_range[0] - tolerance)
+        & (voltages <= voltage_range[1] + tolerance),
+        axis=-1,
+    )
+    within_max_diff = np.all(
+        np.abs(np.diff(voltages, axis=-1))
+        <= max_consecutive_voltage_difference + tolerance,
+        axis=-1,
+    )
+    return within_range & within_max_diff
+
+
+def _project_range(
+    voltages: np.typing.NDArray[np.float64], voltage_range: tuple[int, int]
+) -> np.typing.NDArray[np.float64]:
+    return np.clip(voltages, voltage_range[0], voltage_range[1])
+
+
+def _project_pairs(
+    voltages: np.typing.NDArray[np.float64], first: int, max_diff: int
+) -> np.typing.NDArray[np.float64]:
+    # the pairs (first, first + 1), (first + 2, first + 3), ... do not overlap, so
+    # each is projected separately by moving both voltages towards each other
+    projected = voltages.copy()
+    num_pairs = (voltages.shape[-1] - first) // 2
+    left = slice(first, first + 2 * num_pairs, 2)
+    right = slice(first + 1, first + 2 * num_pairs + 1, 2)
+    diffs = voltages[..., right] - voltages[..., left]
+    excess = np.sign(diffs) * np.maximum(np.abs(diffs) - max_diff, 0)
+    projected[..., left] += excess / 2
+    projected[..., right] -= excess / 2
+    return projected
+
+
+def project_onto_constraints(
+    voltages: np.typing.ArrayLike,
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    max_iterations: int = 10000,
+    tolerance: float = 1e-9,
+) -> np.typing.NDArray[np.float64]:
+    """Find the closest voltages which fit the constraints.
+
+    The voltages which fit the constraints are the intersection of three convex
+    sets, each with a closed form projection: the box of the voltage range, the
+    limits on the differences of the pairs of actuators (0, 1), (2, 3), ..., and the
+    limits on the pairs (1, 2), (3, 4), .... Dykstra's algorithm alternates between
+    the three projections, with corrections which make it converge to the Euclidean
+    projection onto the intersection rather than just to some point inside it.
+    Every set of voltages is projected at once.
+
+    Args:
+        voltages: The voltages of the actuators, along the last axis. Any leading\
+ axes are sets of voltages to project separately
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference, rising or\
+ falling, between two consecutive actuators on the bimorph mirror
+        max_iterations: The maximum number of rounds of the three projections
+        tolerance: The largest change in any voltage over a round at which the\
+ projection has converged
+
+    Returns:
+        The closest voltages to those supplied which fit the constraints, with the
+        same shape.
+    """
+    if voltage_range[0] > voltage_range[1]:
+        raise ValueError(
+            f"The minimum voltage {voltage_range[0]} is above the maximum\
+ {voltage_range[1]}"
+        )
+    if max_consecutive_voltage_difference < 0:
+        raise ValueError(
+            f"max_consecutive_voltage_difference must not be negative, got\
+ {max_consecutive_voltage_difference}"
+        )
+    projected = np.array(voltages, dtype=np.float64)
+    projections: list[
+        Callable[[np.typing.NDArray[np.float64]], np.typing.NDArray[np.float64]]
+    ] = [
+        partial(_project_range, voltage_range=voltage_range),
+        partial(_project_pairs, first=0, max_diff=max_consecutive_voltage_difference),
+        partial(_project_pairs, first=1, max_diff=max_consecutive_voltage_difference),
+    ]
+    increments = [np.zeros_like(projected) for _ in projections]
+
+    with profile_stage("project_onto_constraints") as details:
+        iterations = 0
+        while iterations < max_iterations:
+            iterations += 1
+            previous = projected
+            for increment, projection in zip(increments, projections, strict=True):
+                shifted = projected + increment
+                projected = projection(shifted)
+                increment[...] = shifted - projected
+            if np.max(np.abs(projected - previous), initial=0) <= tolerance:
+                break
+        details["iterations"] = iterations
+    return projected
@@ -0,0 +1,203 @@
+from collections.abc import Sequence
+from typing import TypedDict
+
+import numpy as np
+from scipy.linalg import qr, solve_triangular
+
+from bimorph_mirror_analysis.maths import process_pencil_beam_scans, weight_rows
+from bimorph_mirror_analysis.profiling import profile_stage
+from bimorph_mirror_analysis.scan_matrix import ScanData, centroid_matrix
+
+
+class FrozenActuatorFit(TypedDict):
+    corrections: np.typing.NDArray[np.float64]
+    residual: float
+    penalty: float
+
+
+class ActuatorFailures(TypedDict):
+    corrections: np.typing.NDArray[np.float64]
+    residual: float
+    failure_corrections: np.typing.NDArray[np.float64]
+    failure_residuals: np.typing.NDArray[np.float64]
+    penalties: np.typing.NDArray[np.float64]
+
+
+class _FactorisedFit:
+    """The unrestrained least squares fit and the inverse of its normal matrix.
+
+    Freezing the actuators in a set S at their current voltages forces their
+    corrections to 0. With G = H^T H and x the unrestrained solution, the solution
+    with S frozen is x - G^-1[:, S] G^-1[S, S]^-1 x[S], and the squared error rises
+    by x[S]^T G^-1[S, S]^-1 x[S], so each set of frozen actuators is a downdate of
+    rank |S| of the one factorisation rather than a new fit.
+    """
+
+    def __init__(
+        self,
+        interaction_matrix: np.typing.NDArray[np.float64],
+        desired_corrections: np.typing.NDArray[np.float64],
+    ):
+        q, r = qr(interaction_matrix, mode="economic")  # type: ignore
+        diagonal = np.abs(np.diag(r))  # type: ignore
+        if np.any(diagonal <= diagonal.max() * max(interaction_matrix.shape) * 1e-15):
+            raise ValueError(
+                "The interaction matrix is rank deficient, so the actuators cannot be\
+ told apart"
+            )
+        projected = q.T @ desired_corrections  # type: ignore
+        self.solution = solve_triangular(r, projected)  # type: ignore
+        self.squared_error = float(
+            np.sum((desired_corrections - q @ projected) ** 2)  # type: ignore
+        )
+        r_inverse = solve_triangular(r, np.eye(r.shape[0]))  # type: ignore
+        self.normal_inverse = r_inverse @ r_inverse.T  # type: ignore
+        self.num_rows = len(desired_corrections)
+
+    def rms(self, squared_error: float | np.typing.NDArray[np.float64]):
+        return np.sqrt(squared_error / self.num_rows)
+
+    def freeze(
+        self, columns: np.typing.NDArray[np.int_]
+    ) -> tuple[np.typing.NDArray[np.float64], float]:
+        if len(columns) == 0:
+            return self.solution.copy(), self.squared_error  # type: ignore
+        block = self.normal_inverse[np.ix_(columns, columns)]  # type: ignore
+        multipliers = np.linalg.solve(block, self.solution[columns])  # type: ignore
+        solution = self.solution - self.normal_inverse[:, columns] @ multipliers  # type: ignore
+        solution[columns] = 0
+        penalty = float(self.solution[columns] @ multipliers)  # type: ignore
+        return solution, self.squared_error + penalty
+
+    def freeze_each(
+        self,
+    ) -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
+        # the first column is the offset of the centroids, not an actuator
+        diagonal = np.diag(self.normal_inverse)[1:]  # type: ignore
+        scale = self.solution[1:] / diagonal  # type: ignore
+        solutions = self.solution[:, None] - self.normal_inverse[:, 1:] * scale  # type: ignore
+        solutions[1:][np.diag_indices(len(diagonal))] = 0
+        return solutions, self.squared_error + self.solution[1:] * scale  # type: ignore
+
+
+def _check_baseline(data: np.typing.NDArray[np.float64], baseline_voltage_scan: int):
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+
+
+def _factorise(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    baseline_voltage_scan: int,
+    weights: np.typing.NDArray[np.float64] | None,
+) -> _FactorisedFit:
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        data, voltage_increment, baseline_voltage_scan
+    )
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
+    return _FactorisedFit(interaction_matrix, desired_corrections)
+
+
+def find_voltage_corrections_with_frozen_actuators(
+    data: ScanData,
+    voltage_increment: float,
+    frozen_actuators: Sequence[int],
+    baseline_voltage_scan: int = 0,
+    weights: np.typing.NDArray[np.float64] | None = None,
+) -> FrozenActuatorFit:
+    """Calculate the unrestrained voltage corrections with some actuators held at\
+ their current voltages.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        frozen_actuators: The indices of the actuators which cannot be changed,\
+ starting from 0
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        weights: The weight of each slit position in the least squares fit
+
+    Returns:
+        The voltage corrections, which are 0 for the frozen actuators, the RMS
+        residual of the fit, and how much the RMS residual rose by freezing the
+        actuators.
+    """
+    data = centroid_matrix(data)
+    _check_baseline(data, baseline_voltage_scan)
+    num_actuators = data.shape[1] - 1
+    frozen = np.unique(np.asarray(frozen_actuators, dtype=np.int_))
+    if np.any((frozen < 0) | (frozen >= num_actuators)):
+        raise IndexError(
+            f"frozen_actuators must be between 0 and {num_actuators - 1}, got\
+ {list(frozen_actuators)}"
+        )
+
+    with profile_stage("find_voltage_corrections_with_frozen_actuators") as details:
+        fit = _factorise(data, voltage_increment, baseline_voltage_scan, weights)
+        solution, squared_error = fit.freeze(frozen + 1)
+        details["num_frozen"] = len(frozen)
+
+    residual = float(fit.rms(squared_error))
+    return {
+        "corrections": np.round(solution[1:], decimals=2),
+        "residual": residual,
+        "penalty": residual - float(fit.rms(fit.squared_error)),
+    }
+
+
+def evaluate_actuator_failures(
+    data: ScanData,
+    voltage_increment: float,
+    baseline_voltage_scan: int = 0,
+    weights: np.typing.NDArray[np.float64] | None = None,
+) -> ActuatorFailures:
+    """Calculate the best voltage corrections after the failure of each actuator in\
+ turn.
+
+    A failed actuator is held at its current voltage. All of the failures are
+    evaluated together from one factorisation of the interaction matrix, see
+    find_voltage_corrections_with_frozen_actuators.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        weights: The weight of each slit position in the least squares fit
+
+    Returns:
+        The voltage corrections and RMS residual with every actuator working, and
+        for the failure of each actuator the voltage corrections, with a row per
+        failed actuator, the RMS residual and how much the RMS residual rose.
+    """
+    data = centroid_matrix(data)
+    _check_baseline(data, baseline_voltage_scan)
+
+    with profile_stage("evaluate_actuator_failures") as details:
+        fit = _factorise(data, voltage_increment, baseline_voltage_scan, weights)
+        solutions, squared_errors = fit.freeze_each()
+        details["num_actuators"] = len(squared_errors)
+
+    residual = float(fit.rms(fit.squared_error))
+    failure_residuals = fit.rms(squared_errors)
+    return {
+        "corrections": np.round(fit.solution[1:], decimals=2),  # type: ignore
+        "residual": residual,
+        "failure_corrections": np.round(solutions[1:].T, decimals=2),
+        "failure_residuals": failure_residuals,  # type: ignore
+        "penalties": failure_residuals - residual,  # type: ignore
+    }
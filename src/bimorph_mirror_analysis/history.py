@@ -0,0 +1,273 @@
+import datetime
+import io
+import json
+import sqlite3
+from typing import Any, TypedDict
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calibrations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mirror_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    source_file TEXT,
+    voltage_range_min REAL,
+    voltage_range_max REAL,
+    max_consecutive_voltage_difference REAL,
+    baseline_voltage_scan INTEGER,
+    residual REAL,
+    timings TEXT,
+    slit_positions BLOB NOT NULL,
+    interaction_matrix BLOB NOT NULL,
+    baseline_centroids BLOB NOT NULL,
+    initial_voltages BLOB NOT NULL,
+    optimal_voltages BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calibrations_by_mirror_and_time
+    ON calibrations (mirror_id, created_at);
+"""
+
+_SUMMARY_COLUMNS = (
+    "id",
+    "mirror_id",
+    "created_at",
+    "source_file",
+    "voltage_range_min",
+    "voltage_range_max",
+    "max_consecutive_voltage_difference",
+    "baseline_voltage_scan",
+    "residual",
+    "timings",
+)
+_ARRAY_COLUMNS = (
+    "slit_positions",
+    "interaction_matrix",
+    "baseline_centroids",
+    "initial_voltages",
+    "optimal_voltages",
+)
+
+
+class CalibrationSummary(TypedDict):
+    id: int
+    mirror_id: str
+    created_at: str
+    source_file: str | None
+    voltage_range_min: float | None
+    voltage_range_max: float | None
+    max_consecutive_voltage_difference: float | None
+    baseline_voltage_scan: int | None
+    residual: float | None
+    timings: dict[str, float]
+
+
+class CalibrationRecord(CalibrationSummary):
+    slit_positions: np.typing.NDArray[np.float64]
+    interaction_matrix: np.typing.NDArray[np.float64]
+    baseline_centroids: np.typing.NDArray[np.float64]
+    initial_voltages: np.typing.NDArray[np.float64]
+    optimal_voltages: np.typing.NDArray[np.float64]
+
+
+def _to_blob(array: np.typing.NDArray[np.float64]) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype=np.float64), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_blob(blob: bytes) -> np.typing.NDArray[np.float64]:
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+class CalibrationHistory:
+    """A local SQLite store of past calibrations.
+
+    Each calibration records the interaction matrix, baseline centroids,
+    constraints, optimal voltages, residual and timings of one run. Runs are
+    indexed by mirror and time, so the latest calibration of a mirror can be
+    fetched without scanning the whole table.
+
+    Args:
+        file_path: The path to the database file, which is created if it does not
+            exist
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._connection = sqlite3.connect(file_path)
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "CalibrationHistory":
+        return self
+
+    def __exit__(self, *args: object):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def record(
+        self,
+        mirror_id: str,
+        slit_positions: np.typing.NDArray[np.float64],
+        interaction_matrix: np.typing.NDArray[np.float64],
+        baseline_centroids: np.typing.NDArray[np.float64],
+        initial_voltages: np.typing.NDArray[np.float64],
+        optimal_voltages: np.typing.NDArray[np.float64],
+        voltage_range: tuple[float, float] | None = None,
+        max_consecutive_voltage_difference: float | None = None,
+        baseline_voltage_scan: int | None = None,
+        residual: float | None = None,
+        timings: dict[str, float] | None = None,
+        source_file: str | None = None,
+        created_at: datetime.datetime | None = None,
+    ) -> int:
+        """Record a calibration run.
+
+        Args:
+            mirror_id: The name of the mirror which was calibrated
+            slit_positions: The slit positions of the pencil beam scans
+            interaction_matrix: The response of the centroids per unit voltage on\
+ each actuator, with rows of slit positions and columns of actuators
+            baseline_centroids: The centroids of the baseline scan
+            initial_voltages: The voltages of the actuators in the baseline scan
+            optimal_voltages: The calculated optimal voltages
+            voltage_range: The minimum and maximum values a voltage can take
+            max_consecutive_voltage_difference: The maximum voltage difference\
+ allowed between two consecutive actuators
+            baseline_voltage_scan: The index of the baseline pencil beam scan
+            residual: The RMS of the predicted centroids about their mean
+            timings: The time taken by each stage of the analysis, in seconds
+            source_file: The path to the file the scans were read from
+            created_at: The time of the run, now if not supplied
+
+        Returns:
+            The id of the recorded run.
+        """
+        if created_at is None:
+            created_at = datetime.datetime.now()
+        voltage_range_min, voltage_range_max = voltage_range or (None, None)
+        with self._connection:
+            cursor = self._connection.execute(
+                f"INSERT INTO calibrations ({', '.join(_SUMMARY_COLUMNS[1:])},\
+ {', '.join(_ARRAY_COLUMNS)}) VALUES\
+ ({', '.join('?' * (len(_SUMMARY_COLUMNS) - 1 + len(_ARRAY_COLUMNS)))})",
+                (
+                    mirror_id,
+                    created_at.isoformat(),
+                    source_file,
+                    voltage_range_min,
+                    voltage_range_max,
+                    max_consecutive_voltage_difference,
+                    baseline_voltage_scan,
+                    residual,
+                    json.dumps(timings or {}),
+                    _to_blob(slit_positions),
+                    _to_blob(interaction_matrix),
+                    _to_blob(baseline_centroids),
+                    _to_blob(initial_voltages),
+                    _to_blob(optimal_voltages),
+                ),
+            )
+        return int(cursor.lastrowid)  # type: ignore
+
+    def latest(
+        self, mirror_id: str, before: datetime.datetime | None = None
+    ) -> CalibrationRecord | None:
+        """Fetch the most recent calibration of a mirror.
+
+        Args:
+            mirror_id: The name of the mirror
+            before: Only consider runs before this time, if supplied
+
+        Returns:
+            The calibration, or None if the mirror has not been calibrated.
+        """
+        query = f"SELECT {', '.join(_SUMMARY_COLUMNS + _ARRAY_COLUMNS)}\
+ FROM calibrations WHERE mirror_id = ?"
+        params: list[Any] = [mirror_id]
+        if before is not None:
+            query += " AND created_at < ?"
+            params.append(before.isoformat())
+        query += " ORDER BY created_at DESC, id DESC LIMIT 1"
+        row = self._connection.execute(query, params).fetchone()
+        if row is None:
+            return None
+        summary = self._summary(row[: len(_SUMMARY_COLUMNS)])
+        arrays = {
+            name: _from_blob(blob)
+            for name, blob in zip(
+                _ARRAY_COLUMNS, row[len(_SUMMARY_COLUMNS) :], strict=True
+            )
+        }
+        return {**summary, **arrays}  # type: ignore
+
+    def runs(
+        self,
+        mirror_id: str | None = None,
+        since: datetime.datetime | None = None,
+        until: datetime.datetime | None = None,
+    ) -> list[CalibrationSummary]:
+        """List recorded calibrations, oldest first, without their arrays.
+
+        Args:
+            mirror_id: Only list runs of this mirror, if supplied
+            since: Only list runs at or after this time, if supplied
+            until: Only list runs before this time, if supplied
+
+        Returns:
+            A summary of each matching run.
+        """
+        conditions: list[str] = []
+        params: list[Any] = []
+        if mirror_id is not None:
+            conditions.append("mirror_id = ?")
+            params.append(mirror_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until.isoformat())
+        query = f"SELECT {', '.join(_SUMMARY_COLUMNS)} FROM calibrations"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at, id"
+        return [self._summary(row) for row in self._connection.execute(query, params)]
+
+    @staticmethod
+    def _summary(row: tuple[Any, ...]) -> CalibrationSummary:
+        summary = dict(zip(_SUMMARY_COLUMNS, row, strict=True))
+        summary["timings"] = json.loads(summary["timings"] or "{}")
+        return summary  # type: ignore
+
+
+def interaction_matrix_drift(
+    record: CalibrationRecord,
+    slit_positions: np.typing.NDArray[np.float64],
+    interaction_matrix: np.typing.NDArray[np.float64],
+) -> float:
+    """Compare a newly measured interaction matrix with a stored calibration.
+
+    Args:
+        record: The stored calibration
+        slit_positions: The slit positions of the new pencil beam scans
+        interaction_matrix: The new interaction matrix, with rows of slit positions\
+ and columns of actuators
+
+    Returns:
+        The Frobenius norm of the change in the interaction matrix, relative to the
+        norm of the stored matrix.
+    """
+    stored = record["interaction_matrix"]
+    if stored.shape != interaction_matrix.shape or not np.allclose(
+        record["slit_positions"], slit_positions
+    ):
+        raise ValueError(
+            "The new scans do not have the same slit positions and actuators as the\
+ stored calibration"
+        )
+    return float(
+        np.linalg.norm(interaction_matrix - stored) / (np.linalg.norm(stored) or 1.0)
+    )
@@ -1,12 +1,20 @@
+import json
+import time
 from collections.abc import Callable
-from typing import TypedDict
+from importlib import resources
+from typing import Any, TypedDict
 
 import numpy as np
-from scipy.optimize import minimize
+from scipy import linalg
+from scipy.optimize import minimize, nnls
+
+from bimorph_mirror_analysis.constraints import voltages_fit_constraints
+from bimorph_mirror_analysis.profiling import profile_stage
+from bimorph_mirror_analysis.scan_matrix import ScanData, centroid_matrix
 
 
 def process_pencil_beam_scans(
-    data: np.typing.NDArray[np.float64],
+    data: ScanData,
     voltage_increment: float,
     baseline_voltage_scan: int = 0,
 ) -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
@@ -15,7 +23,8 @@ def process_pencil_beam_scans(
 
     Args:
         data: A matrix of beamline centroid data, with rows of different slit positions
-            and columns of pencil beam scans at different actuator voltages
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
         voltage_increment: The voltage increment applied to the actuators between \
 pencil beam scans
         baseline_voltage_scan: The pencil beam scan to use as the baseline for the
@@ -25,6 +34,7 @@ pencil beam scans
     Returns:
         A tuple containing the interaction matrix and desired corrections.
     """
+    data = centroid_matrix(data)
     # calculate the response of each actuator by subtracting previous pencil beam
     responses = np.diff(data, axis=1)
 
@@ -44,10 +54,114 @@ pencil beam scans
     return interaction_matrix, desired_corrections
 
 
+def slit_position_weights(
+    counts: np.typing.NDArray[np.float64],
+    variances: np.typing.NDArray[np.float64],
+) -> np.typing.NDArray[np.float64]:
+    """Calculate least squares weights for each slit position from repeat measurements.
+
+    The weight of a slit position is the inverse of the variance of its mean
+    centroid, averaged over the pencil beam scans. Slit positions without repeats,
+    and so without a variance, are given the median variance of the others.
+
+    Args:
+        counts: The number of measurements of each slit position in each scan, with
+            rows of slit positions and columns of pencil beam scans
+        variances: The sample variance of the centroid of each slit position in each
+            scan, NaN where there was only one measurement
+
+    Returns:
+        The weight of each slit position, scaled to have a mean of 1.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cell_variances = np.where(counts > 1, variances / counts, np.nan)
+    measured = ~np.isnan(cell_variances)
+    num_measured = np.sum(measured, axis=1)
+    if not np.any(num_measured):
+        return np.ones(len(counts))
+    row_variances = np.full(len(counts), np.nan)
+    row_variances[num_measured > 0] = (
+        np.sum(np.where(measured, cell_variances, 0), axis=1)[num_measured > 0]
+        / num_measured[num_measured > 0]
+    )
+    median = np.nanmedian(row_variances)
+    row_variances = np.where(np.isnan(row_variances), median, row_variances)
+    # stop slit positions whose repeats happen to agree exactly from dominating
+    row_variances = np.maximum(row_variances, 1e-3 * median if median > 0 else 1.0)
+    weights = 1 / row_variances
+    return weights / np.mean(weights)
+
+
+def weight_rows(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    weights: np.typing.NDArray[np.float64],
+) -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
+    """Scale the rows of a least squares problem by the square root of their weights.
+
+    Minimising the unweighted squared error of the scaled problem minimises the
+    weighted squared error of the original, at the cost of one scaling per row.
+
+    Args:
+        interaction_matrix: The interaction matrix, as returned by\
+ process_pencil_beam_scans
+        desired_corrections: The desired corrections, as returned by\
+ process_pencil_beam_scans
+        weights: The weight of each row
+
+    Returns:
+        A tuple containing the scaled interaction matrix and desired corrections.
+    """
+    if len(weights) != len(desired_corrections):
+        raise ValueError(
+            f"There are {len(weights)} weights, but {len(desired_corrections)} slit\
+ positions"
+        )
+    if np.any(np.asarray(weights) < 0):
+        raise ValueError("weights must not be negative")
+    scale = np.sqrt(np.asarray(weights, dtype=np.float64))
+    return interaction_matrix * scale[:, np.newaxis], desired_corrections * scale
+
+
+def weighted_gram(
+    basis: np.typing.NDArray[np.float64],
+    weights: np.typing.NDArray[np.float64],
+    chunk_elements: int = 2**22,
+) -> np.typing.NDArray[np.float64]:
+    """Calculate B^T W B for a diagonal matrix of row weights W.
+
+    A single product is formed as (B^T W) B. A batch of weights is one matrix
+    product of the weights with the outer products of the rows of B, which are only
+    formed for chunks of rows, so they stay around the size of chunk_elements
+    however many slit positions there are.
+
+    Args:
+        basis: The matrix B, with a row per slit position
+        weights: The weight of each row, or a matrix with a row of weights for each\
+ of a batch of Gram matrices
+        chunk_elements: The most elements of the outer products of the rows of B to\
+ form at once for a batch
+
+    Returns:
+        The Gram matrix, or a stack of them if a batch of weights was given.
+    """
+    if weights.ndim == 1:
+        return (basis.T * weights) @ basis
+    num_rows, num_cols = basis.shape
+    gram = np.zeros((len(weights), num_cols * num_cols))
+    chunk = max(chunk_elements // (num_cols * num_cols), 1)
+    for start in range(0, num_rows, chunk):
+        rows = basis[start : start + chunk]
+        outer = (rows[:, :, np.newaxis] * rows[:, np.newaxis, :]).reshape(len(rows), -1)
+        gram += weights[:, start : start + chunk] @ outer
+    return gram.reshape(len(weights), num_cols, num_cols)
+
+
 def find_voltage_corrections(
-    data: np.typing.NDArray[np.float64],
+    data: ScanData,
     voltage_increment: float,
     baseline_voltage_scan: int = 0,
+    weights: np.typing.NDArray[np.float64] | None = None,
 ) -> np.typing.NDArray[np.float64]:
     """Calculate voltage corrections to apply to bimorph.
 
@@ -57,17 +171,22 @@ def find_voltage_corrections(
 
     Args:
         data: A matrix of beamline centroid data, with rows of different slit positions
-            and columns of pencil beam scans at different actuator voltages
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
         voltage_increment: The voltage increment applied to the actuators between \
 pencil beam scans
         baseline_voltage_scan: The pencil beam scan to use as the baseline for the
             centroid calculation. 0 is the first scan, 1 is the second scan, etc.
             -1 can be used for the last scan and -2 for the second to last scan etc.
+        weights: The weight of each slit position in the least squares fit, for\
+ example from slit_position_weights. All slit positions count equally if not\
+ supplied.
 
     Returns:
         An array of voltage corrections required to move the centroid of each pencil
         beam scan to the target position.
     """
+    data = centroid_matrix(data)
 
     if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
         raise IndexError(
@@ -78,14 +197,20 @@ pencil beam scans
     interaction_matrix, desired_corrections = process_pencil_beam_scans(
         data, voltage_increment, baseline_voltage_scan
     )
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
 
-    # calculate the Moore-Penrose pseudo inverse of H
-    interaction_matrix_inv = np.linalg.pinv(interaction_matrix)
+    with profile_stage("find_voltage_corrections") as details:
+        details["solver"] = "pinv"
+        # calculate the Moore-Penrose pseudo inverse of H
+        interaction_matrix_inv = np.linalg.pinv(interaction_matrix)
 
-    # calculate the voltage required to move the centroid to the target position
-    voltage_corrections: np.typing.NDArray[np.float64] = np.matmul(
-        interaction_matrix_inv, desired_corrections
-    )
+        # calculate the voltage required to move the centroid to the target position
+        voltage_corrections: np.typing.NDArray[np.float64] = np.matmul(
+            interaction_matrix_inv, desired_corrections
+        )
 
     return np.round(voltage_corrections[1:], decimals=2)  # return the voltages
 
@@ -168,12 +293,15 @@ def generate_minimize_constraints(
 
 
 def find_voltage_corrections_with_restraints(
-    data: np.typing.NDArray[np.float64],
+    data: ScanData,
     voltage_increment: float,
     initial_voltages: np.typing.NDArray[np.float64],
     voltage_range: tuple[int, int],
     max_consecutive_voltage_difference: int,
     baseline_voltage_scan: int = 0,
+    initial_guess: np.typing.NDArray[np.float64] | None = None,
+    weights: np.typing.NDArray[np.float64] | None = None,
+    callback: Callable[[np.typing.NDArray[np.float64]], None] | None = None,
 ) -> np.typing.NDArray[np.float64]:
     """Calculate voltage corrections to apply to bimorph.
 
@@ -184,7 +312,8 @@ def find_voltage_corrections_with_restraints(
 
     Args:
         data: A matrix of beamline centroid data, with rows of different slit positions
-            and columns of pencil beam scans at different actuator voltages
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
         voltage_increment: The voltage increment applied to the actuators between \
 pencil beam scans
         initial_voltages: The initial voltages of the actuators in the baseline scan
@@ -194,11 +323,19 @@ pencil beam scans
         baseline_voltage_scan: The pencil beam scan to use as the baseline for the
             centroid calculation. 0 is the first scan, 1 is the second scan, etc.
             -1 can be used for the last scan and -2 for the second to last scan etc.
+        initial_guess: The voltage corrections to start the optimisation from, for
+            example from a previous calibration. All 1s if not supplied.
+        weights: The weight of each slit position in the least squares fit, for\
+ example from slit_position_weights. All slit positions count equally if not\
+ supplied.
+        callback: Called with the current voltage corrections after each iteration\
+ of SLSQP. An exception raised by the callback stops the optimisation.
 
     Returns:
         An array of voltage corrections required to move the centroid of each pencil
         beam scan to the target position.
     """
+    data = centroid_matrix(data)
     if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
         raise IndexError(
             f"baseline_voltage_scan is out of range, it must be between\
@@ -208,56 +345,506 @@ pencil beam scans
     interaction_matrix, desired_corrections = process_pencil_beam_scans(
         data, voltage_increment, baseline_voltage_scan
     )
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
+
+    if initial_guess is not None and len(initial_guess) != len(initial_voltages):
+        raise ValueError(
+            f"initial_guess has {len(initial_guess)} values, but there are\
+ {len(initial_voltages)} actuators"
+        )
+
+    with profile_stage("find_voltage_corrections_with_restraints") as details:
+        result = _minimize_slsqp(
+            interaction_matrix,
+            desired_corrections,
+            {
+                "initial_voltages": initial_voltages,
+                "voltage_range": voltage_range,
+                "max_consecutive_voltage_difference": (
+                    max_consecutive_voltage_difference
+                ),
+            },
+            initial_guess,
+            callback,
+        )
+        details["solver"] = "SLSQP"
+        details["iterations"] = result.nit  # type: ignore
+        details["function_evaluations"] = result.nfev  # type: ignore
+        details["success"] = result.success  # type: ignore
+
+    return np.round(result.x[1:], decimals=2)  # first item is not a voltage
+
+
+def check_voltages_fit_constraints(
+    voltages: np.typing.NDArray[np.float64],
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+) -> bool:
+    """Check if the supplied voltages fit the given constraints.
+
+    Args:
+        voltages: The voltages to check.
+        voltage_range: The minimum and maximum values a voltage can take.
+        max_consecutive_voltage_difference: The maximum voltage difference, rising or
+            falling, between two consecutive actuators on the bimorph mirror.
+
+    Returns:
+        A boolean indicating if the voltages fit the constraints.
+    """
+    # bool required as the check returns np.bool
+    return bool(
+        voltages_fit_constraints(
+            voltages, voltage_range, max_consecutive_voltage_difference
+        )
+    )
+
+
+class SolverConstraints(TypedDict):
+    initial_voltages: np.typing.NDArray[np.float64]
+    voltage_range: tuple[int, int]
+    max_consecutive_voltage_difference: int
+
 
-    # set initial guess voltages to all 1s
-    initial_guess = np.ones(interaction_matrix.shape[1])
+SolverBackend = Callable[
+    [
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+        SolverConstraints | None,
+        np.typing.NDArray[np.float64] | None,
+    ],
+    np.typing.NDArray[np.float64],
+]
+
+
+class Solver(TypedDict):
+    solve: SolverBackend
+    constrained: bool
+    description: str
+
+
+class SolverResult(TypedDict):
+    corrections: np.typing.NDArray[np.float64]
+    solver: str
+    elapsed: float
+    fits_constraints: bool | None
+
+
+# the registered solver backends, by name. Each is called with the interaction
+# matrix and desired corrections from process_pencil_beam_scans, the constraints
+# (None for an unrestrained solve) and an optional initial guess for the voltage
+# corrections, and returns the solution including the constant term.
+SOLVERS: dict[str, Solver] = {}
+
+# condition number of the column-normalised interaction matrix above which the
+# auto policy regularises the unrestrained solve
+_ILL_CONDITIONED = 1e10
+
+
+def register_solver(
+    name: str, constrained: bool, description: str
+) -> Callable[[SolverBackend], SolverBackend]:
+    """Register a solver backend, so it can be chosen by name.
+
+    Args:
+        name: The name to register the backend under
+        constrained: Whether the backend respects the voltage range and the maximum\
+ consecutive voltage difference
+        description: A short description of the backend
+
+    Returns:
+        A decorator which registers the backend and returns it unchanged.
+    """
+
+    def register(solve: SolverBackend) -> SolverBackend:
+        SOLVERS[name] = {
+            "solve": solve,
+            "constrained": constrained,
+            "description": description,
+        }
+        return solve
+
+    return register
+
+
+def _minimize_slsqp(  # type: ignore
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints,
+    initial_guess: np.typing.NDArray[np.float64] | None = None,
+    callback: Callable[[np.typing.NDArray[np.float64]], None] | None = None,
+):
+    initial_voltages = constraints["initial_voltages"]
+    voltage_range = constraints["voltage_range"]
+    if initial_guess is None:
+        # set initial guess voltages to all 1s
+        x0 = np.ones(interaction_matrix.shape[1])
+    else:
+        # first item is for the constant term
+        x0 = np.concatenate(([1.0], initial_guess))
 
     # first item is for the constant term
     bounds = [voltage_range] + [
         (voltage_range[0] - i, voltage_range[1] - i) for i in initial_voltages
     ]
 
-    constraints = generate_minimize_constraints(
-        max_consecutive_voltage_difference, initial_voltages
-    )
-
     # minimise the objective function
-    result = minimize(
+    return minimize(
         objective_function,
-        initial_guess,
+        x0,
         args=(interaction_matrix, desired_corrections),
         method="SLSQP",
         bounds=bounds,
-        constraints=constraints,  # type: ignore
+        constraints=generate_minimize_constraints(  # type: ignore
+            constraints["max_consecutive_voltage_difference"], initial_voltages
+        ),
         options={"maxiter": 3 * 10**5},
+        callback=None if callback is None else lambda xk: callback(xk[1:]),  # type: ignore
     )
 
-    return np.round(result.x[1:], decimals=2)  # first item is not a voltage
+
+@register_solver("pinv", False, "Moore-Penrose pseudo-inverse")
+def _solve_pinv(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    return np.linalg.pinv(interaction_matrix) @ desired_corrections
 
 
-def check_voltages_fit_constraints(
-    voltages: np.typing.NDArray[np.float64],
-    voltage_range: tuple[int, int],
-    max_consecutive_voltage_difference: int,
-) -> bool:
-    """Check if the supplied voltages fit the given constraints.
+@register_solver("lstsq", False, "least squares by pivoted QR")
+def _solve_lstsq(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    return linalg.lstsq(interaction_matrix, desired_corrections, lapack_driver="gelsy")[
+        0
+    ]  # type: ignore
+
+
+@register_solver(
+    "regularized", False, "Tikhonov regularised least squares, for noisy scans"
+)
+def _solve_regularized(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    num_cols = interaction_matrix.shape[1]
+    # penalise the size of the voltage corrections, but not the constant term, by a
+    # small fraction of the mean squared column norm
+    penalty = 1e-6 * np.sum(interaction_matrix[:, 1:] ** 2) / max(num_cols - 1, 1)
+    regularisation = np.sqrt(penalty) * np.eye(num_cols)[1:]
+    return linalg.lstsq(
+        np.vstack((interaction_matrix, regularisation)),
+        np.concatenate((desired_corrections, np.zeros(num_cols - 1))),
+        lapack_driver="gelsy",
+    )[0]  # type: ignore
+
+
+@register_solver("slsqp", True, "sequential least squares programming")
+def _solve_slsqp(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    if constraints is None:
+        raise ValueError("The slsqp solver needs constraints")
+    result = _minimize_slsqp(  # type: ignore
+        interaction_matrix, desired_corrections, constraints, initial_guess
+    )
+    return result.x  # type: ignore
+
+
+@register_solver("qp", True, "exact quadratic program, by non-negative least squares")
+def _solve_qp(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    # least squares with linear inequality constraints, as in Lawson and Hanson,
+    # Solving Least Squares Problems, chapter 23. The constant term is unconstrained,
+    # so it is removed by centring, and the remaining problem min |E x - f| subject
+    # to G x >= h becomes a least distance problem in z = R x - Q^T f, which is
+    # solved exactly by a single non-negative least squares
+    if constraints is None:
+        raise ValueError("The qp solver needs constraints")
+    initial_voltages = constraints["initial_voltages"]
+    voltage_range = constraints["voltage_range"]
+    max_diff = constraints["max_consecutive_voltage_difference"]
+
+    responses = interaction_matrix[:, 1:]
+    mean_response = np.mean(responses, axis=0)
+    mean_correction = np.mean(desired_corrections)
+    q, r = linalg.qr(responses - mean_response, mode="economic")  # type: ignore
+    diagonal = np.abs(np.diag(r))  # type: ignore
+    if np.min(diagonal) <= 1e-12 * np.max(diagonal):
+        raise ValueError(
+            "The interaction matrix is rank deficient, so the qp solver cannot be\
+ used"
+        )
+
+    num_actuators = len(initial_voltages)
+    identity = np.eye(num_actuators)
+    differences = np.diff(identity, axis=0)
+    initial_differences = differences @ initial_voltages
+    # rows of G x >= h, for the voltage range and the rising and falling differences
+    g = np.vstack((identity, -identity, differences, -differences))
+    h = np.concatenate(
+        (
+            voltage_range[0] - initial_voltages,
+            initial_voltages - voltage_range[1],
+            -max_diff - initial_differences,
+            -max_diff + initial_differences,
+        )
+    )
+    projected = q.T @ (desired_corrections - mean_correction)  # type: ignore
+    g_z = linalg.solve_triangular(r, g.T, trans="T").T  # type: ignore
+    h_z = h - g_z @ projected
+
+    target = np.zeros(num_actuators + 1)
+    target[-1] = 1.0
+    least_distance = np.vstack((g_z.T, h_z))
+    multipliers, _ = nnls(least_distance, target, maxiter=50 * len(h))  # type: ignore
+    residual = least_distance @ multipliers - target
+    if np.linalg.norm(residual) <= 1e-12:
+        raise ValueError("No voltages fit the constraints")
+    z = -residual[:-1] / residual[-1]
+
+    voltage_corrections = linalg.solve_triangular(r, z + projected)  # type: ignore
+    constant = mean_correction - mean_response @ voltage_corrections  # type: ignore
+    return np.concatenate(([constant], voltage_corrections))  # type: ignore
+
+
+@register_solver("sparse", False, "LSMR on the sparse banded interaction matrix")
+def _solve_sparse(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    # imported here, as the sparse module builds on this one
+    from bimorph_mirror_analysis.sparse import solve_sparse_least_squares
+
+    return solve_sparse_least_squares(interaction_matrix, desired_corrections)
+
+
+@register_solver("robust", False, "Huber IRLS, which down-weights bad centroids")
+def _solve_robust(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    constraints: SolverConstraints | None,
+    initial_guess: np.typing.NDArray[np.float64] | None,
+) -> np.typing.NDArray[np.float64]:
+    # imported here, as the robust module builds on this one
+    from bimorph_mirror_analysis.robust import robust_least_squares
+
+    return robust_least_squares(interaction_matrix, desired_corrections)[0]
+
+
+def estimate_condition_number(
+    interaction_matrix: np.typing.NDArray[np.float64],
+) -> float:
+    """Estimate the condition number of an interaction matrix cheaply.
+
+    The columns are scaled to unit norm, so the column of ones does not dominate,
+    and the ratio of the largest to the smallest diagonal entry of R from a pivoted
+    QR decomposition is used as the estimate.
 
     Args:
-        voltages: The voltages to check.
-        voltage_range: The minimum and maximum values a voltage can take.
-        max_consecutive_voltage_difference: The maximum voltage difference between two
-            consecutive actuators on the bimorph mirror.
+        interaction_matrix: The interaction matrix, as returned by\
+ process_pencil_beam_scans
 
     Returns:
-        A boolean indicating if the voltages fit the constraints.
+        The estimated condition number, inf if the matrix is rank deficient.
+    """
+    norms = np.linalg.norm(interaction_matrix, axis=0)
+    norms[norms == 0] = 1.0
+    r = linalg.qr(interaction_matrix / norms, mode="r", pivoting=True)[0]  # type: ignore
+    diagonal = np.abs(np.diag(r))  # type: ignore
+    if np.min(diagonal) == 0:
+        return float("inf")
+    return float(np.max(diagonal) / np.min(diagonal))
+
+
+def load_solver_timings() -> list[dict[str, Any]]:
+    """Load the solver timings bundled with the package.
+
+    The timings are written by benchmarks/solvers.py, and are used by the auto
+    policy of select_solver.
+
+    Returns:
+        A list of benchmark cases, each with the number of slit positions, the number
+        of actuators and the time taken by each solver.
     """
-    # just check highest and lowest voltages
-    within_max_and_min = (
-        min(voltages) >= voltage_range[0] and max(voltages) <= voltage_range[1]
+    timings = resources.files("bimorph_mirror_analysis") / "solver_timings.json"
+    return json.loads(timings.read_text())["results"]
+
+
+def select_solver(
+    num_slit_positions: int,
+    num_actuators: int,
+    constrained: bool,
+    condition_number: float = 1.0,
+    timings: list[dict[str, Any]] | None = None,
+) -> str:
+    """Choose the fastest suitable solver for a problem, from benchmark timings.
+
+    The timings of the benchmark case closest in size, on a log scale, are used.
+    Ill-conditioned problems are regularised when unrestrained, and solved by SLSQP
+    when restrained, as the qp solver needs a full rank interaction matrix.
+
+    Args:
+        num_slit_positions: The number of slit positions
+        num_actuators: The number of actuators
+        constrained: Whether the solver must respect the constraints
+        condition_number: The condition number of the interaction matrix, as from\
+ estimate_condition_number
+        timings: The benchmark timings, those bundled with the package if not\
+ supplied
+
+    Returns:
+        The name of the chosen solver.
+    """
+    ill_conditioned = condition_number > _ILL_CONDITIONED
+    if ill_conditioned:
+        return "slsqp" if constrained else "regularized"
+    candidates = ("qp", "slsqp") if constrained else ("pinv", "lstsq", "sparse")
+
+    if timings is None:
+        timings = load_solver_timings()
+    size = np.log([num_slit_positions, num_actuators])
+    distances = [
+        np.linalg.norm(
+            np.log([case["num_slit_positions"], case["num_actuators"]]) - size
+        )
+        for case in timings
+    ]
+    case_times: dict[str, float | None] = timings[int(np.argmin(distances))]["times"]
+    known = [name for name in candidates if case_times.get(name) is not None]
+    if not known:
+        return candidates[0]
+    return min(known, key=lambda name: case_times[name])  # type: ignore
+
+
+def solve_voltage_corrections(
+    data: ScanData,
+    voltage_increment: float,
+    initial_voltages: np.typing.NDArray[np.float64] | None = None,
+    voltage_range: tuple[int, int] | None = None,
+    max_consecutive_voltage_difference: int | None = None,
+    solver: str = "auto",
+    baseline_voltage_scan: int = 0,
+    initial_guess: np.typing.NDArray[np.float64] | None = None,
+    weights: np.typing.NDArray[np.float64] | None = None,
+) -> SolverResult:
+    """Calculate voltage corrections with a registered solver backend.
+
+    With the "auto" policy, the fastest suitable unrestrained solver is run first,
+    and if its solution does not fit the constraints, the fastest suitable
+    restrained solver is run, chosen by select_solver. A named solver is run
+    as is, even if it ignores the constraints, and whether its solution fits them is
+    reported.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        initial_voltages: The initial voltages of the actuators in the baseline scan,\
+ needed with constraints
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference between two\
+ consecutive actuators on the bimorph mirror
+        solver: "auto", or the name of a solver in SOLVERS
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        initial_guess: The voltage corrections to start iterative solvers from
+        weights: The weight of each slit position in the least squares fit
+
+    Returns:
+        The voltage corrections, the name of the solver which found them, the time
+        the solvers took in seconds and whether the corrections fit the constraints,
+        None if no constraints were given.
+    """
+    data = centroid_matrix(data)
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+    if solver != "auto" and solver not in SOLVERS:
+        raise ValueError(
+            f"solver must be auto or one of {', '.join(SOLVERS)}, got {solver!r}"
+        )
+    constraints: SolverConstraints | None = None
+    if voltage_range is not None and max_consecutive_voltage_difference is not None:
+        if initial_voltages is None:
+            raise ValueError("initial_voltages are needed with constraints")
+        constraints = {
+            "initial_voltages": initial_voltages,
+            "voltage_range": voltage_range,
+            "max_consecutive_voltage_difference": max_consecutive_voltage_difference,
+        }
+    elif solver != "auto" and SOLVERS[solver]["constrained"]:
+        raise ValueError(f"The {solver} solver needs constraints")
+
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        data, voltage_increment, baseline_voltage_scan
     )
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
 
-    diffs = np.diff(voltages)
-    within_max_diff = np.all(diffs <= max_consecutive_voltage_difference)
+    def fits(solution: np.typing.NDArray[np.float64]) -> bool | None:
+        if constraints is None:
+            return None
+        # allow for the rounding error of solvers which stop on the constraints
+        return bool(
+            voltages_fit_constraints(
+                constraints["initial_voltages"] + solution[1:],
+                constraints["voltage_range"],
+                constraints["max_consecutive_voltage_difference"],
+                tolerance=1e-6,
+            )
+        )
 
-    # bool required as np.all returns np.bool
-    return bool(within_max_and_min and within_max_diff)
+    with profile_stage("solve_voltage_corrections") as details:
+        start = time.perf_counter()
+        if solver == "auto":
+            num_rows, num_cols = interaction_matrix.shape
+            condition_number = estimate_condition_number(interaction_matrix)
+            details["condition_number"] = condition_number
+            solver = select_solver(num_rows, num_cols - 1, False, condition_number)
+            solution = SOLVERS[solver]["solve"](
+                interaction_matrix, desired_corrections, None, None
+            )
+            if constraints is not None and not fits(solution):
+                solver = select_solver(num_rows, num_cols - 1, True, condition_number)
+                solution = SOLVERS[solver]["solve"](
+                    interaction_matrix, desired_corrections, constraints, initial_guess
+                )
+        else:
+            solution = SOLVERS[solver]["solve"](
+                interaction_matrix, desired_corrections, constraints, initial_guess
+            )
+        elapsed = time.perf_counter() - start
+        details["solver"] = solver
+
+    return {
+        "corrections": np.round(solution[1:], decimals=2),
+        "solver": solver,
+        "elapsed": elapsed,
+        "fits_constraints": fits(solution),
+    }
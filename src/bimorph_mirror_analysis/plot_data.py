@@ -0,0 +1,115 @@
+import json
+from typing import Any, TypedDict
+
+import numpy as np
+
+from bimorph_mirror_analysis import __version__
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+
+# the version of the layout of the arrays in a plot-data bundle
+BUNDLE_FORMAT = 1
+
+
+class PlotData(TypedDict):
+    scan_slit_positions: np.typing.NDArray[np.float64]
+    scan_centroids: np.typing.NDArray[np.float64]
+    scan_ids: np.typing.NDArray[np.int64]
+    slit_positions: np.typing.NDArray[np.float64]
+    interaction_matrix: np.typing.NDArray[np.float64]
+    baseline_centroids: np.typing.NDArray[np.float64]
+    unrestrained_predicted_centroids: np.typing.NDArray[np.float64]
+    restrained_predicted_centroids: np.typing.NDArray[np.float64]
+    labels: dict[str, Any]
+
+
+_ARRAYS = (
+    "scan_slit_positions",
+    "scan_centroids",
+    "scan_ids",
+    "slit_positions",
+    "interaction_matrix",
+    "baseline_centroids",
+    "unrestrained_predicted_centroids",
+    "restrained_predicted_centroids",
+)
+
+
+def collect_plot_data(
+    analysis: BimorphAnalysis,
+    restrained_voltage_corrections: np.typing.NDArray[np.float64],
+) -> PlotData:
+    """Gather everything the plots of an analysis draw, without drawing anything.
+
+    Args:
+        analysis: The analysis session
+        restrained_voltage_corrections: The voltage corrections to predict the\
+ restrained mirror surface for
+
+    Returns:
+        The pencil beam scans, the interaction matrix, the baseline centroids and the
+        predicted centroids with the unrestrained and the restrained corrections, and
+        labels describing the analysis.
+    """
+    scans = analysis.scans
+    return {
+        "scan_slit_positions": scans.slit_positions,
+        "scan_centroids": scans.centroids,
+        "scan_ids": scans.scan_ids,
+        "slit_positions": analysis.slit_positions,
+        "interaction_matrix": analysis.interaction_matrix,
+        "baseline_centroids": analysis.baseline_centroids,
+        "unrestrained_predicted_centroids": analysis.predicted_centroids(
+            analysis.unrestrained_voltage_corrections
+        ),
+        "restrained_predicted_centroids": analysis.predicted_centroids(
+            restrained_voltage_corrections
+        ),
+        "labels": {
+            "source_file": analysis.file_path,
+            "version": __version__,
+            "voltage_range": analysis.voltage_range,
+            "max_consecutive_voltage_difference": (
+                analysis.max_consecutive_voltage_difference
+            ),
+            "baseline_voltage_scan": analysis.baseline_voltage_scan,
+        },
+    }
+
+
+def save_plot_data(plot_data: PlotData, file_path: str):
+    """Save plot data to a single compressed bundle, which render_plots can draw.
+
+    The bundle is a .npz file, so it can be read with numpy alone, without
+    this package or matplotlib. The labels are stored in it as json.
+
+    Args:
+        plot_data: The plot data, as returned by collect_plot_data
+        file_path: The path to save the bundle to
+    """
+    labels = {"bundle_format": BUNDLE_FORMAT} | plot_data["labels"]
+    with open(file_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            labels=np.array(json.dumps(labels)),
+            **{name: plot_data[name] for name in _ARRAYS},  # type: ignore
+        )
+
+
+def load_plot_data(file_path: str) -> PlotData:
+    """Load a plot-data bundle saved by save_plot_data.
+
+    Args:
+        file_path: The path to the bundle
+
+    Returns:
+        The plot data.
+    """
+    with np.load(file_path, allow_pickle=False) as bundle:
+        labels = json.loads(str(bundle["labels"]))
+        if labels.get("bundle_format") != BUNDLE_FORMAT:
+            raise ValueError(
+                f"{file_path} is a plot-data bundle of format\
+ {labels.get('bundle_format')}, but only format {BUNDLE_FORMAT} can be read"
+            )
+        arrays = {name: bundle[name] for name in _ARRAYS}
+    return {**arrays, "labels": labels}  # type: ignore
@@ -2,17 +2,85 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
+from bimorph_mirror_analysis.plot_data import PlotData
+from bimorph_mirror_analysis.profiling import profile_stage
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+
+
+def downsample_min_max(
+    x: np.typing.NDArray[np.float64],
+    y: np.typing.NDArray[np.float64],
+    num_buckets: int,
+) -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
+    """Reduce a line to the minimum and maximum point of each bucket along x.
+
+    The x range is split into num_buckets equal width buckets (normally one per
+    pixel column of the figure) and only the lowest and highest point in each
+    bucket is kept, along with the first and last point of the line. Peaks and
+    edges therefore survive, while the number of points drawn is bounded by
+    2 * num_buckets + 2 regardless of how dense the scan was.
+
+    Args:
+        x: The x values of the line, e.g. the slit positions
+        y: The y values of the line, e.g. the centroid positions
+        num_buckets: The number of buckets to split the x range into
+
+    Returns:
+        A tuple containing the downsampled x and y values, in their original order.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) != len(y):
+        raise ValueError(f"x and y must be the same length, got {len(x)} and {len(y)}")
+    if num_buckets < 1:
+        raise ValueError(f"num_buckets must be at least 1, got {num_buckets}")
+    if len(x) <= 2 * num_buckets + 2:
+        return x, y
+
+    x_min, x_max = np.min(x), np.max(x)
+    if x_max == x_min:
+        buckets = np.zeros(len(x), dtype=np.int64)
+    else:
+        buckets = ((x - x_min) / (x_max - x_min) * num_buckets).astype(np.int64)
+        np.minimum(buckets, num_buckets - 1, out=buckets)
+
+    # sort by bucket, then by y, so the first and last entry of each bucket are its
+    # minimum and maximum
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    starts = np.flatnonzero(np.diff(sorted_buckets, prepend=-1))
+    ends = np.append(starts[1:], len(order)) - 1
+
+    keep = np.unique(np.concatenate((order[starts], order[ends], [0, len(x) - 1])))
+    return x[keep], y[keep]
+
 
 class Plot:
-    def __init__(self):
+    def __init__(self, downsample: bool = False):
         self.fig = plt.figure(figsize=(12, 8))  # type: ignore
         self.ax = self.fig.add_subplot(111)  # type: ignore
         self.ax.spines["top"].set_visible(False)  # type: ignore
         self.ax.spines["right"].set_visible(False)  # type: ignore
+        self.downsample = downsample
 
     def save_plot(self, filename: str):
         self.fig.savefig(filename)  # type: ignore
 
+    def _prepare_line(
+        self,
+        x: np.typing.NDArray[np.float64],
+        y: np.typing.NDArray[np.float64],
+    ) -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
+        """Downsample a line to the pixel width of the axes, if enabled."""
+        if not self.downsample:
+            return x, y
+        width_px = int(self.ax.get_window_extent().width)  # type: ignore
+        return downsample_min_max(
+            np.asarray(x, dtype=np.float64),
+            np.asarray(y, dtype=np.float64),
+            max(width_px, 1),
+        )
+
 
 class InfluenceFunctionPlot(Plot):
     def __init__(
@@ -20,8 +88,9 @@ class InfluenceFunctionPlot(Plot):
         slit_positions: np.typing.NDArray[np.float64],
         centroids: np.typing.NDArray[np.float64],
         actuator_num: int,
+        downsample: bool = False,
     ):
-        super().__init__()
+        super().__init__(downsample)
         self.ax.set_xlabel("Slit position", fontsize=18)  # type: ignore
         self.ax.set_ylabel("Affect on Centroid Position", fontsize=18)  # type: ignore
         self.ax.set_title(  # type: ignore
@@ -34,7 +103,7 @@ class InfluenceFunctionPlot(Plot):
             linestyle=":",
             alpha=0.6,
         )
-        self.ax.plot(slit_positions, centroids)  # type: ignore
+        self.ax.plot(*self._prepare_line(slit_positions, centroids))  # type: ignore
 
 
 class MirrorSurfacePlot(Plot):
@@ -44,34 +113,124 @@ class MirrorSurfacePlot(Plot):
         baseline_centroids: np.typing.NDArray[np.float64],
         unrestrained_predicted_centroids: np.typing.NDArray[np.float64] | None = None,
         restrained_predicted_centroids: np.typing.NDArray[np.float64] | None = None,
+        downsample: bool = False,
     ):
-        super().__init__()
+        super().__init__(downsample)
         self.ax.set_xlabel("Slit position", fontsize=18)  # type: ignore
         self.ax.set_ylabel("Centroid position", fontsize=18)  # type: ignore
         self.ax.set_title("Mirror Surface Plot", fontsize=24, pad=30)  # type: ignore
-        self.ax.plot(slit_positions, baseline_centroids, label="Baseline")  # type: ignore
+        self.ax.plot(  # type: ignore
+            *self._prepare_line(slit_positions, baseline_centroids), label="Baseline"
+        )
         if unrestrained_predicted_centroids is not None:
             self.ax.plot(  # type: ignore
-                slit_positions,
-                unrestrained_predicted_centroids,
+                *self._prepare_line(slit_positions, unrestrained_predicted_centroids),
                 label="Predicted, unrestrained",
             )
         if restrained_predicted_centroids is not None:
             self.ax.plot(  # type: ignore
-                slit_positions,
-                restrained_predicted_centroids,
+                *self._prepare_line(slit_positions, restrained_predicted_centroids),
                 label="Predicted, restrained",
             )
         self.ax.legend()  # type: ignore
 
 
 class PencilBeamScanPlot(Plot):
-    def __init__(self, pivoted_df: pd.DataFrame, scan_num: int):
-        super().__init__()
+    def __init__(
+        self,
+        scans: ScanMatrix | pd.DataFrame,
+        scan_num: int,
+        downsample: bool = False,
+    ):
+        super().__init__(downsample)
+        if isinstance(scans, pd.DataFrame):
+            scans = ScanMatrix.from_dataframe(scans)
         self.ax.set_xlabel("Slit position", fontsize=18)  # type: ignore
         self.ax.set_ylabel("Centroid position", fontsize=18)  # type: ignore
         self.ax.set_title(f"Beamline Scan {scan_num}", fontsize=24, pad=30)  # type: ignore
         self.ax.plot(  # type: ignore
-            pivoted_df["slit_position_x"],  # type: ignore
-            pivoted_df[f"pencil_beam_scan_{scan_num}"],  # type: ignore
+            *self._prepare_line(scans.slit_positions, scans.scan(scan_num))
+        )
+
+
+class ParetoFrontPlot(Plot):
+    def __init__(self, sweep: pd.DataFrame):
+        super().__init__()
+        self.ax.set_xlabel("Max consecutive voltage difference", fontsize=18)  # type: ignore
+        self.ax.set_ylabel("Residual", fontsize=18)  # type: ignore
+        self.ax.set_title("Constraint Sweep", fontsize=24, pad=30)  # type: ignore
+        for (voltage_min, voltage_max), settings in sweep.groupby(  # type: ignore
+            ["voltage_range_min", "voltage_range_max"]
+        ):
+            settings = settings.sort_values("max_consecutive_voltage_difference")  # type: ignore
+            self.ax.plot(  # type: ignore
+                settings["max_consecutive_voltage_difference"],
+                settings["residual"],
+                marker="o",
+                label=f"Voltage range {voltage_min} to {voltage_max}",
+            )
+        pareto = sweep[sweep["pareto"]]
+        self.ax.scatter(  # type: ignore
+            pareto["max_consecutive_voltage_difference"],
+            pareto["residual"],
+            s=150,
+            facecolors="none",
+            edgecolors="black",
+            label="Pareto front",
+            zorder=3,
+        )
+        self.ax.legend()  # type: ignore
+
+
+def render_plots(
+    plot_data: PlotData, output_dir: str, downsample: bool = False
+) -> list[str]:
+    """Draw the pencil beam scan, influence function and mirror surface plots.
+
+    Only the plot data is needed, so the plots can be drawn after the analysis, in
+    another process or on another machine, from a bundle saved by save_plot_data.
+
+    Args:
+        plot_data: The plot data, as returned by collect_plot_data or load_plot_data
+        output_dir: The directory to save the plots to, ending in a slash
+        downsample: Whether to downsample dense scans to the pixel width of the\
+ figure
+
+    Returns:
+        The paths of the saved plots.
+    """
+    paths: list[str] = []
+    scans = ScanMatrix(
+        plot_data["scan_slit_positions"],
+        plot_data["scan_centroids"],
+        plot_data["scan_ids"],
+    )
+    with profile_stage("plot_pencil_beam_scans"):
+        for i in scans.scan_ids:
+            plot = PencilBeamScanPlot(scans, int(i), downsample=downsample)
+            paths.append(output_dir + "pencil_beam_scan_" + str(i) + ".png")
+            plot.save_plot(paths[-1])
+
+    interaction_matrix = plot_data["interaction_matrix"]
+    with profile_stage("plot_influence_functions"):
+        for actuator_num in range(interaction_matrix.shape[1]):
+            plot = InfluenceFunctionPlot(
+                plot_data["slit_positions"],
+                interaction_matrix[:, actuator_num],
+                actuator_num,
+                downsample=downsample,
+            )
+            paths.append(output_dir + f"actuator_{actuator_num}_influence_function.png")
+            plot.save_plot(paths[-1])
+
+    with profile_stage("plot_mirror_surface"):
+        plot = MirrorSurfacePlot(
+            plot_data["slit_positions"],
+            plot_data["baseline_centroids"],
+            plot_data["unrestrained_predicted_centroids"],
+            plot_data["restrained_predicted_centroids"],
+            downsample=downsample,
         )
+        paths.append(output_dir + "mirror_surface_plot.png")
+        plot.save_plot(paths[-1])
+    return paths
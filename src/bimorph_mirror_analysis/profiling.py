@@ -0,0 +1,160 @@
+import json
+import time
+import tracemalloc
+from collections.abc import Generator
+from contextlib import contextmanager
+from typing import Any, TypedDict
+
+
+class StageRecord(TypedDict):
+    name: str
+    depth: int
+    start_time: float
+    wall_time: float
+    peak_memory: int
+    details: dict[str, Any]
+
+
+class _Frame(TypedDict):
+    start_memory: int
+    peak_memory: int
+
+
+class Profiler:
+    """Records the wall time and peak memory allocation of each analysis stage.
+
+    Stages are recorded in the order they finish, and may be nested. Memory is
+    measured with tracemalloc, so only allocations made while profiling are counted.
+    """
+
+    def __init__(self):
+        self.records: list[StageRecord] = []
+        self._frames: list[_Frame] = []
+        self._created = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[dict[str, Any], None, None]:
+        """Time a stage of the analysis.
+
+        Args:
+            name: The name of the stage
+
+        Yields:
+            A dictionary the stage can add details to, such as iteration counts.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if self._frames:
+            # resetting the peak below would lose the parent's peak so far
+            parent = self._frames[-1]
+            parent["peak_memory"] = max(parent["peak_memory"], peak)
+        tracemalloc.reset_peak()
+        frame: _Frame = {"start_memory": current, "peak_memory": current}
+        depth = len(self._frames)
+        self._frames.append(frame)
+        details: dict[str, Any] = {}
+        start = time.perf_counter()
+        try:
+            yield details
+        finally:
+            wall_time = time.perf_counter() - start
+            self._frames.pop()
+            peak = max(frame["peak_memory"], tracemalloc.get_traced_memory()[1])
+            if self._frames:
+                parent = self._frames[-1]
+                parent["peak_memory"] = max(parent["peak_memory"], peak)
+            self.records.append(
+                {
+                    "name": name,
+                    "depth": depth,
+                    "start_time": start - self._created,
+                    "wall_time": wall_time,
+                    "peak_memory": peak - frame["start_memory"],
+                    "details": details,
+                }
+            )
+
+    def summary(self) -> str:
+        """Format the recorded stages as a table, with nested stages indented."""
+        rows = [
+            (
+                "  " * record["depth"] + record["name"],
+                f"{record['wall_time'] * 1000:.1f}",
+                f"{record['peak_memory'] / 1024:.1f}",
+                ", ".join(f"{k}={v}" for k, v in record["details"].items()),
+            )
+            for record in self._records_in_start_order()
+        ]
+        header = ("stage", "time (ms)", "peak memory (KiB)", "details")
+        widths = [max(len(row[i]) for row in [header, *rows]) for i in range(3)]
+        lines = [
+            "  ".join(
+                [
+                    row[0].ljust(widths[0]),
+                    row[1].rjust(widths[1]),
+                    row[2].rjust(widths[2]),
+                    row[3],
+                ]
+            ).rstrip()
+            for row in [header, *rows]
+        ]
+        return "\n".join(lines)
+
+    def write_json(self, file_path: str):
+        """Write the recorded stages to a json file.
+
+        Args:
+            file_path: The path to write the trace to
+        """
+        with open(file_path, "w") as f:
+            json.dump({"stages": self._records_in_start_order()}, f, indent=2)
+
+    def _records_in_start_order(self) -> list[StageRecord]:
+        # records are appended as stages finish, so a parent comes after its children
+        return sorted(self.records, key=lambda r: (r["start_time"], r["depth"]))
+
+
+_active_profiler: Profiler | None = None
+
+
+@contextmanager
+def _no_stage() -> Generator[dict[str, Any], None, None]:
+    yield {}
+
+
+def profile_stage(name: str):
+    """Time a stage of the analysis if profiling is enabled, otherwise do nothing.
+
+    Args:
+        name: The name of the stage
+    """
+    if _active_profiler is None:
+        return _no_stage()
+    return _active_profiler.stage(name)
+
+
+@contextmanager
+def profiling(enabled: bool = True) -> Generator[Profiler | None, None, None]:
+    """Enable profiling of every analysis stage run within the context.
+
+    Args:
+        enabled: Whether to profile. If False, nothing is recorded and None is
+            yielded.
+
+    Yields:
+        The profiler recording the stages, or None if profiling is disabled.
+    """
+    global _active_profiler
+    if not enabled:
+        yield None
+        return
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    previous, _active_profiler = _active_profiler, Profiler()
+    try:
+        yield _active_profiler
+    finally:
+        _active_profiler = previous
+        if not was_tracing:
+            tracemalloc.stop()
@@ -0,0 +1,303 @@
+import math
+import time
+from typing import TypedDict
+
+import numpy as np
+from scipy.linalg import qr
+from scipy.optimize import nnls
+
+from bimorph_mirror_analysis.maths import (
+    SOLVERS,
+    SolverConstraints,
+    process_pencil_beam_scans,
+    weight_rows,
+)
+from bimorph_mirror_analysis.profiling import profile_stage
+
+
+class QuantizedVoltages(TypedDict):
+    voltages: np.typing.NDArray[np.float64]
+    corrections: np.typing.NDArray[np.float64]
+    residual: float
+    continuous_residual: float
+    optimal: bool
+    nodes: int
+
+
+class _Search:
+    """Depth-first branch and bound over the voltage grid, fixing the actuators from
+    the last to the first, as in sphere decoding.
+
+    About the continuous optimum v*, the squared error of voltages v which fit the
+    constraints is exactly
+
+        f(v) = f(v*) + |R (v - v*)|^2 + sum_k l_k c_k(v) + g (v - v*)
+
+    where R is triangular from the QR factorisation of the interaction matrix, c_k
+    are the slacks of the constraints active at v*, l_k >= 0 their Lagrange
+    multipliers and g the small part of the gradient at v* they do not account for.
+    Row i of R and the slacks involving actuator i only depend on the actuators from
+    i upwards, so each is known once actuator i is fixed and, being non-negative,
+    their sum over the fixed actuators bounds the error of every completion from
+    below. The neighbour difference limit only involves the actuator fixed just
+    before, so every leaf reached fits the constraints.
+    """
+
+    def __init__(
+        self,
+        r: np.typing.NDArray[np.float64],
+        optimum: np.typing.NDArray[np.float64],
+        gradient: np.typing.NDArray[np.float64],
+        voltage_range: tuple[int, int],
+        max_consecutive_voltage_difference: int,
+        voltage_step: float,
+        deadline: float,
+    ):
+        self.r = r
+        self.optimum = optimum
+        self.step = voltage_step
+        self.voltage_range = voltage_range
+        self.max_diff = max_consecutive_voltage_difference
+        self.lowest = math.ceil(voltage_range[0] / voltage_step - 1e-9)
+        self.highest = math.floor(voltage_range[1] / voltage_step + 1e-9)
+        # the most grid steps two neighbours may differ by
+        self.max_diff_steps = math.floor(
+            max_consecutive_voltage_difference / voltage_step + 1e-9
+        )
+        self.deadline = deadline
+        self.num_actuators = len(optimum)
+        self._split_gradient(gradient)
+
+        self.best_cost = math.inf
+        self.best_steps = np.zeros(self.num_actuators, dtype=np.int64)
+        self.steps = np.zeros(self.num_actuators, dtype=np.int64)
+        self.nodes = 0
+        self.timed_out = False
+
+    def _split_gradient(self, gradient: np.typing.NDArray[np.float64]):
+        # the constraints are the slacks above the minimum voltage, below the maximum
+        # voltage, and within the falling and rising difference to the next actuator
+        n = self.num_actuators
+        identity = np.eye(n)
+        rising = np.diff(identity, axis=0)
+        rates = np.vstack((identity, -identity, rising, -rising))
+        optimum_rising = np.diff(self.optimum)
+        slacks = np.concatenate(
+            (
+                self.optimum - self.voltage_range[0],
+                self.voltage_range[1] - self.optimum,
+                self.max_diff + optimum_rising,
+                self.max_diff - optimum_rising,
+            )
+        )
+        active = slacks <= 1e-6 * max(1.0, float(np.max(np.abs(self.optimum))))
+        multipliers = np.zeros(len(rates))
+        if np.any(active):
+            multipliers[active], _ = nnls(rates[active].T, gradient)  # type: ignore
+        self.multipliers = np.split(multipliers, [n, 2 * n, 3 * n - 1])
+        self.remainder = gradient - rates.T @ multipliers
+        # the lowest the remainder terms of the actuators below each can add up to
+        width = self.voltage_range[1] - self.voltage_range[0]
+        self.remainder_floor = -width * np.concatenate(
+            ([0.0], np.cumsum(np.abs(self.remainder))[:-1])
+        )
+
+    def increments(
+        self, i: int, candidates: np.typing.NDArray[np.int64]
+    ) -> np.typing.NDArray[np.float64]:
+        """The terms of the error fixed by setting actuator i to each candidate."""
+        voltages = candidates * self.step
+        offsets = self.steps[i + 1 :] * self.step - self.optimum[i + 1 :]
+        row = self.r[i, i] * (voltages - self.optimum[i]) + self.r[i, i + 1 :] @ offsets
+        cost = row**2 + self.remainder[i] * (voltages - self.optimum[i])
+        cost += self.multipliers[0][i] * (voltages - self.voltage_range[0])
+        cost += self.multipliers[1][i] * (self.voltage_range[1] - voltages)
+        if i < self.num_actuators - 1:
+            rising = self.steps[i + 1] * self.step - voltages
+            cost += self.multipliers[2][i] * (self.max_diff + rising)
+            cost += self.multipliers[3][i] * (self.max_diff - rising)
+        return cost
+
+    def _interval(self, i: int) -> tuple[int, int]:
+        if i == self.num_actuators - 1:
+            return self.lowest, self.highest
+        return (
+            max(self.lowest, int(self.steps[i + 1]) - self.max_diff_steps),
+            min(self.highest, int(self.steps[i + 1]) + self.max_diff_steps),
+        )
+
+    def seed(self):
+        """Round the continuous optimum onto the grid, keeping within the
+        constraints, and use it as the first bound."""
+        cost = 0.0
+        for i in reversed(range(self.num_actuators)):
+            lowest, highest = self._interval(i)
+            if lowest > highest:
+                return
+            step = min(max(round(self.optimum[i] / self.step), lowest), highest)
+            cost += float(self.increments(i, np.array([step]))[0])
+            self.steps[i] = step
+        self.best_cost = cost
+        self.best_steps = self.steps.copy()
+
+    def search(self, i: int, partial_cost: float):
+        self.nodes += 1
+        if time.perf_counter() > self.deadline:
+            self.timed_out = True
+            return
+        if i < 0:
+            if partial_cost < self.best_cost:
+                self.best_cost = partial_cost
+                self.best_steps = self.steps.copy()
+            return
+
+        lowest, highest = self._interval(i)
+        budget = self.best_cost - partial_cost - self.remainder_floor[i]
+        if math.isfinite(budget):
+            # the multiplier terms are never negative, so only the row and remainder
+            # terms can keep a candidate within the budget
+            width = self.voltage_range[1] - self.voltage_range[0]
+            budget += abs(self.remainder[i]) * width
+            offsets = self.steps[i + 1 :] * self.step - self.optimum[i + 1 :]
+            pivot = self.r[i, i]
+            centre = self.optimum[i] - (self.r[i, i + 1 :] @ offsets) / pivot
+            radius = math.sqrt(max(budget, 0.0)) / abs(pivot)
+            lowest = max(lowest, math.ceil((centre - radius) / self.step))
+            highest = min(highest, math.floor((centre + radius) / self.step))
+        if lowest > highest:
+            return
+
+        # visit the cheapest candidates first, so good leaves are found early and
+        # tighten the bound for the rest of the search
+        candidates = np.arange(lowest, highest + 1)
+        costs = partial_cost + self.increments(i, candidates)
+        order = np.argsort(costs, kind="stable")
+        for step, cost in zip(candidates[order], costs[order], strict=True):
+            if cost + self.remainder_floor[i] >= self.best_cost:
+                break
+            self.steps[i] = step
+            self.search(i - 1, float(cost))
+            if self.timed_out:
+                return
+
+
+def find_quantized_voltage_corrections(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    initial_voltages: np.typing.NDArray[np.float64],
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    voltage_step: float,
+    baseline_voltage_scan: int = 0,
+    time_limit: float = 1.0,
+    weights: np.typing.NDArray[np.float64] | None = None,
+) -> QuantizedVoltages:
+    """Find the best voltages the power supplies can set, which fit the constraints.
+
+    Rounding continuous voltages to the resolution of the power supplies can push
+    neighbouring actuators past the maximum difference, and is not the best grid
+    point. Here the voltages are searched for directly on the grid of multiples of
+    voltage_step, by a branch and bound search about the exact continuous restrained
+    solution, seeded with that solution rounded onto the grid. Every answer fits the
+    constraints exactly, and if the search finishes within the time limit it is the
+    best on the grid. A ValueError is raised if no voltages on the grid fit the
+    constraints, and a TimeoutError if the time limit is reached before any are
+    found.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        initial_voltages: The initial voltages of the actuators in the baseline scan
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference between two\
+ consecutive actuators on the bimorph mirror
+        voltage_step: The resolution of the power supplies. The voltages returned\
+ are multiples of it.
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        time_limit: The number of seconds after which the best voltages found so far\
+ are returned
+        weights: The weight of each slit position in the least squares fit
+
+    Returns:
+        The quantized voltages and corrections, the RMS residual of the predicted
+        centroids with them and with the continuous solution, whether the search
+        finished and so the voltages are the best on the grid, and the number of
+        nodes searched.
+    """
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+    if voltage_step <= 0:
+        raise ValueError(f"voltage_step must be positive, got {voltage_step}")
+    initial_voltages = np.asarray(initial_voltages, dtype=np.float64)
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        data, voltage_increment, baseline_voltage_scan
+    )
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
+    constraints: SolverConstraints = {
+        "initial_voltages": initial_voltages,
+        "voltage_range": voltage_range,
+        "max_consecutive_voltage_difference": max_consecutive_voltage_difference,
+    }
+    # the exact restrained solution, which also checks the interaction matrix has
+    # full rank and that the constraints can be met
+    continuous = SOLVERS["qp"]["solve"](
+        interaction_matrix, desired_corrections, constraints, None
+    )[1:]
+
+    # the constant term is not quantized, so it is removed by centring
+    responses = interaction_matrix[:, 1:]
+    centred_corrections = desired_corrections - np.mean(desired_corrections)
+    q, r = qr(responses - np.mean(responses, axis=0), mode="economic")  # type: ignore
+    b = q.T @ centred_corrections  # type: ignore
+    # the part of the error no corrections can remove
+    floor = float(np.sum(centred_corrections**2) - np.sum(b**2))  # type: ignore
+    num_rows = len(desired_corrections)
+
+    def residual(corrections: np.typing.NDArray[np.float64]) -> float:
+        error = np.sum((r @ corrections - b) ** 2) + floor  # type: ignore
+        return float(np.sqrt(max(error, 0.0) / num_rows))
+
+    with profile_stage("find_quantized_voltage_corrections") as details:
+        search = _Search(
+            r,  # type: ignore
+            initial_voltages + continuous,
+            2 * r.T @ (r @ continuous - b),  # type: ignore
+            voltage_range,
+            max_consecutive_voltage_difference,
+            voltage_step,
+            time.perf_counter() + time_limit,
+        )
+        search.seed()
+        search.search(len(initial_voltages) - 1, 0.0)
+        details["nodes"] = search.nodes
+        details["optimal"] = not search.timed_out
+
+    if not math.isfinite(search.best_cost):
+        # without a leaf, the grid is only proven to have no voltages which fit the
+        # constraints if the search was not cut short
+        if search.timed_out:
+            raise TimeoutError(
+                f"The search stopped after {time_limit} s before any voltages on a\
+ grid of {voltage_step} which fit the constraints were found"
+            )
+        raise ValueError(f"No voltages on a grid of {voltage_step} fit the constraints")
+    voltages = (search.best_steps * voltage_step).astype(np.float64)
+    corrections = voltages - initial_voltages
+    return {
+        "voltages": voltages,
+        "corrections": corrections,
+        "residual": residual(corrections),
+        "continuous_residual": residual(continuous),
+        "optimal": not search.timed_out,
+        "nodes": search.nodes,
+    }
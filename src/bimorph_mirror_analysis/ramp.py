@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from bimorph_mirror_analysis.constraints import voltages_fit_constraints
+from bimorph_mirror_analysis.profiling import profile_stage
+
+
+def plan_voltage_ramp(
+    initial_voltages: np.typing.NDArray[np.float64],
+    target_voltages: np.typing.NDArray[np.float64],
+    voltage_range: tuple[int, int],
+    max_consecutive_voltage_difference: int,
+    max_step: float,
+) -> np.typing.NDArray[np.float64]:
+    """Plan the voltages to step through to ramp the actuators to the target.
+
+    The voltages which fit the constraints form a convex set, so every state on the
+    straight line between two states which fit them also fits them. The actuators
+    are therefore all moved together in equal steps, and the number of steps is the
+    fewest which keeps the change of every actuator within max_step, set by the
+    actuator which has furthest to move. Every state of the ramp is checked against
+    the constraints with a single vectorized check before it is returned.
+
+    Args:
+        initial_voltages: The current voltages of the actuators
+        target_voltages: The voltages to ramp the actuators to
+        voltage_range: The minimum and maximum values a voltage can take
+        max_consecutive_voltage_difference: The maximum voltage difference between\
+ two consecutive actuators on the bimorph mirror
+        max_step: The largest change in the voltage of any actuator in one step
+
+    Returns:
+        A matrix with a row of actuator voltages for each state of the ramp, starting
+        with the initial voltages and ending with the target voltages.
+    """
+    initial_voltages = np.asarray(initial_voltages, dtype=np.float64)
+    target_voltages = np.asarray(target_voltages, dtype=np.float64)
+    if initial_voltages.shape != target_voltages.shape:
+        raise ValueError(
+            f"There are {len(initial_voltages)} initial voltages but\
+ {len(target_voltages)} target voltages"
+        )
+    if max_step <= 0:
+        raise ValueError(f"max_step must be positive, got {max_step}")
+    endpoints = voltages_fit_constraints(
+        np.vstack((initial_voltages, target_voltages)),
+        voltage_range,
+        max_consecutive_voltage_difference,
+    )
+    if not endpoints[0]:
+        raise ValueError(
+            "The initial voltages do not fit the constraints, so no safe ramp exists"
+        )
+    if not endpoints[1]:
+        raise ValueError("The target voltages do not fit the constraints")
+
+    with profile_stage("plan_voltage_ramp") as details:
+        change = target_voltages - initial_voltages
+        num_steps = max(int(np.ceil(np.max(np.abs(change), initial=0) / max_step)), 1)
+        fractions = np.arange(num_steps + 1) / num_steps
+        ramp = initial_voltages + fractions[:, np.newaxis] * change
+        # the end of the ramp is set exactly, without rounding error
+        ramp[-1] = target_voltages
+        details["num_steps"] = num_steps
+
+        # allow for rounding error in the steps of actuators at their limits
+        if not np.all(
+            voltages_fit_constraints(
+                ramp, voltage_range, max_consecutive_voltage_difference, tolerance=1e-9
+            )
+        ):
+            raise ValueError("The planned ramp does not fit the constraints")
+    return ramp
+
+
+def save_voltage_ramp(ramp: np.typing.NDArray[np.float64], file_path: str):
+    """Save a ramp as a csv file, with a row for each step and a column per actuator.
+
+    Args:
+        ramp: The ramp, as returned by plan_voltage_ramp
+        file_path: The path to save the csv file to
+    """
+    table = pd.DataFrame(
+        ramp,
+        columns=[f"voltage_channel_{i + 1}" for i in range(ramp.shape[1])],
+    )
+    table.index.name = "step"
+    table.to_csv(file_path)
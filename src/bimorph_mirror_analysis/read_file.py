@@ -1,6 +1,9 @@
 import numpy as np
 import pandas as pd
 
+from bimorph_mirror_analysis.profiling import profile_stage
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+
 
 def read_bluesky_plan_output(
     filepath: str,
@@ -19,8 +22,95 @@ def read_bluesky_plan_output(
         A tuple containing the DataFrame, the initial voltages array and the voltage
         incrememnt.
     """
-    data = pd.read_csv(filepath)  # type: ignore
-    data = data.apply(pd.to_numeric, errors="coerce")  # type: ignore
+    scans, initial_voltages, voltage_increment = read_scan_matrix(
+        filepath, baseline_voltage_scan_index
+    )
+    return scans.to_dataframe(), initial_voltages, voltage_increment
+
+
+def read_bluesky_plan_output_with_statistics(
+    filepath: str,
+    baseline_voltage_scan_index: int = 0,
+) -> tuple[
+    pd.DataFrame, np.typing.NDArray[np.float64], float, pd.DataFrame, pd.DataFrame
+]:
+    """Read the csv file output by the bluesky plan, keeping the spread of repeats
+
+    As read_bluesky_plan_output, but the number of measurements and the sample
+    variance of the centroid at each slit position in each scan are also returned,
+    in DataFrames with the same layout as the pivoted centroids. They are found in
+    the same grouping pass as the mean centroids.
+
+    Args:
+        filepath: The path to the csv file to be read.
+        baseline_voltage_scan_index: The scan number of the baseline voltage.
+
+    Returns:
+        A tuple containing the DataFrame, the initial voltages array, the voltage
+        incrememnt, the counts DataFrame and the variances DataFrame. A variance is
+        NaN where a slit position was only measured once.
+    """
+    scans, initial_voltages, voltage_increment, counts, variances = (
+        read_scan_matrix_with_statistics(filepath, baseline_voltage_scan_index)
+    )
+    return (
+        scans.to_dataframe(),
+        initial_voltages,
+        voltage_increment,
+        scans.to_dataframe(counts),
+        scans.to_dataframe(variances),
+    )
+
+
+def read_scan_matrix(
+    filepath: str,
+    baseline_voltage_scan_index: int = 0,
+) -> tuple[ScanMatrix, np.typing.NDArray[np.float64], float]:
+    """Read the csv file output by the bluesky plan into a ScanMatrix
+
+    As read_bluesky_plan_output, but the scans are returned as a ScanMatrix, so no
+    DataFrame of the pivoted scans is built.
+
+    Args:
+        filepath: The path to the csv file to be read.
+        baseline_voltage_scan_index: The scan number of the baseline voltage.
+
+    Returns:
+        A tuple containing the scans, the initial voltages array and the voltage
+        incrememnt.
+    """
+    scans, initial_voltages, voltage_increment, _, _ = read_scan_matrix_with_statistics(
+        filepath, baseline_voltage_scan_index
+    )
+    return scans, initial_voltages, voltage_increment
+
+
+def read_scan_matrix_with_statistics(
+    filepath: str,
+    baseline_voltage_scan_index: int = 0,
+) -> tuple[
+    ScanMatrix,
+    np.typing.NDArray[np.float64],
+    float,
+    np.typing.NDArray[np.int64],
+    np.typing.NDArray[np.float64],
+]:
+    """Read the csv file output by the bluesky plan into a ScanMatrix, keeping the
+    spread of repeats
+
+    Args:
+        filepath: The path to the csv file to be read.
+        baseline_voltage_scan_index: The scan number of the baseline voltage.
+
+    Returns:
+        A tuple containing the scans, the initial voltages array, the voltage
+        incrememnt, and matrices of the number of measurements and the sample variance
+        of each centroid, with the same layout as the centroids. A variance is NaN
+        where a slit position was only measured once.
+    """
+    with profile_stage("read_csv"):
+        data = pd.read_csv(filepath)  # type: ignore
+        data = data.apply(pd.to_numeric, errors="coerce")  # type: ignore
 
     voltage_cols = [col for col in data.columns if "voltage" in col]
     if baseline_voltage_scan_index >= 0:
@@ -43,12 +133,61 @@ def read_bluesky_plan_output(
     else:
         voltage_increment = min_diff
 
-    pivoted = pd.pivot_table(  # type: ignore
-        data,
-        values="centroid_position_x",
-        index=["slit_position_x"],
-        columns=["pencil_beam_scan_number"],
+    with profile_stage("pivot"):
+        cells = (
+            data.groupby(["slit_position_x", "pencil_beam_scan_number"])[  # type: ignore
+                "centroid_position_x"
+            ]
+            .agg(["mean", "var", "count"])
+            .unstack("pencil_beam_scan_number")
+        )
+        # scans without any valid centroids are dropped, as pd.pivot_table would
+        scan_ids = cells["count"].columns[cells["count"].sum() > 0]  # type: ignore
+        scan_voltages = (  # type: ignore
+            data.groupby("pencil_beam_scan_number")[voltage_cols].first().loc[scan_ids]  # type: ignore
+        )
+        scans = ScanMatrix(
+            cells.index.to_numpy(dtype=np.float64),  # type: ignore
+            cells["mean"][scan_ids].to_numpy(dtype=np.float64),  # type: ignore
+            scan_ids.to_numpy(),  # type: ignore
+            scan_voltages.to_numpy(dtype=np.float64),  # type: ignore
+        )
+        counts = cells["count"][scan_ids].fillna(0).to_numpy(dtype=np.int64)  # type: ignore
+        variances = cells["var"][scan_ids].to_numpy(dtype=np.float64)  # type: ignore
+    return scans, initial_voltages, voltage_increment, counts, variances  # type: ignore
+
+
+def read_baseline_scan(
+    filepath: str,
+) -> tuple[
+    np.typing.NDArray[np.float64],
+    np.typing.NDArray[np.float64],
+    np.typing.NDArray[np.float64],
+]:
+    """Read a csv file containing a single pencil beam scan
+
+    The file has the same columns as the output of the bluesky plan, but all rows
+    are measured at the same voltages. Repeated measurements at a slit position are
+    averaged.
+
+    Args:
+        filepath: The path to the csv file to be read.
+
+    Returns:
+        A tuple containing the slit positions, the centroid at each slit position and
+        the voltages of the actuators.
+    """
+    data = pd.read_csv(filepath)  # type: ignore
+    data = data.apply(pd.to_numeric, errors="coerce")  # type: ignore
+
+    voltage_cols = [col for col in data.columns if "voltage" in col]
+    voltages = data[voltage_cols].to_numpy(dtype=np.float64)  # type: ignore
+    if not np.all(voltages == voltages[0]):
+        raise ValueError(f"{filepath} contains scans at more than one set of voltages")
+
+    centroids = data.groupby("slit_position_x")["centroid_position_x"].mean()  # type: ignore
+    return (
+        centroids.index.to_numpy(dtype=np.float64),  # type: ignore
+        centroids.to_numpy(dtype=np.float64),  # type: ignore
+        voltages[0],
     )
-    pivoted.columns = ["pencil_beam_scan_" + str(col) for col in pivoted.columns]
-    pivoted.reset_index(inplace=True)
-    return pivoted, initial_voltages, voltage_increment  # type: ignore
@@ -0,0 +1,172 @@
+import numpy as np
+from scipy.linalg import qr, qr_update, solve_triangular
+
+
+class IncrementalRecalibration:
+    """Closed-loop recalibration from single baseline scans.
+
+    Holds the interaction matrix from a full set of pencil beam scans and a QR
+    factorisation of it. After a correction has been applied and a new baseline scan
+    measured, the change in the centroids is compared with the change the matrix
+    predicted. The difference is folded into the matrix with a Broyden rank-one
+    update, and the QR factorisation is updated to match rather than recomputed.
+
+    Args:
+        slit_positions: The slit positions of the pencil beam scans
+        interaction_matrix: The interaction matrix with its leading column of ones,\
+ as returned by process_pencil_beam_scans
+        baseline_centroids: The centroids measured at the current voltages
+        voltages: The current voltages of the actuators
+        drift_threshold: The relative prediction error above which a full set of\
+ pencil beam scans is needed
+        factorisation: The economic QR factorisation of interaction_matrix, if it has\
+ already been calculated
+    """
+
+    def __init__(
+        self,
+        slit_positions: np.typing.NDArray[np.float64],
+        interaction_matrix: np.typing.NDArray[np.float64],
+        baseline_centroids: np.typing.NDArray[np.float64],
+        voltages: np.typing.NDArray[np.float64],
+        drift_threshold: float = 0.2,
+        factorisation: tuple[
+            np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]
+        ]
+        | None = None,
+    ):
+        if interaction_matrix.shape != (len(slit_positions), len(voltages) + 1):
+            raise ValueError(
+                f"interaction_matrix has shape {interaction_matrix.shape}, expected\
+ {(len(slit_positions), len(voltages) + 1)}"
+            )
+        self.slit_positions: np.typing.NDArray[np.float64] = np.asarray(
+            slit_positions, dtype=np.float64
+        )
+        self.interaction_matrix: np.typing.NDArray[np.float64] = np.array(
+            interaction_matrix, dtype=np.float64
+        )
+        self.baseline_centroids: np.typing.NDArray[np.float64] = np.asarray(
+            baseline_centroids, dtype=np.float64
+        )
+        self.voltages: np.typing.NDArray[np.float64] = np.asarray(
+            voltages, dtype=np.float64
+        )
+        self.drift_threshold = drift_threshold
+        self.drift = 0.0
+        if factorisation is None:
+            factorisation = qr(self.interaction_matrix, mode="economic")  # type: ignore
+        self._q: np.typing.NDArray[np.float64] = factorisation[0]  # type: ignore
+        self._r: np.typing.NDArray[np.float64] = factorisation[1]  # type: ignore
+
+    @property
+    def needs_full_rescan(self) -> bool:
+        """Whether the last update drifted beyond the threshold."""
+        return self.drift > self.drift_threshold
+
+    def voltage_corrections(self) -> np.typing.NDArray[np.float64]:
+        """Calculate the voltage corrections for the current baseline centroids.
+
+        Returns:
+            An array of voltage corrections required to move the centroids to the
+            target position.
+        """
+        desired_corrections = np.mean(self.baseline_centroids) - self.baseline_centroids
+        corrections = solve_triangular(self._r, self._q.T @ desired_corrections)
+        return np.round(corrections[1:], decimals=2)
+
+    def update(
+        self,
+        voltages: np.typing.NDArray[np.float64],
+        baseline_centroids: np.typing.NDArray[np.float64],
+    ) -> float:
+        """Update the interaction matrix from a baseline scan at new voltages.
+
+        Args:
+            voltages: The voltages of the actuators during the new baseline scan
+            baseline_centroids: The centroids measured in the new baseline scan
+
+        Returns:
+            The drift, the size of the error in the predicted change of the centroids
+            relative to the size of the measured change, or 0 if the voltages have
+            not changed, when the matrix is left as it is.
+        """
+        voltages = np.asarray(voltages, dtype=np.float64)
+        baseline_centroids = np.asarray(baseline_centroids, dtype=np.float64)
+        if voltages.shape != self.voltages.shape:
+            raise ValueError(
+                f"Expected {len(self.voltages)} voltages, got {len(voltages)}"
+            )
+        if baseline_centroids.shape != self.baseline_centroids.shape:
+            raise ValueError(
+                f"Expected {len(self.baseline_centroids)} centroids, got\
+ {len(baseline_centroids)}"
+            )
+
+        step = np.concatenate(([0.0], voltages - self.voltages))
+        step_size = np.dot(step, step)
+        if step_size == 0:
+            # the Broyden update is undefined without a step, and a scan at the same
+            # voltages says nothing about the matrix, so only the centroids are kept
+            # and the drift of an earlier update is not reported again
+            self.drift = 0.0
+            self.baseline_centroids = baseline_centroids
+            return self.drift
+
+        measured_change = baseline_centroids - self.baseline_centroids
+        error = measured_change - self.interaction_matrix @ step
+        self.drift = float(
+            np.linalg.norm(error) / (np.linalg.norm(measured_change) or 1.0)
+        )
+        # Broyden's update, the smallest change to the matrix which reproduces the
+        # measured change
+        self.interaction_matrix += np.outer(error, step / step_size)  # type: ignore
+        self._q, self._r = qr_update(  # type: ignore
+            self._q, self._r, error, step / step_size
+        )
+
+        self.voltages = voltages
+        self.baseline_centroids = baseline_centroids
+        return self.drift
+
+    def save(self, file_path: str):
+        """Save the recalibration state to a numpy .npz file.
+
+        Args:
+            file_path: The path to save the state to, used as it is
+        """
+        # written through a file handle, as np.savez would add .npz to the path
+        with open(file_path, "wb") as f:
+            np.savez(
+                f,
+                slit_positions=self.slit_positions,
+                interaction_matrix=self.interaction_matrix,
+                baseline_centroids=self.baseline_centroids,
+                voltages=self.voltages,
+                drift_threshold=self.drift_threshold,
+                drift=self.drift,
+                q=self._q,
+                r=self._r,
+            )
+
+    @classmethod
+    def load(cls, file_path: str) -> "IncrementalRecalibration":
+        """Load a recalibration state saved by save.
+
+        Args:
+            file_path: The path to the .npz file
+
+        Returns:
+            The recalibration state.
+        """
+        with np.load(file_path) as state:
+            recalibration = cls(
+                state["slit_positions"],
+                state["interaction_matrix"],
+                state["baseline_centroids"],
+                state["voltages"],
+                drift_threshold=float(state["drift_threshold"]),
+                factorisation=(state["q"], state["r"]),
+            )
+            recalibration.drift = float(state["drift"])
+        return recalibration
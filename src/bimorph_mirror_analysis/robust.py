@@ -0,0 +1,166 @@
+from typing import Literal, TypedDict
+
+import numpy as np
+from scipy.linalg import qr, solve_triangular
+
+from bimorph_mirror_analysis.maths import process_pencil_beam_scans, weighted_gram
+from bimorph_mirror_analysis.profiling import profile_stage
+
+# tuning constants giving 95% efficiency when the noise is normally distributed
+_TUNING_CONSTANTS = {"huber": 1.345, "tukey": 4.685}
+
+
+class RobustFit(TypedDict):
+    corrections: np.typing.NDArray[np.float64]
+    weights: np.typing.NDArray[np.float64]
+    downweighted: np.typing.NDArray[np.int_]
+    iterations: int
+    converged: bool
+
+
+def robust_weights(
+    residuals: np.typing.NDArray[np.float64],
+    loss: Literal["huber", "tukey"] = "huber",
+) -> np.typing.NDArray[np.float64]:
+    """Calculate the IRLS weight of each row from its residual.
+
+    The residuals are scaled by their median absolute deviation, so the weights do
+    not depend on the units of the centroids.
+
+    Args:
+        residuals: The residual of each row of the fit
+        loss: "huber" to shrink the weight of large residuals, or "tukey" to also\
+ give the largest residuals no weight at all
+
+    Returns:
+        The weight of each row, between 0 and 1.
+    """
+    if loss not in _TUNING_CONSTANTS:
+        raise ValueError(f"loss must be 'huber' or 'tukey', got {loss!r}")
+    scale = np.median(np.abs(residuals - np.median(residuals))) / 0.6745
+    if scale == 0:
+        return np.ones(len(residuals))
+    u = np.abs(residuals) / (_TUNING_CONSTANTS[loss] * scale)
+    if loss == "huber":
+        return np.minimum(1.0, 1 / np.maximum(u, 1e-12))
+    return np.where(u < 1, (1 - u**2) ** 2, 0.0)
+
+
+def robust_least_squares(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    loss: Literal["huber", "tukey"] = "huber",
+    max_iterations: int = 50,
+    tolerance: float = 1e-6,
+) -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64], int, bool]:
+    """Solve the least squares problem of process_pencil_beam_scans by IRLS.
+
+    See find_robust_voltage_corrections.
+
+    Args:
+        interaction_matrix: The interaction matrix, as returned by\
+ process_pencil_beam_scans
+        desired_corrections: The desired corrections, as returned by\
+ process_pencil_beam_scans
+        loss: "huber" or "tukey", see robust_weights
+        max_iterations: The maximum number of reweighting iterations
+        tolerance: The relative change in the solution below which the iteration has\
+ converged
+
+    Returns:
+        The solution including the constant term, the final weight of each row, the
+        number of iterations and whether the iteration converged.
+    """
+    if loss not in _TUNING_CONSTANTS:
+        raise ValueError(f"loss must be 'huber' or 'tukey', got {loss!r}")
+    num_rows = interaction_matrix.shape[0]
+
+    with profile_stage("find_robust_voltage_corrections") as details:
+        q, r = qr(interaction_matrix, mode="economic")  # type: ignore
+        q_targets = q * desired_corrections[:, np.newaxis]  # type: ignore
+        leverages = np.sum(q**2, axis=1)  # type: ignore
+        studentise = 1 / np.sqrt(np.maximum(1 - leverages, 1e-12))
+
+        # the unweighted fit, y = Q^T d
+        projected = q_targets.sum(axis=0)
+        weights = np.ones(num_rows)
+        converged = False
+        iterations = 0
+        while iterations < max_iterations:
+            iterations += 1
+            residuals = desired_corrections - q @ projected
+            weights = robust_weights(residuals * studentise, loss)
+            gram = weighted_gram(q, weights)  # type: ignore
+            updated = np.linalg.lstsq(gram, weights @ q_targets)[0]
+            change = np.linalg.norm(updated - projected)
+            projected = updated
+            if change <= tolerance * max(float(np.linalg.norm(projected)), 1.0):
+                converged = True
+                break
+        details["loss"] = loss
+        details["iterations"] = iterations
+        details["converged"] = converged
+
+    return solve_triangular(r, projected), weights, iterations, converged  # type: ignore
+
+
+def find_robust_voltage_corrections(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    baseline_voltage_scan: int = 0,
+    loss: Literal["huber", "tukey"] = "huber",
+    max_iterations: int = 50,
+    tolerance: float = 1e-6,
+    outlier_weight: float = 0.5,
+) -> RobustFit:
+    """Calculate voltage corrections which are not distorted by a few bad centroids.
+
+    The least squares fit is repeated by iteratively reweighted least squares, with
+    rows with large residuals given less weight each time. The interaction matrix is
+    factorised once as QR, and each iteration only solves a small system in the
+    orthonormal basis, Q^T W Q y = Q^T W d, whose matrix is formed directly as
+    (Q^T W) Q. The residuals are divided by sqrt(1 - h), where h is the leverage of
+    each row, the squared norm of its row of Q, so that outliers at influential slit
+    positions are not hidden by the fit bending towards them.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        loss: "huber" or "tukey", see robust_weights
+        max_iterations: The maximum number of reweighting iterations
+        tolerance: The relative change in the solution below which the iteration has\
+ converged
+        outlier_weight: Rows whose final weight is below this are reported as\
+ down-weighted
+
+    Returns:
+        The voltage corrections, the final weight of each slit position, the indices
+        of the down-weighted slit positions, the number of iterations and whether
+        the iteration converged.
+    """
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+    if loss not in _TUNING_CONSTANTS:
+        raise ValueError(f"loss must be 'huber' or 'tukey', got {loss!r}")
+
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        data, voltage_increment, baseline_voltage_scan
+    )
+    corrections, weights, iterations, converged = robust_least_squares(
+        interaction_matrix, desired_corrections, loss, max_iterations, tolerance
+    )
+    return {
+        "corrections": np.round(corrections[1:], decimals=2),
+        "weights": weights,
+        "downweighted": np.flatnonzero(weights < outlier_weight),
+        "iterations": iterations,
+        "converged": converged,
+    }
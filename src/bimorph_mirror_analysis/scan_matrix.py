@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+_SCAN_PREFIX = "pencil_beam_scan_"
+
+
+class ScanMatrix:
+    """Pencil beam scans held as a centroid matrix, without a DataFrame.
+
+    The centroids are stored C-contiguously with a row per slit position, so a
+    range of slit positions is a block of whole rows and is selected as a view,
+    without copying. The slit positions are kept in ascending order for the same
+    reason. A DataFrame in the layout of the pivoted bluesky plan output is only
+    built when asked for with to_dataframe.
+
+    Args:
+        slit_positions: The slit positions, in ascending order
+        centroids: The mean centroid at each slit position, with a row per slit\
+ position and a column per pencil beam scan
+        scan_ids: The pencil beam scan number of each column of centroids
+        voltages: The voltages of the actuators in each scan, with a row per scan,\
+ if known
+    """
+
+    __slots__ = ("slit_positions", "centroids", "scan_ids", "voltages")
+
+    def __init__(
+        self,
+        slit_positions: np.typing.ArrayLike,
+        centroids: np.typing.ArrayLike,
+        scan_ids: np.typing.ArrayLike,
+        voltages: np.typing.ArrayLike | None = None,
+    ):
+        self.slit_positions = np.asarray(slit_positions, dtype=np.float64)
+        # views of whole rows are already contiguous, so are not copied
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float64)
+        self.scan_ids = np.asarray(scan_ids, dtype=np.int64)
+        self.voltages = (
+            None if voltages is None else np.asarray(voltages, dtype=np.float64)
+        )
+        if self.centroids.shape != (len(self.slit_positions), len(self.scan_ids)):
+            raise ValueError(
+                f"The centroids have shape {self.centroids.shape}, but there are\
+ {len(self.slit_positions)} slit positions and {len(self.scan_ids)} scans"
+            )
+        if self.voltages is not None and len(self.voltages) != len(self.scan_ids):
+            raise ValueError(
+                f"There are voltages for {len(self.voltages)} scans, but\
+ {len(self.scan_ids)} scans"
+            )
+
+    @classmethod
+    def from_dataframe(
+        cls, pivoted: pd.DataFrame, voltages: np.typing.ArrayLike | None = None
+    ) -> "ScanMatrix":
+        """Convert pivoted scans, as returned by read_bluesky_plan_output.
+
+        Args:
+            pivoted: A DataFrame with a slit_position_x column and a\
+ pencil_beam_scan_N column for each scan
+            voltages: The voltages of the actuators in each scan, if known
+
+        Returns:
+            The scans, sorted by slit position.
+        """
+        columns = [col for col in pivoted.columns if col.startswith(_SCAN_PREFIX)]
+        slit_positions = pivoted["slit_position_x"].to_numpy(dtype=np.float64)  # type: ignore
+        centroids = pivoted[columns].to_numpy(dtype=np.float64)  # type: ignore
+        order = np.argsort(slit_positions, kind="stable")
+        return cls(
+            slit_positions[order],
+            centroids[order],
+            [int(col.removeprefix(_SCAN_PREFIX)) for col in columns],
+            voltages,
+        )
+
+    def to_dataframe(
+        self, values: np.typing.NDArray[np.generic] | None = None
+    ) -> pd.DataFrame:
+        """Build a DataFrame in the layout of the pivoted bluesky plan output.
+
+        Args:
+            values: A matrix of the same shape as the centroids to tabulate in their\
+ place, for example the number of measurements of each centroid
+
+        Returns:
+            A DataFrame with a slit_position_x column and a pencil_beam_scan_N column
+            for each scan.
+        """
+        values = self.centroids if values is None else values
+        table = pd.DataFrame(
+            values, columns=[f"{_SCAN_PREFIX}{i}" for i in self.scan_ids]
+        )
+        table.insert(0, "slit_position_x", self.slit_positions)
+        return table
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """The number of slit positions and the number of scans."""
+        return self.centroids.shape  # type: ignore
+
+    def scan(self, scan_id: int) -> np.typing.NDArray[np.float64]:
+        """The centroids of the pencil beam scan with the given number."""
+        columns = np.flatnonzero(self.scan_ids == scan_id)
+        if len(columns) == 0:
+            raise IndexError(f"There is no pencil beam scan {scan_id}")
+        return self.centroids[:, columns[0]]
+
+    def slit_range_rows(self, slit_range: tuple[float, float] | None) -> slice:
+        """The rows of the slit positions within a range, including its ends."""
+        if slit_range is None:
+            return slice(0, len(self.slit_positions))
+        return slice(
+            int(np.searchsorted(self.slit_positions, slit_range[0], side="left")),
+            int(np.searchsorted(self.slit_positions, slit_range[1], side="right")),
+        )
+
+    def select_slit_range(self, slit_range: tuple[float, float] | None) -> "ScanMatrix":
+        """Select the slit positions within a range, as a view of these scans.
+
+        Args:
+            slit_range: The minimum and maximum slit positions to keep, or None to\
+ keep all of them
+
+        Returns:
+            The scans within the range, sharing memory with these scans.
+        """
+        rows = self.slit_range_rows(slit_range)
+        return ScanMatrix(
+            self.slit_positions[rows],
+            self.centroids[rows],
+            self.scan_ids,
+            self.voltages,
+        )
+
+
+ScanData = ScanMatrix | np.typing.NDArray[np.float64]
+
+
+def centroid_matrix(data: ScanData) -> np.typing.NDArray[np.float64]:
+    """The centroid matrix of scans, which may already be a plain matrix."""
+    if isinstance(data, ScanMatrix):
+        return data.centroids
+    return data
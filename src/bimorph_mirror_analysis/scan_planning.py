@@ -0,0 +1,109 @@
+from typing import Literal
+
+import numpy as np
+
+
+def select_slit_positions(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    tolerance: float = 0.01,
+    criterion: Literal["D", "A"] = "D",
+) -> tuple[np.typing.NDArray[np.int_], float]:
+    """Select a small subset of slit positions which give the same voltage corrections.
+
+    Slit positions are added greedily by optimal experimental design. The
+    D-optimal criterion adds the row which most increases the determinant of the
+    information matrix H_s^T H_s, and the A-optimal criterion adds the row which
+    most decreases the trace of its inverse. The inverse is kept up to date with
+    Sherman-Morrison rank-one updates, so each step costs one matrix-vector
+    product over the candidate rows rather than a new factorisation.
+
+    Selection stops once the voltage corrections found by least squares using only
+    the selected rows are within tolerance of those found using every row. The
+    corrections are estimated at each step from the maintained inverse and a running
+    H_s^T d_s, and a least squares fit is only made to confirm the estimate, after
+    which the inverse is refreshed from the selected rows if it was not accurate.
+
+    Args:
+        interaction_matrix: The interaction matrix, as returned by\
+ process_pencil_beam_scans
+        desired_corrections: The desired corrections, as returned by\
+ process_pencil_beam_scans
+        tolerance: The largest allowed relative difference between the voltage\
+ corrections from the subset and from all slit positions
+        criterion: "D" for D-optimal or "A" for A-optimal design
+
+    Returns:
+        A tuple containing the sorted indices of the selected slit positions and the
+        relative difference in the voltage corrections they achieve.
+    """
+    if criterion not in ("D", "A"):
+        raise ValueError(f"criterion must be 'D' or 'A', got {criterion!r}")
+    num_rows, num_cols = interaction_matrix.shape
+    full_corrections = np.linalg.pinv(interaction_matrix) @ desired_corrections
+    full_norm = np.linalg.norm(full_corrections[1:]) or 1.0
+
+    # a small ridge term keeps the information matrix invertible before there are
+    # enough rows to determine every voltage
+    ridge = 1e-10 * np.sum(interaction_matrix**2) / num_cols
+    information_inv: np.typing.NDArray[np.float64] = np.eye(num_cols) / ridge
+    available = np.ones(num_rows, dtype=bool)
+    selected: list[int] = []
+    error = np.inf
+
+    def subset_error(corrections: np.typing.NDArray[np.floating]) -> float:
+        return float(np.linalg.norm(corrections[1:] - full_corrections[1:]) / full_norm)
+
+    # rows of H A^-1, so that h_i^T A^-1 h_i is the leverage of each row
+    projected = interaction_matrix @ information_inv
+    leverages = np.einsum("ij,ij->i", projected, interaction_matrix)
+    # H_s^T d_s, so that A^-1 H_s^T d_s estimates the corrections from the subset
+    moments = np.zeros(num_cols)
+
+    while available.any():
+        if criterion == "D":
+            scores = leverages.copy()
+        else:
+            scores = np.einsum("ij,ij->i", projected, projected) / (1 + leverages)
+        scores[~available] = -np.inf
+        row = int(np.argmax(scores))
+
+        # Sherman-Morrison update of the inverse, and the rows which depend on it,
+        # for the new row
+        update = projected[row].copy()
+        denominator = 1 + leverages[row]
+        information_inv -= np.outer(update, update) / denominator
+        coupling = interaction_matrix @ update
+        projected -= np.outer(coupling, update) / denominator
+        leverages -= coupling**2 / denominator
+        moments += interaction_matrix[row] * desired_corrections[row]
+        available[row] = False
+        selected.append(row)
+
+        if (
+            len(selected) >= num_cols
+            and subset_error(information_inv @ moments) <= tolerance
+        ):
+            error = subset_error(
+                np.linalg.lstsq(
+                    interaction_matrix[selected], desired_corrections[selected]
+                )[0]
+            )
+            if error <= tolerance:
+                break
+            # rounding in the rank-one updates has built up, so start again from
+            # the inverse of the information matrix of the selected rows
+            subset = interaction_matrix[selected]
+            information = subset.T @ subset + ridge * np.eye(num_cols)
+            information_inv[:] = np.linalg.inv(information)  # type: ignore
+            projected[:] = interaction_matrix @ information_inv
+            leverages[:] = np.einsum("ij,ij->i", projected, interaction_matrix)
+    else:
+        if len(selected) >= num_cols:
+            error = subset_error(
+                np.linalg.lstsq(
+                    interaction_matrix[selected], desired_corrections[selected]
+                )[0]
+            )
+
+    return np.sort(np.array(selected, dtype=np.int_)), error
@@ -0,0 +1,297 @@
+from collections.abc import Iterator
+from typing import Literal
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import lsmr
+
+from bimorph_mirror_analysis.profiling import profile_stage
+
+
+def influence_bands(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    threshold: float = 1e-3,
+) -> np.typing.NDArray[np.int_]:
+    """Find the rows each actuator has a significant influence on.
+
+    Args:
+        interaction_matrix: The interaction matrix, with rows of slit positions and\
+ columns of actuators, without the column of ones
+        threshold: Entries smaller than this fraction of the largest entry in their\
+ column are treated as zero
+
+    Returns:
+        An array with a row for each actuator, containing the first and one past the
+        last slit position it influences.
+    """
+    magnitudes = np.abs(interaction_matrix)
+    significant = magnitudes > threshold * np.max(magnitudes, axis=0)
+    first = np.argmax(significant, axis=0)
+    last = len(significant) - np.argmax(significant[::-1], axis=0)
+    return np.column_stack((first, last))
+
+
+def _banded_columns(
+    responses: np.typing.NDArray[np.float64],
+    threshold: float,
+    bandwidth: int | None,
+) -> tuple[np.typing.NDArray[np.int_], np.typing.NDArray[np.int_]]:
+    """The first and one past the last row kept in each column of responses."""
+    bands = influence_bands(responses, threshold)
+    if bandwidth is not None:
+        peaks = np.argmax(np.abs(responses), axis=0)
+        bands[:, 0] = np.maximum(bands[:, 0], peaks - bandwidth)
+        bands[:, 1] = np.minimum(bands[:, 1], peaks + bandwidth + 1)
+    return bands[:, 0], bands[:, 1]
+
+
+def _banded_csc(
+    num_rows: int,
+    response_blocks: Iterator[np.typing.NDArray[np.float64]],
+    threshold: float,
+    bandwidth: int | None,
+) -> sparse.csc_array:
+    # the column of ones is stored in full, then only the band of each column of
+    # responses is copied, so the dense responses are never held all at once
+    values: list[np.typing.NDArray[np.float64]] = [np.ones(num_rows)]
+    indices: list[np.typing.NDArray[np.int_]] = [np.arange(num_rows)]
+    lengths: list[int] = [num_rows]
+    for responses in response_blocks:
+        firsts, lasts = _banded_columns(responses, threshold, bandwidth)
+        for column, (first, last) in enumerate(zip(firsts, lasts, strict=True)):
+            # copied, as a view would keep the whole block of responses alive
+            values.append(responses[first:last, column].copy())
+            indices.append(np.arange(first, last))  # type: ignore
+            lengths.append(int(last - first))
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    return sparse.csc_array(
+        (np.concatenate(values), np.concatenate(indices), indptr),
+        shape=(num_rows, len(lengths)),
+    )
+
+
+def sparse_interaction_matrix(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    threshold: float = 1e-3,
+    bandwidth: int | None = None,
+) -> sparse.csc_array:
+    """Store an interaction matrix sparsely, keeping the band each actuator\
+ influences.
+
+    Args:
+        interaction_matrix: The interaction matrix, as returned by\
+ process_pencil_beam_scans, with its leading column of ones
+        threshold: The band of each actuator runs from the first to the last entry\
+ of its column which is at least this fraction of the largest entry, see\
+ influence_bands
+        bandwidth: If supplied, each actuator is also restricted to this many slit\
+ positions either side of its largest response, enforcing a band structure
+
+    Returns:
+        The interaction matrix as a sparse array.
+    """
+    return _banded_csc(
+        len(interaction_matrix),
+        iter([interaction_matrix[:, 1:]]),
+        threshold,
+        bandwidth,
+    )
+
+
+def banded_interaction_matrix(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    threshold: float = 1e-3,
+    bandwidth: int | None = None,
+    block_size: int = 64,
+) -> sparse.csc_array:
+    """Build the sparse interaction matrix straight from the pencil beam scans.
+
+    As sparse_interaction_matrix of the matrix from process_pencil_beam_scans, but
+    the responses are found for a block of actuators at a time and only their bands
+    are kept, so the peak memory grows with the number of kept entries rather than
+    with the size of the dense matrix.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        threshold: See sparse_interaction_matrix
+        bandwidth: See sparse_interaction_matrix
+        block_size: The number of actuators whose dense responses are held at once
+
+    Returns:
+        The interaction matrix as a sparse array, with its leading column of ones.
+    """
+    num_actuators = data.shape[1] - 1
+    blocks = (
+        np.diff(data[:, start : start + block_size + 1], axis=1) / voltage_increment
+        for start in range(0, num_actuators, block_size)
+    )
+    return _banded_csc(len(data), blocks, threshold, bandwidth)
+
+
+def randomized_svd(
+    matrix: sparse.csc_array | np.typing.NDArray[np.float64],
+    rank: int,
+    oversampling: int = 10,
+    power_iterations: int = 2,
+    seed: int | None = 0,
+) -> tuple[
+    np.typing.NDArray[np.float64],
+    np.typing.NDArray[np.float64],
+    np.typing.NDArray[np.float64],
+]:
+    """Calculate a truncated SVD by random projection.
+
+    The range of the matrix is sampled with a few products with a random matrix,
+    so the cost is proportional to the number of non-zero entries times the rank
+    rather than to a full dense SVD.
+
+    Args:
+        matrix: The matrix to decompose
+        rank: The number of singular values to keep
+        oversampling: The number of extra random vectors used to sample the range
+        power_iterations: The number of power iterations used to sharpen the range
+            when the singular values decay slowly
+        seed: The seed for the random projection
+
+    Returns:
+        A tuple of U, the singular values and V^T, truncated to the rank.
+    """
+    num_cols = matrix.shape[1]
+    samples = min(rank + oversampling, num_cols)
+    rng = np.random.default_rng(seed)
+    basis, _ = np.linalg.qr(matrix @ rng.normal(size=(num_cols, samples)))
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(matrix.T @ basis)
+        basis, _ = np.linalg.qr(matrix @ basis)
+    small = np.asarray(matrix.T @ basis).T
+    u, singular_values, vt = np.linalg.svd(small, full_matrices=False)
+    return (basis @ u)[:, :rank], singular_values[:rank], vt[:rank]
+
+
+def _solve_sparse(
+    matrix: sparse.csc_array,
+    desired_corrections: np.typing.NDArray[np.float64],
+    solver: Literal["lsmr", "svd"],
+    rank: int | None,
+) -> np.typing.NDArray[np.float64]:
+    with profile_stage("find_sparse_voltage_corrections") as details:
+        details["solver"] = solver
+        details["density"] = matrix.nnz / np.prod(matrix.shape)
+        # scale the columns to unit norm, as the column of ones is much larger than
+        # the responses, which slows the convergence of LSMR
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+        norms[norms == 0] = 1.0
+        scaled = matrix @ sparse.diags_array(1 / norms)
+
+        if solver == "lsmr":
+            result = lsmr(scaled, desired_corrections, atol=1e-12, btol=1e-12)
+            details["iterations"] = int(result[2])
+            scaled_corrections: np.typing.NDArray[np.float64] = result[0]
+        else:
+            u, singular_values, vt = randomized_svd(
+                scaled, rank if rank is not None else scaled.shape[1]
+            )
+            keep = singular_values > singular_values[0] * max(scaled.shape) * 1e-15
+            scaled_corrections = vt[keep].T @ (
+                (u[:, keep].T @ desired_corrections) / singular_values[keep]
+            )
+
+    return scaled_corrections / norms
+
+
+def solve_sparse_least_squares(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    solver: Literal["lsmr", "svd"] = "lsmr",
+    threshold: float = 1e-3,
+    bandwidth: int | None = None,
+    rank: int | None = None,
+) -> np.typing.NDArray[np.float64]:
+    """Solve the least squares problem of process_pencil_beam_scans sparsely.
+
+    Args:
+        interaction_matrix: The interaction matrix, as returned by\
+ process_pencil_beam_scans, with its leading column of ones
+        desired_corrections: The desired corrections, as returned by\
+ process_pencil_beam_scans
+        solver: "lsmr" for sparse iterative least squares, or "svd" for a\
+ randomized truncated SVD
+        threshold: See sparse_interaction_matrix
+        bandwidth: If supplied, the number of slit positions either side of each\
+ actuator's largest response it is allowed to influence
+        rank: The number of singular values kept by the "svd" solver, all of them\
+ if not supplied
+
+    Returns:
+        The solution, including the constant term.
+    """
+    if solver not in ("lsmr", "svd"):
+        raise ValueError(f"solver must be 'lsmr' or 'svd', got {solver!r}")
+
+    return _solve_sparse(
+        sparse_interaction_matrix(interaction_matrix, threshold, bandwidth),
+        desired_corrections,
+        solver,
+        rank,
+    )
+
+
+def find_sparse_voltage_corrections(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    baseline_voltage_scan: int = 0,
+    solver: Literal["lsmr", "svd"] = "lsmr",
+    threshold: float = 1e-3,
+    bandwidth: int | None = None,
+    rank: int | None = None,
+) -> np.typing.NDArray[np.float64]:
+    """Calculate voltage corrections using a sparse interaction matrix.
+
+    For mirrors with many actuators, each of which only moves the centroids near
+    it, most of the interaction matrix is close to zero. Only the band of slit
+    positions each actuator influences is kept, built straight from the scans by
+    banded_interaction_matrix without the dense matrix, and the least squares
+    problem is solved iteratively with LSMR, or with a randomized truncated SVD, so
+    the time and memory grow with the number of non-zero entries rather than with a
+    dense pseudo-inverse.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        solver: "lsmr" for sparse iterative least squares, or "svd" for a\
+ randomized truncated SVD
+        threshold: Entries smaller than this fraction of the largest entry in their\
+ column are dropped
+        bandwidth: If supplied, the number of slit positions either side of each\
+ actuator's largest response it is allowed to influence
+        rank: The number of singular values kept by the "svd" solver, all of them\
+ if not supplied. Smaller ranks regularise the solution.
+
+    Returns:
+        An array of voltage corrections required to move the centroid of each pencil
+        beam scan to the target position.
+    """
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+    if solver not in ("lsmr", "svd"):
+        raise ValueError(f"solver must be 'lsmr' or 'svd', got {solver!r}")
+    with profile_stage("banded_interaction_matrix"):
+        matrix = banded_interaction_matrix(
+            data, voltage_increment, threshold, bandwidth
+        )
+    baseline_centroids = data[:, baseline_voltage_scan]
+    desired_corrections = np.mean(baseline_centroids) - baseline_centroids
+    voltage_corrections = _solve_sparse(matrix, desired_corrections, solver, rank)
+    return np.round(voltage_corrections[1:], decimals=2)
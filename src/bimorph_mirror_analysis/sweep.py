@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bimorph_mirror_analysis.constraints import project_onto_constraints
+from bimorph_mirror_analysis.maths import (
+    check_voltages_fit_constraints,
+    find_voltage_corrections,
+    find_voltage_corrections_with_restraints,
+)
+from bimorph_mirror_analysis.profiling import profile_stage
+
+
+def _sweep_max_differences(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    initial_voltages: np.typing.NDArray[np.float64],
+    voltage_range: tuple[int, int],
+    max_differences: list[int],
+    baseline_voltage_scan: int,
+) -> list[np.typing.NDArray[np.float64]]:
+    """Solve for each max difference in turn, from loosest to tightest, starting each
+    solve from the solution of the previous, looser, setting. The loosest is started
+    from the closest corrections to the unrestrained ones which fit its constraints."""
+    unrestrained = find_voltage_corrections(
+        data, voltage_increment, baseline_voltage_scan
+    )
+    previous: np.typing.NDArray[np.float64] | None = None
+    corrections: dict[int, np.typing.NDArray[np.float64]] = {}
+    for max_diff in sorted(max_differences, reverse=True):
+        if check_voltages_fit_constraints(
+            initial_voltages + unrestrained, voltage_range, max_diff
+        ):
+            previous = unrestrained
+        else:
+            if previous is None:
+                previous = (
+                    project_onto_constraints(
+                        initial_voltages + unrestrained, voltage_range, max_diff
+                    )
+                    - initial_voltages
+                )
+            previous = find_voltage_corrections_with_restraints(
+                data,
+                voltage_increment,
+                initial_voltages,
+                voltage_range,
+                max_diff,
+                baseline_voltage_scan=baseline_voltage_scan,
+                initial_guess=previous,
+            )
+        corrections[max_diff] = previous
+    return [corrections[max_diff] for max_diff in max_differences]
+
+
+def pareto_front(
+    range_widths: np.typing.NDArray[np.float64],
+    max_differences: np.typing.NDArray[np.float64],
+    residuals: np.typing.NDArray[np.float64],
+) -> np.typing.NDArray[np.bool_]:
+    """Find the constraint settings which are not dominated by another setting.
+
+    A setting is dominated if another setting is at least as tight in both the
+    voltage range and the maximum consecutive voltage difference, has a residual at
+    least as small, and is strictly better in one of the three.
+
+    Args:
+        range_widths: The width of the voltage range of each setting
+        max_differences: The maximum consecutive voltage difference of each setting
+        residuals: The residual achieved by each setting
+
+    Returns:
+        A boolean array which is True for the settings on the Pareto front.
+    """
+    costs = np.column_stack((range_widths, max_differences, residuals))
+    no_worse = np.all(costs[:, np.newaxis, :] <= costs[np.newaxis, :, :], axis=2)
+    better = np.any(costs[:, np.newaxis, :] < costs[np.newaxis, :, :], axis=2)
+    # dominates[i, j] is True if setting i dominates setting j
+    dominates = no_worse & better
+    return ~np.any(dominates, axis=0)
+
+
+def sweep_constraints(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    initial_voltages: np.typing.NDArray[np.float64],
+    voltage_ranges: list[tuple[int, int]],
+    max_differences: list[int],
+    baseline_voltage_scan: int = 0,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """Solve the restrained problem over a grid of constraint settings.
+
+    Each voltage range is solved in a separate process. Within a voltage range the
+    maximum consecutive voltage differences are solved from loosest to tightest,
+    with each solve warm started from the solution of its looser neighbour.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        initial_voltages: The initial voltages of the actuators
+        voltage_ranges: The minimum and maximum voltages of each setting to try
+        max_differences: The maximum consecutive voltage differences to try
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        max_workers: The number of processes to use. 1 solves in this process, and
+            None uses one per CPU.
+
+    Returns:
+        A DataFrame with one row per setting, containing the constraints, the RMS of
+        the predicted centroids about their mean, whether the setting is on the
+        Pareto front and the voltage corrections.
+    """
+    if not voltage_ranges or not max_differences:
+        raise ValueError("At least one voltage range and max difference is needed")
+    args = [
+        (
+            data,
+            voltage_increment,
+            initial_voltages,
+            voltage_range,
+            max_differences,
+            baseline_voltage_scan,
+        )
+        for voltage_range in voltage_ranges
+    ]
+    with profile_stage("sweep_constraints") as details:
+        details["settings"] = len(voltage_ranges) * len(max_differences)
+        if max_workers == 1:
+            results = [_sweep_max_differences(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(_sweep_max_differences, *arg) for arg in args
+                ]
+                results = [future.result() for future in futures]
+
+    interaction_matrix = np.diff(data, axis=1) / voltage_increment
+    baseline_centroids = data[:, baseline_voltage_scan]
+    rows: list[dict[str, object]] = []
+    for voltage_range, corrections in zip(voltage_ranges, results, strict=True):
+        for max_diff, voltage_corrections in zip(
+            max_differences, corrections, strict=True
+        ):
+            predicted = baseline_centroids + interaction_matrix @ voltage_corrections
+            rows.append(
+                {
+                    "voltage_range_min": voltage_range[0],
+                    "voltage_range_max": voltage_range[1],
+                    "max_consecutive_voltage_difference": max_diff,
+                    "residual": float(np.std(predicted)),
+                    "voltage_corrections": voltage_corrections,
+                }
+            )
+
+    table = pd.DataFrame(rows)
+    table.insert(
+        4,
+        "pareto",
+        pareto_front(
+            (table["voltage_range_max"] - table["voltage_range_min"]).to_numpy(),
+            table["max_consecutive_voltage_difference"].to_numpy(),
+            table["residual"].to_numpy(),
+        ),
+    )
+    return table
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+
+def mirror_centroids(
+    slit_positions: np.typing.NDArray[np.float64],
+    num_modes: int = 5,
+    amplitude: float = 1.0,
+    seed: int | None = None,
+) -> np.typing.NDArray[np.float64]:
+    """Calculate the centroid positions reflected from an imperfect mirror.
+
+    The mirror height profile is modelled as a sum of sinusoidal figure errors with
+    random phases and amplitudes decaying with spatial frequency. The centroid
+    position at each slit position is proportional to the local slope of the mirror.
+
+    Args:
+        slit_positions: The slit positions to calculate the centroids at
+        num_modes: The number of sinusoidal figure errors to sum
+        amplitude: The amplitude of the lowest frequency figure error
+        seed: The seed for the random phases and amplitudes
+
+    Returns:
+        The centroid position at each slit position.
+    """
+    rng = np.random.default_rng(seed)
+    length = np.ptp(slit_positions) or 1.0
+    x = (slit_positions - np.min(slit_positions)) / length
+    modes = np.arange(1, num_modes + 1)
+    amplitudes = amplitude * rng.uniform(0.5, 1.0, num_modes) / modes
+    phases = rng.uniform(0, 2 * np.pi, num_modes)
+    # derivative of sum(a * sin(k * pi * x + phi)) with respect to x
+    slopes = np.cos(np.outer(x, modes * np.pi) + phases) @ (amplitudes * modes * np.pi)
+    return slopes
+
+
+def influence_functions(
+    slit_positions: np.typing.NDArray[np.float64],
+    num_actuators: int,
+    response: float = 0.01,
+    width: float = 0.6,
+) -> np.typing.NDArray[np.float64]:
+    """Calculate the change in centroid position per volt on each actuator.
+
+    The actuators are spaced evenly along the mirror, and each one moves the centroid
+    by a Gaussian shaped amount centred on the actuator.
+
+    Args:
+        slit_positions: The slit positions to calculate the influence functions at
+        num_actuators: The number of actuators on the bimorph mirror
+        response: The peak change in centroid position per volt
+        width: The standard deviation of each influence function, as a fraction of
+            the spacing between actuators
+
+    Returns:
+        The interaction matrix, with rows of slit positions and columns of actuators.
+    """
+    start, stop = np.min(slit_positions), np.max(slit_positions)
+    spacing = (stop - start) / num_actuators or 1.0
+    centres = start + spacing * (np.arange(num_actuators) + 0.5)
+    distances = (slit_positions[:, np.newaxis] - centres) / (width * spacing)
+    return response * np.exp(-0.5 * distances**2)
+
+
+def generate_bluesky_plan_output(
+    num_actuators: int,
+    num_slit_positions: int,
+    voltage_increment: float = 100.0,
+    initial_voltages: np.typing.NDArray[np.float64] | None = None,
+    repeats: int = 1,
+    noise: float = 0.0,
+    slit_range: tuple[float, float] = (0.0, 100.0),
+    seed: int | None = None,
+) -> pd.DataFrame:
+    """Generate a table of pencil beam scans in the format output by the bluesky plan.
+
+    The first scan is taken at the initial voltages, and each subsequent scan adds
+    the voltage increment to one more actuator. The centroids are calculated from
+    mirror_centroids, the centroids with every actuator at zero volts, and
+    influence_functions, with added Gaussian noise.
+
+    Args:
+        num_actuators: The number of actuators on the bimorph mirror
+        num_slit_positions: The number of slit positions in each pencil beam scan
+        voltage_increment: The voltage increment applied to the actuators between\
+ pencil beam scans
+        initial_voltages: The voltages of the actuators in the first scan, zero if
+            not supplied
+        repeats: The number of times each slit position is measured in each scan
+        noise: The standard deviation of the noise added to each centroid
+        slit_range: The first and last slit positions
+        seed: The seed for the mirror figure errors and the noise
+
+    Returns:
+        A DataFrame with one row per measurement, as would be read from the csv file.
+    """
+    rng = np.random.default_rng(seed)
+    if initial_voltages is None:
+        initial_voltages = np.zeros(num_actuators)
+    num_scans = num_actuators + 1
+
+    slit_positions = np.linspace(*slit_range, num_slit_positions)
+    baseline = mirror_centroids(slit_positions, seed=seed)
+    interaction_matrix = influence_functions(slit_positions, num_actuators)
+
+    # scan i has the increment applied to the first i actuators
+    increments = np.tril(np.ones((num_scans, num_actuators)), k=-1)
+    voltages = initial_voltages + voltage_increment * increments
+    centroids = baseline[:, np.newaxis] + interaction_matrix @ voltages.T
+
+    # one row per measurement, ordered by scan, then slit position, then repeat
+    rows_per_scan = num_slit_positions * repeats
+    num_rows = num_scans * rows_per_scan
+    centroid_x = np.repeat(centroids.T.ravel(), repeats)
+    if noise > 0:
+        centroid_x = centroid_x + rng.normal(0, noise, num_rows)
+
+    columns: dict[str, np.typing.NDArray[np.float64] | np.typing.NDArray[np.int_]] = {
+        f"voltage_channel_{i + 1}": np.repeat(voltages[:, i], rows_per_scan)
+        for i in range(num_actuators)
+    }
+    columns["slit_position_x"] = np.tile(np.repeat(slit_positions, repeats), num_scans)
+    columns["slit_width_x"] = np.ones(num_rows)
+    columns["slit_position_y"] = np.zeros(num_rows)
+    columns["slit_width_y"] = np.ones(num_rows)
+    columns["centroid_position_x"] = centroid_x
+    columns["centroid_position_y"] = rng.normal(0, max(noise, 1e-3), num_rows)
+    columns["pencil_beam_scan_number"] = np.repeat(np.arange(num_scans), rows_per_scan)
+    return pd.DataFrame(columns)
@@ -0,0 +1,271 @@
+from typing import Literal, TypedDict
+
+import numpy as np
+from scipy.linalg import qr, solve_triangular
+
+from bimorph_mirror_analysis.maths import (
+    process_pencil_beam_scans,
+    weight_rows,
+    weighted_gram,
+)
+from bimorph_mirror_analysis.profiling import profile_stage
+from bimorph_mirror_analysis.scan_matrix import ScanData, centroid_matrix
+
+
+class VoltageCorrectionIntervals(TypedDict):
+    corrections: np.typing.NDArray[np.float64]
+    standard_error: np.typing.NDArray[np.float64]
+    lower: np.typing.NDArray[np.float64]
+    upper: np.typing.NDArray[np.float64]
+    confidence_level: float
+    num_resamples: int
+    method: str
+
+
+def _resample_rows(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    num_resamples: int,
+    rng: np.random.Generator,
+) -> np.typing.NDArray[np.float64]:
+    num_rows = interaction_matrix.shape[0]
+    # resampling rows with replacement is the same as weighting each row by the
+    # number of times it was drawn
+    weights = rng.multinomial(
+        num_rows, np.full(num_rows, 1 / num_rows), size=num_resamples
+    ).astype(np.float64)
+
+    # solve in the orthonormal basis of H = QR, so the batched normal equations are
+    # as well conditioned as Q^T W Q rather than H^T W H
+    q, r = qr(interaction_matrix, mode="economic")  # type: ignore
+    gram = weighted_gram(q, weights)  # type: ignore
+    rhs = weights @ (q * desired_corrections[:, np.newaxis])  # type: ignore
+
+    # one batched SVD of every resample, which also copes with resamples that drew
+    # too few distinct rows to determine every voltage
+    projected = np.einsum("bij,bj->bi", np.linalg.pinv(gram), rhs)
+    return solve_triangular(r, projected.T).T  # type: ignore
+
+
+def _resample_residuals(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+    num_resamples: int,
+    rng: np.random.Generator,
+) -> np.typing.NDArray[np.float64]:
+    num_rows, num_cols = interaction_matrix.shape
+    interaction_matrix_inv = np.linalg.pinv(interaction_matrix)
+    corrections = interaction_matrix_inv @ desired_corrections
+    residuals = desired_corrections - interaction_matrix @ corrections
+    # residuals are smaller than the noise by the degrees of freedom used in the fit
+    residuals *= np.sqrt(num_rows / max(num_rows - num_cols, 1))
+
+    # the fit is linear in the targets, so every resample is one matrix product
+    resampled = residuals[rng.integers(0, num_rows, (num_resamples, num_rows))]
+    return corrections + resampled @ interaction_matrix_inv.T
+
+
+def bootstrap_voltage_corrections(
+    data: np.typing.NDArray[np.float64],
+    voltage_increment: float,
+    baseline_voltage_scan: int = 0,
+    num_resamples: int = 2000,
+    confidence_level: float = 0.95,
+    method: Literal["rows", "residuals"] = "rows",
+    seed: int | None = None,
+) -> VoltageCorrectionIntervals:
+    """Estimate confidence intervals for the unrestrained voltage corrections.
+
+    The least-squares fit is repeated on bootstrap resamples of the pencil beam scan
+    data, and the spread of the voltage corrections across the resamples gives the
+    uncertainty due to noise in the centroids. All resamples are solved together
+    with batched matrix operations rather than one at a time.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        num_resamples: The number of bootstrap resamples
+        confidence_level: The probability the interval contains the true correction
+        method: "rows" to resample slit positions with replacement, or "residuals"\
+ to resample the residuals of the fit and add them to the fitted centroids
+        seed: The seed for the random resampling
+
+    Returns:
+        The voltage corrections, their bootstrap standard errors, and the lower and
+        upper percentile bounds of the confidence interval for each actuator.
+    """
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+    if not 0 < confidence_level < 1:
+        raise ValueError(
+            f"confidence_level must be between 0 and 1, got {confidence_level}"
+        )
+    if num_resamples < 1:
+        raise ValueError(f"num_resamples must be at least 1, got {num_resamples}")
+
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        data, voltage_increment, baseline_voltage_scan
+    )
+    rng = np.random.default_rng(seed)
+
+    with profile_stage("bootstrap_voltage_corrections") as details:
+        details["method"] = method
+        details["num_resamples"] = num_resamples
+        if method == "rows":
+            resampled = _resample_rows(
+                interaction_matrix, desired_corrections, num_resamples, rng
+            )
+        elif method == "residuals":
+            resampled = _resample_residuals(
+                interaction_matrix, desired_corrections, num_resamples, rng
+            )
+        else:
+            raise ValueError(f"method must be 'rows' or 'residuals', got {method!r}")
+
+    corrections = np.linalg.pinv(interaction_matrix) @ desired_corrections
+    tail = 100 * (1 - confidence_level) / 2
+    lower, upper = np.percentile(resampled[:, 1:], [tail, 100 - tail], axis=0)
+    return {
+        "corrections": np.round(corrections[1:], decimals=2),
+        "standard_error": np.std(resampled[:, 1:], axis=0, ddof=1)
+        if num_resamples > 1
+        else np.zeros(len(corrections) - 1),
+        "lower": lower,
+        "upper": upper,
+        "confidence_level": confidence_level,
+        "num_resamples": num_resamples,
+        "method": method,
+    }
+
+
+class LeaveOneOutValidation(TypedDict):
+    corrections: np.typing.NDArray[np.float64]
+    leverage: np.typing.NDArray[np.float64]
+    residuals: np.typing.NDArray[np.float64]
+    loo_residuals: np.typing.NDArray[np.float64]
+    cooks_distance: np.typing.NDArray[np.float64]
+    high_leverage: np.typing.NDArray[np.bool_]
+    rms_error: float
+    cv_rms_error: float
+    influential_rows: np.typing.NDArray[np.int_]
+
+
+def cross_validate_voltage_corrections(
+    data: ScanData,
+    voltage_increment: float,
+    baseline_voltage_scan: int = 0,
+    weights: np.typing.NDArray[np.float64] | None = None,
+    num_influential: int = 5,
+) -> LeaveOneOutValidation:
+    """Cross-validate the unrestrained voltage corrections, leaving out each slit\
+ position in turn.
+
+    Refitting without each slit position would take one solve per slit position.
+    For least squares, the residual of a slit position left out of the fit is
+    exactly its residual in the full fit divided by 1 - h, where h, its leverage, is
+    the diagonal entry of the hat matrix H (H^T H)^-1 H^T. The leverages are the
+    squared row norms of Q from a single pivoted QR factorisation of H, so every
+    leave-one-out residual comes from the one fit. Cook's distance combines the
+    residual and leverage of each slit position into how far leaving it out moves
+    the fitted centroids.
+
+    Args:
+        data: A matrix of beamline centroid data, with rows of different slit positions
+            and columns of pencil beam scans at different actuator voltages, or a
+            ScanMatrix
+        voltage_increment: The voltage increment applied to the actuators between \
+pencil beam scans
+        baseline_voltage_scan: The pencil beam scan to use as the baseline for the
+            centroid calculation. 0 is the first scan, 1 is the second scan, etc.
+            -1 can be used for the last scan and -2 for the second to last scan etc.
+        weights: The weight of each slit position in the least squares fit. The\
+ residuals are then weighted residuals.
+        num_influential: The number of most influential slit positions to report
+
+    Returns:
+        The voltage corrections, and for each slit position its leverage, its
+        residual in the full fit, its leave-one-out residual and its Cook's distance,
+        the RMS of the residuals and of the leave-one-out residuals, and the rows of
+        the most influential slit positions by Cook's distance, most influential
+        first. The slit positions with a leverage too close to 1 for the closed form,
+        such as one which alone determines part of the fit, are flagged as high
+        leverage and refitted without, by the minimum norm least squares solution.
+    """
+    data = centroid_matrix(data)
+    if baseline_voltage_scan < -data.shape[1] or baseline_voltage_scan >= data.shape[1]:
+        raise IndexError(
+            f"baseline_voltage_scan is out of range, it must be between\
+ {-1 * data.shape[1]} and {data.shape[1] - 1}"
+        )
+    if num_influential < 0:
+        raise ValueError(f"num_influential must not be negative, got {num_influential}")
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(
+        data, voltage_increment, baseline_voltage_scan
+    )
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
+    num_rows = len(desired_corrections)
+
+    with profile_stage("cross_validate_voltage_corrections") as details:
+        q, r, pivots = qr(interaction_matrix, mode="economic", pivoting=True)  # type: ignore
+        diagonal = np.abs(np.diag(r))  # type: ignore
+        # the columns of Q past the rank of H do not span its range
+        rank = int(
+            np.sum(diagonal > diagonal[0] * max(interaction_matrix.shape) * 1e-15)
+        )
+        q, r = q[:, :rank], r[:rank, :rank]  # type: ignore
+        details["rank"] = rank
+
+        projected = q.T @ desired_corrections  # type: ignore
+        solution = np.zeros(interaction_matrix.shape[1])
+        solution[pivots[:rank]] = solve_triangular(r, projected)  # type: ignore
+        residuals = desired_corrections - q @ projected  # type: ignore
+        leverage = np.sum(q**2, axis=1)  # type: ignore
+
+        # dividing by 1 - h loses all precision as the leverage approaches 1, so
+        # those slit positions are refitted without them instead
+        high_leverage = 1 - leverage <= 1e-8
+        loo_residuals = residuals / np.where(high_leverage, 1, 1 - leverage)
+        # the squared distance the fitted centroids move when each is left out
+        shifts = loo_residuals**2 * leverage
+        fitted = desired_corrections - residuals
+        for row in np.flatnonzero(high_leverage):
+            kept = np.arange(num_rows) != row
+            refit = (
+                interaction_matrix
+                @ np.linalg.lstsq(interaction_matrix[kept], desired_corrections[kept])[
+                    0
+                ]
+            )
+            loo_residuals[row] = desired_corrections[row] - refit[row]
+            shifts[row] = np.sum((fitted - refit) ** 2)
+        details["high_leverage"] = int(np.sum(high_leverage))
+
+        dof = max(num_rows - rank, 1)
+        variance = np.sum(residuals**2) / dof  # type: ignore
+        cooks_distance = (
+            shifts / (rank * variance) if variance > 0 else np.zeros(num_rows)
+        )
+
+    order = np.argsort(-cooks_distance, kind="stable")
+    return {
+        "corrections": np.round(solution[1:], decimals=2),
+        "leverage": leverage,
+        "residuals": residuals,  # type: ignore
+        "loo_residuals": loo_residuals,
+        "cooks_distance": cooks_distance,
+        "high_leverage": high_leverage,
+        "rms_error": float(np.sqrt(np.mean(residuals**2))),  # type: ignore
+        "cv_rms_error": float(np.sqrt(np.mean(loo_residuals**2))),
+        "influential_rows": order[:num_influential],
+    }
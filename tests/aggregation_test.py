@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.aggregation import InteractionMatrixAccumulator
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    process_pencil_beam_scans,
+)
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+
+
+@pytest.fixture
+def matrices() -> np.typing.NDArray[np.float64]:
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    interaction_matrix, _ = process_pencil_beam_scans(data, 100)
+    rng = np.random.default_rng(0)
+    noise = rng.normal(scale=1e-4, size=(7, *interaction_matrix.shape))
+    noise[:, :, 0] = 0
+    return interaction_matrix + noise
+
+
+def accumulate(
+    matrices: np.typing.NDArray[np.float64],
+) -> InteractionMatrixAccumulator:
+    _, num_slit_positions, num_columns = matrices.shape  # type: ignore
+    accumulator = InteractionMatrixAccumulator(
+        np.arange(num_slit_positions, dtype=np.float64), num_columns - 1
+    )
+    for matrix in matrices:
+        accumulator.add(matrix)
+    return accumulator
+
+
+def test_running_mean_and_variance(matrices: np.typing.NDArray[np.float64]):
+    accumulator = accumulate(matrices)
+    assert accumulator.count == 7
+    np.testing.assert_allclose(accumulator.interaction_matrix, matrices.mean(axis=0))
+    np.testing.assert_allclose(
+        accumulator.variance, matrices.var(axis=0, ddof=1), atol=1e-20
+    )
+    np.testing.assert_allclose(
+        accumulator.standard_error, np.sqrt(matrices.var(axis=0, ddof=1) / 7)
+    )
+
+
+@pytest.mark.parametrize("split", [0, 1, 3, 7])
+def test_merge_matches_sequential(matrices: np.typing.NDArray[np.float64], split: int):
+    merged = accumulate(matrices[:split])
+    merged.merge(accumulate(matrices[split:]))
+    sequential = accumulate(matrices)
+    assert merged.count == sequential.count
+    np.testing.assert_allclose(merged.mean, sequential.mean)
+    np.testing.assert_allclose(merged.variance, sequential.variance, atol=1e-20)
+
+
+def test_variance_before_two_sessions(matrices: np.typing.NDArray[np.float64]):
+    accumulator = accumulate(matrices[:1])
+    assert np.all(np.isnan(accumulator.variance))
+    with pytest.raises(ValueError):
+        _ = accumulate(matrices[:0]).interaction_matrix
+
+
+def test_save_and_load(matrices: np.typing.NDArray[np.float64], tmp_path: Path):
+    accumulator = accumulate(matrices)
+    state_path = str(tmp_path / "matrices.npz")
+    accumulator.save(state_path)
+    loaded = InteractionMatrixAccumulator.load(state_path)
+    assert loaded.count == accumulator.count
+    np.testing.assert_array_equal(loaded.slit_positions, accumulator.slit_positions)
+    np.testing.assert_array_equal(loaded.mean, accumulator.mean)
+    np.testing.assert_array_equal(loaded.variance, accumulator.variance)
+
+    loaded.add(matrices[0])
+    assert loaded.count == 8
+
+
+def test_add_scans_and_solve():
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    scans = ScanMatrix(np.arange(len(data)), data, range(data.shape[1]))
+    accumulator = InteractionMatrixAccumulator(scans.slit_positions, 8)
+    accumulator.add_scans(scans, -100, baseline_voltage_scan=-1)
+    np.testing.assert_allclose(
+        accumulator.voltage_corrections(data[:, -1]),
+        find_voltage_corrections(data, -100, baseline_voltage_scan=-1),
+        atol=0.011,
+    )
+
+
+def test_mismatched_sessions(matrices: np.typing.NDArray[np.float64]):
+    accumulator = accumulate(matrices)
+    with pytest.raises(ValueError):
+        accumulator.add(matrices[0][:, :-1])
+    with pytest.raises(ValueError):
+        accumulator.merge(InteractionMatrixAccumulator(np.arange(3), 8))
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    scans = ScanMatrix(np.arange(len(data)) + 1, data, range(data.shape[1]))
+    with pytest.raises(ValueError):
+        accumulator.add_scans(scans, 100)
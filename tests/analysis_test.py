@@ -0,0 +1,213 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.basis import SmoothInfluenceModel
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    find_voltage_corrections_with_restraints,
+)
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+
+def test_analysis_reads_file_once(raw_data_scans: ScanMatrix):
+    with patch(
+        "bimorph_mirror_analysis.analysis.read_scan_matrix"
+    ) as mock_read_scan_matrix:
+        mock_read_scan_matrix.return_value = (
+            raw_data_scans,
+            np.array([0.0, 0.0, 0.0]),
+            100,
+        )
+        analysis = BimorphAnalysis("input_file", (-1000, 1000), 500)
+        mock_read_scan_matrix.assert_not_called()
+
+        np.testing.assert_almost_equal(
+            analysis.optimal_voltages, np.array([72.14, 50.98, 18.59])
+        )
+        analysis.slit_range = (1.1, 8.5)
+        analysis.baseline_voltage_scan = -1
+        _ = analysis.optimal_voltages
+        mock_read_scan_matrix.assert_called_once_with("input_file")
+
+
+def test_analysis_slit_range(raw_data_scans: ScanMatrix):
+    with patch(
+        "bimorph_mirror_analysis.analysis.read_scan_matrix"
+    ) as mock_read_scan_matrix:
+        mock_read_scan_matrix.return_value = (
+            raw_data_scans,
+            np.array([0.0, 0.0, 0.0]),
+            100,
+        )
+        analysis = BimorphAnalysis("input_file")
+        assert analysis.data.shape[0] == raw_data_scans.shape[0]
+
+        analysis.slit_range = (1.1, 8.5)
+        assert np.all(analysis.slit_positions >= 1.1)
+        assert np.all(analysis.slit_positions <= 8.5)
+        assert analysis.data.shape == (len(analysis.slit_positions), 4)
+        assert analysis.interaction_matrix.shape == (len(analysis.slit_positions), 3)
+
+
+def test_analysis_invalidates_only_downstream_stages(raw_data_scans: ScanMatrix):
+    with (
+        patch(
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
+        patch(
+            "bimorph_mirror_analysis.analysis.find_voltage_corrections"
+        ) as mock_find_voltage_corrections,
+        patch(
+            "bimorph_mirror_analysis.analysis.find_voltage_corrections_with_restraints"
+        ) as mock_find_voltage_corrections_with_restraints,
+    ):
+        mock_read_scan_matrix.return_value = (
+            raw_data_scans,
+            np.array([0.0, 0.0, 0.0]),
+            100,
+        )
+        mock_find_voltage_corrections.side_effect = find_voltage_corrections
+        mock_find_voltage_corrections_with_restraints.side_effect = (
+            find_voltage_corrections_with_restraints
+        )
+        analysis = BimorphAnalysis("input_file", (-1000, 1000), 500)
+        _ = analysis.unrestrained_voltage_corrections
+        _ = analysis.restrained_voltage_corrections
+        interaction_matrix = analysis.interaction_matrix
+
+        # changing the constraints only re-runs the restrained solve
+        analysis.max_consecutive_voltage_difference = 10
+        _ = analysis.unrestrained_voltage_corrections
+        _ = analysis.restrained_voltage_corrections
+        assert mock_find_voltage_corrections.call_count == 1
+        assert mock_find_voltage_corrections_with_restraints.call_count == 2
+        assert analysis.interaction_matrix is interaction_matrix
+
+        # changing the baseline re-runs both solves, but keeps the matrix
+        analysis.baseline_voltage_scan = -1
+        _ = analysis.unrestrained_voltage_corrections
+        _ = analysis.restrained_voltage_corrections
+        assert mock_find_voltage_corrections.call_count == 2
+        assert mock_find_voltage_corrections_with_restraints.call_count == 3
+        assert analysis.interaction_matrix is interaction_matrix
+
+        # changing the slit range rebuilds the matrix
+        analysis.slit_range = (1.1, 8.5)
+        assert analysis.interaction_matrix is not interaction_matrix
+
+
+def test_analysis_constraints_required(raw_data_scans: ScanMatrix):
+    with patch(
+        "bimorph_mirror_analysis.analysis.read_scan_matrix"
+    ) as mock_read_scan_matrix:
+        mock_read_scan_matrix.return_value = (
+            raw_data_scans,
+            np.array([0.0, 0.0, 0.0]),
+            100,
+        )
+        analysis = BimorphAnalysis("input_file")
+        with pytest.raises(ValueError):
+            _ = analysis.optimal_voltages
+
+
+def test_analysis_weighted(tmp_path: Path):
+    scans = generate_bluesky_plan_output(4, 50, repeats=3, noise=0.001, seed=0)
+    # make the first slit position much noisier than the rest
+    noisy = scans["slit_position_x"] == scans["slit_position_x"].min()
+    scans.loc[noisy, "centroid_position_x"] += np.random.default_rng(0).normal(
+        0, 1, noisy.sum()
+    )
+    file_path = str(tmp_path / "scans.csv")
+    scans.to_csv(file_path, index=False)
+
+    analysis = BimorphAnalysis(file_path, weighted=True)
+    weights = analysis.weights
+    assert weights is not None
+    assert weights[0] < 1e-3 * np.median(weights)
+
+    weighted = analysis.unrestrained_voltage_corrections
+    analysis.weighted = False
+    assert analysis.weights is None
+    unweighted = analysis.unrestrained_voltage_corrections
+    without_noisy_row = find_voltage_corrections(
+        analysis.data[1:], analysis.voltage_increment
+    )
+    # the noisy slit position barely affects the weighted solution
+    assert np.linalg.norm(weighted - without_noisy_row) < 0.2 * np.linalg.norm(
+        unweighted - without_noisy_row
+    )
+
+
+def test_analysis_smooth_basis(tmp_path: Path):
+    file_path = str(tmp_path / "scans.csv")
+    generate_bluesky_plan_output(4, 400, noise=0.001, seed=0).to_csv(
+        file_path, index=False
+    )
+    analysis = BimorphAnalysis(file_path)
+    raw_matrix = analysis.interaction_matrix
+    assert analysis.influence_model is None
+
+    analysis.num_basis_functions = 16
+    model = analysis.influence_model
+    assert model is not None
+    assert model.coefficients.shape == (16, 4)
+    smooth_matrix = analysis.interaction_matrix
+    assert smooth_matrix.shape == raw_matrix.shape
+    assert not np.array_equal(smooth_matrix, raw_matrix)
+    np.testing.assert_allclose(smooth_matrix, raw_matrix, atol=5e-5)
+
+    analysis.basis = "bspline"
+    assert analysis.influence_model is not model
+    assert analysis.unrestrained_voltage_corrections.shape == (4,)
+
+
+def test_analysis_saved_influence_model(tmp_path: Path):
+    fine_path = str(tmp_path / "fine.csv")
+    generate_bluesky_plan_output(4, 400, noise=0.001, seed=0).to_csv(
+        fine_path, index=False
+    )
+    model = BimorphAnalysis(fine_path, num_basis_functions=16).influence_model
+    assert model is not None
+
+    coarse_path = str(tmp_path / "coarse.csv")
+    generate_bluesky_plan_output(4, 40, noise=0.001, seed=0).to_csv(
+        coarse_path, index=False
+    )
+    analysis = BimorphAnalysis(coarse_path, saved_influence_model=model)
+    assert analysis.influence_model is model
+    np.testing.assert_allclose(
+        analysis.interaction_matrix,
+        model.interaction_matrix(analysis.slit_positions),
+    )
+
+    analysis.saved_influence_model = SmoothInfluenceModel(
+        model.coefficients[:, :3], model.domain
+    )
+    with pytest.raises(ValueError):
+        analysis.influence_model  # noqa: B018
+
+
+def test_analysis_solver(tmp_path: Path):
+    file_path = str(tmp_path / "scans.csv")
+    generate_bluesky_plan_output(8, 50, seed=0).to_csv(file_path, index=False)
+    analysis = BimorphAnalysis(
+        file_path, voltage_range=(-1000, 1000), max_consecutive_voltage_difference=50
+    )
+    restrained = analysis.optimal_voltage_corrections
+
+    analysis.solver = "qp"
+    assert analysis.solver_result["solver"] == "qp"
+    np.testing.assert_allclose(
+        analysis.optimal_voltage_corrections, restrained, atol=0.5
+    )
+
+    # changing the constraints re-runs the chosen solver
+    analysis.max_consecutive_voltage_difference = 1000
+    assert analysis.solver_result["fits_constraints"]
+    analysis.solver = "auto"
+    assert analysis.solver_result["solver"] in ("pinv", "lstsq", "sparse")
@@ -0,0 +1,134 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.asynchronous import (
+    ProgressEvent,
+    calculate_optimal_voltages_async,
+    find_voltage_corrections_with_restraints_async,
+    stream_optimal_voltages,
+)
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+
+@pytest.fixture
+def scan_path(tmp_path: Path) -> str:
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 50, seed=0).to_csv(file_path, index=False)
+    return str(file_path)
+
+
+def test_calculate_optimal_voltages_async(scan_path: str):
+    events: list[ProgressEvent] = []
+    optimal_voltages = asyncio.run(
+        calculate_optimal_voltages_async(
+            scan_path, (-1000, 1000), 50, progress=events.append
+        )
+    )
+
+    expected = BimorphAnalysis(
+        scan_path, voltage_range=(-1000, 1000), max_consecutive_voltage_difference=50
+    ).optimal_voltages
+    np.testing.assert_array_equal(optimal_voltages, expected)
+
+    stages = [event["stage"] for event in events]
+    assert stages[:3] == ["read", "unrestrained", "restrained"]
+    assert stages[-1] == "done"
+    assert "iteration" in stages
+    assert all(event["name"] == scan_path for event in events)
+    np.testing.assert_array_equal(events[-1]["voltages"], expected)  # type: ignore
+
+
+def test_calculate_optimal_voltages_async_unrestrained(scan_path: str):
+    events: list[ProgressEvent] = []
+    asyncio.run(
+        calculate_optimal_voltages_async(
+            scan_path, (-1000, 1000), 1000, progress=events.append, name="vfm"
+        )
+    )
+    assert [event["stage"] for event in events] == ["read", "unrestrained", "done"]
+    assert events[0]["name"] == "vfm"
+
+
+def test_calculate_optimal_voltages_async_timeout(scan_path: str):
+    with pytest.raises(TimeoutError):
+        asyncio.run(
+            calculate_optimal_voltages_async(scan_path, (-1000, 1000), 50, timeout=0)
+        )
+
+
+def test_find_voltage_corrections_with_restraints_async_cancel(scan_path: str):
+    analysis = BimorphAnalysis(scan_path)
+    iterations: list[int | None] = []
+
+    async def solve_and_cancel():
+        executor = ThreadPoolExecutor(1)
+
+        def cancel_on_first_iteration(event: ProgressEvent):
+            iterations.append(event["iteration"])
+            task.cancel()
+
+        task = asyncio.create_task(
+            find_voltage_corrections_with_restraints_async(
+                analysis.data,
+                analysis.voltage_increment,
+                analysis.initial_voltages,
+                (-1000, 1000),
+                50,
+                progress=cancel_on_first_iteration,
+                executor=executor,
+            )
+        )
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the solve stops at its next iteration rather than running to the end
+        executor.shutdown(wait=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(solve_and_cancel())
+    assert 1 <= len(iterations) < 5
+
+
+def test_several_mirrors_concurrently(scan_path: str, tmp_path: Path):
+    other_path = tmp_path / "other_scans.csv"
+    generate_bluesky_plan_output(4, 30, seed=1).to_csv(other_path, index=False)
+
+    async def calibrate_both():
+        return await asyncio.gather(
+            calculate_optimal_voltages_async(scan_path, (-1000, 1000), 50),
+            calculate_optimal_voltages_async(str(other_path), (-1000, 1000), 50),
+        )
+
+    first, second = asyncio.run(calibrate_both())
+    assert first.shape == (8,)
+    assert second.shape == (4,)
+
+
+def test_stream_optimal_voltages(scan_path: str):
+    async def collect() -> list[ProgressEvent]:
+        return [
+            event
+            async for event in stream_optimal_voltages(scan_path, (-1000, 1000), 50)
+        ]
+
+    events = asyncio.run(collect())
+    assert events[0]["stage"] == "read"
+    assert events[-1]["stage"] == "done"
+    assert events[-1]["voltages"] is not None
+
+
+def test_stream_optimal_voltages_raises(tmp_path: Path):
+    async def collect() -> list[ProgressEvent]:
+        return [
+            event
+            async for event in stream_optimal_voltages(
+                str(tmp_path / "missing.csv"), (-1000, 1000), 50
+            )
+        ]
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(collect())
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.basis import SmoothInfluenceModel, basis_matrix
+from bimorph_mirror_analysis.maths import find_voltage_corrections
+from bimorph_mirror_analysis.synthetic import influence_functions
+
+
+@pytest.fixture
+def slit_positions() -> np.typing.NDArray[np.float64]:
+    return np.linspace(0, 100, 2000)
+
+
+@pytest.mark.parametrize("basis", ["legendre", "bspline"])
+def test_smooth_model_denoises_influence_functions(
+    slit_positions: np.typing.NDArray[np.float64], basis: str
+):
+    true_matrix = influence_functions(slit_positions, 8)
+    noisy_matrix = true_matrix + np.random.default_rng(0).normal(
+        0, 0.001, true_matrix.shape
+    )
+    model = SmoothInfluenceModel.fit(slit_positions, noisy_matrix, 24, basis)  # type: ignore
+
+    assert model.coefficients.shape == (24, 8)
+    smooth_error = np.abs(model.interaction_matrix(slit_positions) - true_matrix)
+    assert np.max(smooth_error) < 0.5 * np.max(np.abs(noisy_matrix - true_matrix))
+
+    # the model can be evaluated on a different grid within the fitted range
+    coarse = np.linspace(0, 100, 50)
+    np.testing.assert_allclose(
+        model.interaction_matrix(coarse),
+        influence_functions(coarse, 8),
+        atol=2e-3,
+    )
+
+
+@pytest.mark.parametrize("baseline_voltage_scan", [0, -1])
+def test_centroid_data_round_trips_through_solver(
+    slit_positions: np.typing.NDArray[np.float64], baseline_voltage_scan: int
+):
+    interaction_matrix = influence_functions(slit_positions, 4)
+    model = SmoothInfluenceModel.fit(slit_positions, interaction_matrix, 30)
+    baseline = np.sin(slit_positions / 10)
+    data = model.centroid_data(slit_positions, baseline, 100, baseline_voltage_scan)
+
+    np.testing.assert_array_equal(data[:, baseline_voltage_scan], baseline)
+    np.testing.assert_allclose(
+        np.diff(data, axis=1) / 100, model.interaction_matrix(slit_positions)
+    )
+    corrections = find_voltage_corrections(data, 100, baseline_voltage_scan)
+    assert corrections.shape == (4,)
+
+
+def test_save_and_load(slit_positions: np.typing.NDArray[np.float64], tmp_path: Path):
+    model = SmoothInfluenceModel.fit(
+        slit_positions, influence_functions(slit_positions, 4), 10, "bspline"
+    )
+    model.save(str(tmp_path / "model.npz"))
+    loaded = SmoothInfluenceModel.load(str(tmp_path / "model.npz"))
+    assert loaded.basis == "bspline"
+    assert loaded.domain == model.domain
+    np.testing.assert_array_equal(loaded.coefficients, model.coefficients)
+
+
+def test_save_without_npz_suffix(
+    slit_positions: np.typing.NDArray[np.float64], tmp_path: Path
+):
+    model = SmoothInfluenceModel.fit(
+        slit_positions, influence_functions(slit_positions, 4), 10
+    )
+    model.save(str(tmp_path / "model"))
+    assert not (tmp_path / "model.npz").exists()
+    loaded = SmoothInfluenceModel.load(str(tmp_path / "model"))
+    np.testing.assert_array_equal(loaded.coefficients, model.coefficients)
+
+
+def test_basis_matrix_invalid_arguments():
+    slit_positions = np.linspace(0, 1, 10)
+    with pytest.raises(ValueError):
+        basis_matrix(slit_positions, (0.5, 1.0), 4)
+    with pytest.raises(ValueError):
+        basis_matrix(slit_positions, (0.0, 1.0), 3, "bspline")
+    with pytest.raises(ValueError):
+        basis_matrix(slit_positions, (0.0, 1.0), 3, "fourier")  # type: ignore
+    with pytest.raises(ValueError):
+        SmoothInfluenceModel.fit(slit_positions, np.ones((10, 2)), 11)
@@ -0,0 +1,94 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.columnar import (
+    ColumnarFormat,
+    export_analysis,
+    read_columnar,
+    write_columnar,
+)
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_write_columnar_round_trip(tmp_path: Path, file_format: ColumnarFormat):
+    values = np.random.default_rng(0).normal(size=5)
+    file_path = str(tmp_path / f"table.{file_format}")
+    write_columnar(
+        {"x": values, "name": np.array(list("abcde"))},
+        file_path,
+        file_format,
+        metadata={"run": 3},
+    )
+    table, metadata = read_columnar(file_path)
+    assert table.column_names == ["x", "name"]
+    # written in full precision
+    np.testing.assert_array_equal(table["x"].to_numpy(), values)
+    assert metadata == {"run": 3}
+
+
+def test_read_columnar_unknown_extension(tmp_path: Path):
+    with pytest.raises(ValueError):
+        read_columnar(str(tmp_path / "table.csv"))
+
+
+def test_write_columnar_unknown_format(tmp_path: Path):
+    with pytest.raises(ValueError):
+        write_columnar({"x": np.zeros(2)}, str(tmp_path / "table"), "csv")  # type: ignore
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_export_analysis(tmp_path: Path, file_format: ColumnarFormat):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 30, seed=0).to_csv(file_path, index=False)
+    analysis = BimorphAnalysis(
+        str(file_path), (-1000, 1000), 500, slit_range=(10.0, 90.0)
+    )
+    optimal_voltages = analysis.optimal_voltages
+    paths = export_analysis(
+        analysis,
+        optimal_voltages,
+        str(tmp_path / "run"),
+        file_format,
+        metadata={"mirror_id": "vfm"},
+    )
+    assert list(paths) == [
+        "scans",
+        "interaction_matrix",
+        "predicted_centroids",
+        "voltages",
+    ]
+    assert paths["voltages"] == str(tmp_path / f"run_voltages.{file_format}")
+
+    scans, metadata = read_columnar(paths["scans"])
+    assert metadata["source_file"] == str(file_path)
+    assert metadata["slit_range"] == [10.0, 90.0]
+    assert metadata["mirror_id"] == "vfm"
+    np.testing.assert_array_equal(
+        scans["slit_position_x"].to_numpy(), analysis.slit_positions
+    )
+    np.testing.assert_array_equal(
+        scans["pencil_beam_scan_2"].to_numpy(), analysis.data[:, 2]
+    )
+
+    matrix, _ = read_columnar(paths["interaction_matrix"])
+    np.testing.assert_array_equal(
+        matrix["voltage_channel_4"].to_numpy(), analysis.interaction_matrix[:, 3]
+    )
+
+    predicted, _ = read_columnar(paths["predicted_centroids"])
+    np.testing.assert_allclose(
+        predicted["predicted_centroid"].to_numpy(),
+        analysis.predicted_centroids(analysis.optimal_voltage_corrections),
+    )
+
+    voltages, _ = read_columnar(paths["voltages"])
+    np.testing.assert_array_equal(
+        voltages["optimal_voltage"].to_numpy(), optimal_voltages
+    )
+    assert voltages["voltage_channel"].to_pylist()[0] == "voltage_channel_1"
@@ -1,10 +1,13 @@
 import os
 from typing import Any
 
+import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import pytest
 
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+
 # Prevent pytest from catching exceptions when debugging in vscode so that break on
 # exception works correctly (see: https://github.com/pytest-dev/pytest/issues/7409)
 if os.getenv("PYTEST_RAISE", "0") == "1":
@@ -23,6 +26,14 @@ if os.getenv("PYTEST_RAISE", "0") == "1":
         raise excinfo.value
 
 
+@pytest.fixture(autouse=True)
+def close_figures():
+    # figures are never shown, so close them to avoid matplotlib's warning about
+    # too many open figures, which is raised as an error
+    yield
+    plt.close("all")
+
+
 @pytest.fixture
 def raw_data() -> pd.DataFrame:
     data = """voltage_channel_1,voltage_channel_2,voltage_channel_3,slit_position_x,\
@@ -150,6 +161,11 @@ def raw_data_pivoted() -> pd.DataFrame:
     return df.apply(pd.to_numeric, errors="coerce")  # type: ignore
 
 
+@pytest.fixture
+def raw_data_scans(raw_data_pivoted: pd.DataFrame) -> ScanMatrix:
+    return ScanMatrix.from_dataframe(raw_data_pivoted)
+
+
 @pytest.fixture
 def actuator_data(
     request: pytest.FixtureRequest,
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.constraints import (
+    project_onto_constraints,
+    voltages_fit_constraints,
+)
+
+
+def test_voltages_fit_constraints():
+    voltages = np.array(
+        [
+            [0.0, 100.0, 200.0],
+            [0.0, 100.0, 700.0],  # rising difference too large
+            [0.0, -600.0, -500.0],  # falling difference too large
+            [0.0, 100.0, 1100.0],  # above the range
+        ]
+    )
+    np.testing.assert_array_equal(
+        voltages_fit_constraints(voltages, (-1000, 1000), 500),
+        [True, False, False, False],
+    )
+    assert voltages_fit_constraints(voltages[0], (-1000, 1000), 500)
+    assert voltages_fit_constraints([0.0, 100.0, 600.5], (-1000, 1000), 500, 1.0)
+
+
+def test_voltages_fit_constraints_batch_shape():
+    voltages = np.zeros((3, 4, 8))
+    assert voltages_fit_constraints(voltages, (-1000, 1000), 500).shape == (3, 4)
+
+
+def test_project_onto_constraints_feasible_unchanged():
+    voltages = np.array([-200.0, 0.0, 100.0, 50.0])
+    np.testing.assert_array_equal(
+        project_onto_constraints(voltages, (-1000, 1000), 500), voltages
+    )
+
+
+def test_project_onto_constraints_is_closest():
+    rng = np.random.default_rng(0)
+    voltages = rng.normal(0, 800, (50, 8))
+    projected = project_onto_constraints(voltages, (-1000, 1000), 200)
+
+    assert projected.shape == voltages.shape
+    assert np.all(voltages_fit_constraints(projected, (-1000, 1000), 200, 1e-6))
+    assert not np.allclose(projected, voltages)
+
+    # p is the projection of v onto a convex set if (v - p).(z - p) <= 0 for every
+    # z in the set, which holds for the other projected points
+    angles = np.einsum(
+        "ik,ijk->ij",
+        voltages - projected,
+        projected[np.newaxis, :, :] - projected[:, np.newaxis, :],
+    )
+    assert np.all(angles <= 1e-3)
+
+
+@pytest.mark.parametrize(
+    ["voltage_range", "max_diff"], [[(1000, -1000), 500], [(-1000, 1000), -1]]
+)
+def test_project_onto_constraints_invalid(
+    voltage_range: tuple[int, int], max_diff: int
+):
+    with pytest.raises(ValueError):
+        project_onto_constraints(np.zeros(3), voltage_range, max_diff)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.failure import (
+    evaluate_actuator_failures,
+    find_voltage_corrections_with_frozen_actuators,
+)
+from bimorph_mirror_analysis.maths import process_pencil_beam_scans, weight_rows
+
+
+@pytest.fixture
+def data() -> np.typing.NDArray[np.float64]:
+    return np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+
+
+def refit_without(
+    data: np.typing.NDArray[np.float64],
+    frozen: list[int],
+    weights: np.typing.NDArray[np.float64] | None = None,
+) -> tuple[np.typing.NDArray[np.float64], float]:
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(data, 100)
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
+    kept = [i for i in range(interaction_matrix.shape[1]) if i - 1 not in frozen]
+    solution = np.linalg.lstsq(
+        interaction_matrix[:, kept], desired_corrections, rcond=None
+    )[0]
+    corrections = np.zeros(interaction_matrix.shape[1])
+    corrections[kept] = solution
+    residuals = desired_corrections - interaction_matrix @ corrections
+    return corrections[1:], float(np.sqrt(np.mean(residuals**2)))
+
+
+@pytest.mark.parametrize("frozen", [[], [0], [3], [2, 5], [7, 0, 4]])
+def test_frozen_actuators_match_refit(
+    data: np.typing.NDArray[np.float64], frozen: list[int]
+):
+    fit = find_voltage_corrections_with_frozen_actuators(data, 100, frozen)
+    corrections, residual = refit_without(data, frozen)
+    np.testing.assert_allclose(fit["corrections"], np.round(corrections, 2), atol=0.011)
+    np.testing.assert_array_equal(fit["corrections"][frozen], 0)
+    assert fit["residual"] == pytest.approx(residual)
+    assert fit["penalty"] >= 0
+    if not frozen:
+        assert fit["penalty"] == pytest.approx(0, abs=1e-12)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_actuator_failures_match_refits(
+    data: np.typing.NDArray[np.float64], weighted: bool
+):
+    weights = np.linspace(0.5, 2, data.shape[0]) if weighted else None
+    failures = evaluate_actuator_failures(data, 100, weights=weights)
+    _, residual = refit_without(data, [], weights)
+    assert failures["residual"] == pytest.approx(residual)
+    assert failures["failure_corrections"].shape == (8, 8)
+    for actuator in range(8):
+        corrections, residual = refit_without(data, [actuator], weights)
+        np.testing.assert_allclose(
+            failures["failure_corrections"][actuator],
+            np.round(corrections, 2),
+            atol=0.011,
+        )
+        assert failures["failure_residuals"][actuator] == pytest.approx(residual)
+    np.testing.assert_allclose(
+        failures["penalties"], failures["failure_residuals"] - failures["residual"]
+    )
+
+
+def test_frozen_actuators_errors(data: np.typing.NDArray[np.float64]):
+    with pytest.raises(IndexError):
+        find_voltage_corrections_with_frozen_actuators(data, 100, [8])
+    with pytest.raises(IndexError):
+        find_voltage_corrections_with_frozen_actuators(data, 100, [-1])
+    with pytest.raises(IndexError):
+        evaluate_actuator_failures(data, 100, baseline_voltage_scan=9)
+
+
+def test_rank_deficient_interaction_matrix(data: np.typing.NDArray[np.float64]):
+    # an actuator with no response cannot be told apart from a frozen one
+    data = data.copy()
+    data[:, 3] = data[:, 2]
+    with pytest.raises(ValueError):
+        evaluate_actuator_failures(data, 100)
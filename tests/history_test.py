@@ -0,0 +1,96 @@
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.history import (
+    CalibrationHistory,
+    interaction_matrix_drift,
+)
+
+
+@pytest.fixture
+def history(tmp_path: Path):
+    with CalibrationHistory(str(tmp_path / "history.db")) as history:
+        yield history
+
+
+def record_run(
+    history: CalibrationHistory,
+    mirror_id: str,
+    created_at: datetime.datetime,
+    scale: float = 1.0,
+) -> int:
+    slit_positions = np.linspace(0, 10, 5)
+    return history.record(
+        mirror_id,
+        slit_positions,
+        scale * np.arange(15, dtype=np.float64).reshape(5, 3),
+        np.sin(slit_positions),
+        np.zeros(3),
+        np.array([10.0, -20.0, 30.0]),
+        voltage_range=(-1000, 1000),
+        max_consecutive_voltage_difference=500,
+        baseline_voltage_scan=0,
+        residual=0.5,
+        timings={"calculate_optimal_voltages": 0.1},
+        source_file="scans.csv",
+        created_at=created_at,
+    )
+
+
+def test_latest_returns_most_recent_run(history: CalibrationHistory):
+    first = datetime.datetime(2024, 1, 1)
+    second = datetime.datetime(2024, 2, 1)
+    record_run(history, "vfm", first)
+    second_id = record_run(history, "vfm", second, scale=2.0)
+    record_run(history, "hfm", datetime.datetime(2024, 3, 1))
+
+    latest = history.latest("vfm")
+    assert latest is not None
+    assert latest["id"] == second_id
+    assert latest["created_at"] == second.isoformat()
+    assert latest["voltage_range_min"] == -1000
+    assert latest["timings"] == {"calculate_optimal_voltages": 0.1}
+    np.testing.assert_array_equal(
+        latest["interaction_matrix"], 2.0 * np.arange(15).reshape(5, 3)
+    )
+    np.testing.assert_array_equal(latest["optimal_voltages"], [10.0, -20.0, 30.0])
+
+    earlier = history.latest("vfm", before=second)
+    assert earlier is not None
+    assert earlier["created_at"] == first.isoformat()
+    assert history.latest("other_mirror") is None
+
+
+def test_runs_filters_by_mirror_and_time(history: CalibrationHistory):
+    for month in (1, 2, 3):
+        record_run(history, "vfm", datetime.datetime(2024, month, 1))
+    record_run(history, "hfm", datetime.datetime(2024, 2, 15))
+
+    assert len(history.runs()) == 4
+    runs = history.runs(
+        "vfm",
+        since=datetime.datetime(2024, 2, 1),
+        until=datetime.datetime(2024, 3, 1),
+    )
+    assert [run["created_at"] for run in runs] == ["2024-02-01T00:00:00"]
+    assert "interaction_matrix" not in runs[0]
+
+
+def test_interaction_matrix_drift(history: CalibrationHistory):
+    record_run(history, "vfm", datetime.datetime(2024, 1, 1))
+    record = history.latest("vfm")
+    assert record is not None
+    slit_positions = record["slit_positions"]
+    interaction_matrix = record["interaction_matrix"]
+
+    assert interaction_matrix_drift(record, slit_positions, interaction_matrix) == 0
+    assert interaction_matrix_drift(
+        record, slit_positions, 1.1 * interaction_matrix
+    ) == pytest.approx(0.1)
+    with pytest.raises(ValueError):
+        interaction_matrix_drift(record, slit_positions, interaction_matrix[:, 1:])
+    with pytest.raises(ValueError):
+        interaction_matrix_drift(record, slit_positions + 1, interaction_matrix)
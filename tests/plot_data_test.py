@@ -0,0 +1,73 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.analysis import BimorphAnalysis
+from bimorph_mirror_analysis.plot_data import (
+    collect_plot_data,
+    load_plot_data,
+    save_plot_data,
+)
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+
+@pytest.fixture
+def analysis(tmp_path: Path) -> BimorphAnalysis:
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(3, 40, seed=0).to_csv(file_path, index=False)
+    return BimorphAnalysis(
+        str(file_path),
+        voltage_range=(-1000, 1000),
+        max_consecutive_voltage_difference=50,
+    )
+
+
+def test_collect_plot_data(analysis: BimorphAnalysis):
+    corrections = analysis.optimal_voltage_corrections
+    plot_data = collect_plot_data(analysis, corrections)
+    np.testing.assert_array_equal(plot_data["scan_centroids"], analysis.scans.centroids)
+    np.testing.assert_array_equal(plot_data["scan_ids"], [0, 1, 2, 3])
+    assert plot_data["interaction_matrix"].shape == (40, 3)
+    np.testing.assert_allclose(
+        plot_data["restrained_predicted_centroids"],
+        analysis.predicted_centroids(corrections),
+    )
+    assert plot_data["labels"]["max_consecutive_voltage_difference"] == 50
+
+
+def test_plot_data_round_trip(analysis: BimorphAnalysis, tmp_path: Path):
+    plot_data = collect_plot_data(analysis, analysis.optimal_voltage_corrections)
+    bundle_path = str(tmp_path / "plot_data.npz")
+    save_plot_data(plot_data, bundle_path)
+    loaded = load_plot_data(bundle_path)
+    for name, values in plot_data.items():
+        if name == "labels":
+            assert loaded["labels"]["source_file"] == analysis.file_path
+            assert loaded["labels"]["voltage_range"] == [-1000, 1000]
+        else:
+            np.testing.assert_array_equal(loaded[name], values)  # type: ignore
+
+
+def test_load_plot_data_wrong_format(tmp_path: Path):
+    bundle_path = str(tmp_path / "plot_data.npz")
+    np.savez(bundle_path, labels=np.array('{"bundle_format": 99}'))
+    with pytest.raises(ValueError):
+        load_plot_data(bundle_path)
+
+
+def test_plot_data_does_not_import_matplotlib():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, bimorph_mirror_analysis.plot_data;\
+ print('matplotlib' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"
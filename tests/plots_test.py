@@ -4,12 +4,17 @@ import numpy as np
 import pandas as pd
 import pytest
 
+from bimorph_mirror_analysis.plot_data import PlotData
 from bimorph_mirror_analysis.plots import (
     InfluenceFunctionPlot,
     MirrorSurfacePlot,
+    ParetoFrontPlot,
     PencilBeamScanPlot,
     Plot,
+    downsample_min_max,
+    render_plots,
 )
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
 
 
 @pytest.fixture
@@ -109,6 +114,32 @@ def test_pencil_beam_scan_plot(raw_data_pivoted: pd.DataFrame):
     )
 
 
+def test_pencil_beam_scan_plot_scan_matrix(raw_data_scans: ScanMatrix):
+    plot = PencilBeamScanPlot(raw_data_scans, 2)
+    lines = plot.ax.get_lines()
+    assert np.array_equal(lines[0].get_xdata(), raw_data_scans.slit_positions)
+    assert np.array_equal(lines[0].get_ydata(), raw_data_scans.scan(2))
+
+
+def test_pareto_front_plot():
+    sweep = pd.DataFrame(
+        {
+            "voltage_range_min": [-1000, -1000, -500, -500],
+            "voltage_range_max": [1000, 1000, 500, 500],
+            "max_consecutive_voltage_difference": [500, 100, 500, 100],
+            "residual": [1.0, 2.0, 1.5, 2.5],
+            "pareto": [True, True, True, False],
+        }
+    )
+    plot = ParetoFrontPlot(sweep)
+
+    assert plot.ax.get_title() == "Constraint Sweep"
+    lines = plot.ax.get_lines()
+    assert len(lines) == 2
+    np.testing.assert_array_equal(lines[0].get_xdata(), [100, 500])
+    assert len(plot.ax.collections[0].get_offsets()) == 3  # type: ignore
+
+
 def test_save_plot():
     plot = Plot()
     with (
@@ -116,3 +147,64 @@ def test_save_plot():
     ):
         plot.save_plot("output_directory/filename")
         mock_savefig.assert_called_once()
+
+
+def test_downsample_min_max_keeps_peaks_and_edges():
+    x = np.linspace(0, 10, 100_000)
+    y = np.sin(x)
+    y[12345] = 5.0  # a single spike must survive downsampling
+    y[54321] = -5.0
+    x_ds, y_ds = downsample_min_max(x, y, 500)
+
+    assert len(x_ds) <= 2 * 500 + 2
+    assert np.all(np.diff(x_ds) > 0)  # original order preserved
+    assert x_ds[0] == x[0] and x_ds[-1] == x[-1]
+    assert np.max(y_ds) == 5.0
+    assert np.min(y_ds) == -5.0
+
+
+def test_downsample_min_max_short_input_unchanged(
+    sample_slit_positions: np.typing.NDArray[np.float64],
+    sample_centroids: np.typing.NDArray[np.float64],
+):
+    x_ds, y_ds = downsample_min_max(sample_slit_positions, sample_centroids, 500)
+    np.testing.assert_array_equal(x_ds, sample_slit_positions)
+    np.testing.assert_array_equal(y_ds, sample_centroids)
+
+
+@pytest.mark.parametrize("num_buckets", [0, -1])
+def test_downsample_min_max_invalid_buckets(num_buckets: int):
+    with pytest.raises(ValueError):
+        downsample_min_max(np.arange(10.0), np.arange(10.0), num_buckets)
+
+
+def test_mirror_surface_plot_downsampled():
+    x = np.linspace(0, 10, 100_000)
+    y = np.sin(x)
+    plot = MirrorSurfacePlot(x, y, y + 0.1, y - 0.1, downsample=True)
+    width_px = int(plot.ax.get_window_extent().width)
+
+    for line in plot.ax.get_lines():
+        assert len(line.get_xdata()) <= 2 * width_px + 2  # type: ignore
+
+
+def test_render_plots(raw_data_scans: ScanMatrix):
+    interaction_matrix = np.diff(raw_data_scans.centroids, axis=1)
+    baseline = raw_data_scans.centroids[:, 0]
+    plot_data: PlotData = {
+        "scan_slit_positions": raw_data_scans.slit_positions,
+        "scan_centroids": raw_data_scans.centroids,
+        "scan_ids": raw_data_scans.scan_ids,
+        "slit_positions": raw_data_scans.slit_positions,
+        "interaction_matrix": interaction_matrix,
+        "baseline_centroids": baseline,
+        "unrestrained_predicted_centroids": baseline + 0.1,
+        "restrained_predicted_centroids": baseline - 0.1,
+        "labels": {},
+    }
+    with patch.object(Plot, "save_plot") as mock_save_plot:
+        paths = render_plots(plot_data, "outdir/")
+    assert mock_save_plot.call_count == 4 + 3 + 1
+    assert paths[0] == "outdir/pencil_beam_scan_0.png"
+    assert "outdir/actuator_2_influence_function.png" in paths
+    assert paths[-1] == "outdir/mirror_surface_plot.png"
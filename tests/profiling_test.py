@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from bimorph_mirror_analysis.maths import find_voltage_corrections_with_restraints
+from bimorph_mirror_analysis.profiling import profile_stage, profiling
+
+
+def test_profile_stage_disabled_records_nothing():
+    with profiling(False) as profiler:
+        with profile_stage("stage") as details:
+            details["key"] = "value"
+    assert profiler is None
+
+
+def test_profile_stages_nested():
+    with profiling() as profiler:
+        with profile_stage("outer"):
+            with profile_stage("inner") as details:
+                details["iterations"] = 3
+                _ = np.ones(10**5)
+    assert profiler is not None
+    outer, inner = sorted(profiler.records, key=lambda r: r["depth"])
+    assert outer["name"] == "outer" and outer["depth"] == 0
+    assert inner["name"] == "inner" and inner["depth"] == 1
+    assert inner["details"] == {"iterations": 3}
+    # the parent sees the memory allocated by its child
+    assert inner["peak_memory"] >= 8 * 10**5
+    assert outer["peak_memory"] >= inner["peak_memory"]
+    assert outer["wall_time"] >= inner["wall_time"]
+
+    summary = profiler.summary().splitlines()
+    assert summary[1].startswith("outer")
+    assert summary[2].startswith("  inner")
+    assert "iterations=3" in summary[2]
+
+
+def test_profile_records_slsqp_details(tmp_path: Path):
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    initial_voltages = np.loadtxt(
+        "tests/data/8_actuator_initial_voltages.txt", delimiter=","
+    )
+    with profiling() as profiler:
+        find_voltage_corrections_with_restraints(
+            data, -100, initial_voltages, (-1000, 1000), 500, baseline_voltage_scan=-1
+        )
+    assert profiler is not None
+    profiler.write_json(str(tmp_path / "trace.json"))
+
+    with open(tmp_path / "trace.json") as f:
+        (stage,) = json.load(f)["stages"]
+    assert stage["name"] == "find_voltage_corrections_with_restraints"
+    assert stage["details"]["solver"] == "SLSQP"
+    assert stage["details"]["iterations"] > 0
+    assert stage["details"]["function_evaluations"] >= stage["details"]["iterations"]
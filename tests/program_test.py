@@ -1,7 +1,6 @@
 from unittest.mock import patch
 
 import numpy as np
-import pandas as pd
 import pytest
 
 from bimorph_mirror_analysis.__main__ import calculate_optimal_voltages
@@ -10,20 +9,21 @@ from bimorph_mirror_analysis.maths import (
     find_voltage_corrections,
     find_voltage_corrections_with_restraints,
 )
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
 
 
-def test_calculate_optimal_voltages_mocked(raw_data_pivoted: pd.DataFrame):
+def test_calculate_optimal_voltages_mocked(raw_data_scans: ScanMatrix):
     with (
         patch(
-            "bimorph_mirror_analysis.__main__.read_bluesky_plan_output"
-        ) as mock_read_bluesky_plan_output,
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
         patch(
-            "bimorph_mirror_analysis.__main__.find_voltage_corrections"
+            "bimorph_mirror_analysis.analysis.find_voltage_corrections"
         ) as mock_find_voltage_corrections,
     ):
         # set the mock return values
-        mock_read_bluesky_plan_output.return_value = (
-            raw_data_pivoted,
+        mock_read_scan_matrix.return_value = (
+            raw_data_scans,
             np.array([0.0, 0.0, 0.0]),
             100,
         )
@@ -34,12 +34,10 @@ def test_calculate_optimal_voltages_mocked(raw_data_pivoted: pd.DataFrame):
         np.testing.assert_almost_equal(voltages, np.array([72.14, 50.98, 18.59]))
 
         # assert mock was called
-        mock_read_bluesky_plan_output.assert_called()
-        mock_read_bluesky_plan_output.assert_called_with("input_file")
+        mock_read_scan_matrix.assert_called()
+        mock_read_scan_matrix.assert_called_with("input_file")
         mock_find_voltage_corrections.assert_called()
-        expected_data: np.typing.NDArray[np.float64] = raw_data_pivoted[
-            raw_data_pivoted.columns[1:]
-        ].to_numpy()  # type: ignore
+        expected_data = raw_data_scans.centroids
         np.testing.assert_array_equal(
             mock_find_voltage_corrections.call_args[0][0], expected_data
         )  # type: ignore
@@ -72,15 +70,11 @@ def test_calculate_optimal_voltages(
     ],
 ):
     with patch(
-        "bimorph_mirror_analysis.__main__.read_bluesky_plan_output"
-    ) as mock_read_bluesky_plan_output:
+        "bimorph_mirror_analysis.analysis.read_scan_matrix"
+    ) as mock_read_scan_matrix:
         data, expected_corrections, initial_voltages = actuator_data
-        mock_read_bluesky_plan_output.return_value = (
-            pd.DataFrame(
-                np.hstack(
-                    [np.ones((data.shape[0], 1)), data]
-                )  # add blank column in place of slit position
-            ),
+        mock_read_scan_matrix.return_value = (
+            ScanMatrix(range(data.shape[0]), data, range(data.shape[1])),
             initial_voltages,
             -100,
         )
@@ -120,22 +114,18 @@ def test_calculate_optimal_voltages_with_restrictions(
 ):
     with (
         patch(
-            "bimorph_mirror_analysis.__main__.read_bluesky_plan_output"
-        ) as mock_read_bluesky_plan_output,
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
         patch(
-            "bimorph_mirror_analysis.__main__.find_voltage_corrections_with_restraints"
+            "bimorph_mirror_analysis.analysis.find_voltage_corrections_with_restraints"
         ) as mock_find_voltage_corrections_with_restraints,
     ):
         mock_find_voltage_corrections_with_restraints.side_effect = (
             find_voltage_corrections_with_restraints
         )
         data, _, initial_voltages = actuator_data
-        mock_read_bluesky_plan_output.return_value = (
-            pd.DataFrame(
-                np.hstack(
-                    [np.ones((data.shape[0], 1)), data]
-                )  # add blank column in place of slit position
-            ),
+        mock_read_scan_matrix.return_value = (
+            ScanMatrix(range(data.shape[0]), data, range(data.shape[1])),
             initial_voltages,
             -100,
         )
@@ -0,0 +1,139 @@
+import math
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.constraints import voltages_fit_constraints
+from bimorph_mirror_analysis.maths import find_voltage_corrections_with_restraints
+from bimorph_mirror_analysis.quantize import find_quantized_voltage_corrections
+from bimorph_mirror_analysis.synthetic import influence_functions
+
+
+@pytest.fixture
+def scans() -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    initial_voltages = np.loadtxt(
+        "tests/data/8_actuator_initial_voltages.txt", delimiter=","
+    )
+    return data, initial_voltages
+
+
+def small_mirror_data(
+    num_actuators: int,
+) -> np.typing.NDArray[np.float64]:
+    slit_positions = np.linspace(0, 100, 40)
+    interaction_matrix = influence_functions(slit_positions, num_actuators)
+    baseline = 0.2 * np.sin(slit_positions / 9) + 1e-3 * slit_positions**2
+    return np.column_stack(
+        [
+            baseline + 100 * interaction_matrix[:, :i].sum(axis=1)
+            for i in range(interaction_matrix.shape[1] + 1)
+        ]
+    )
+
+
+def brute_force_residuals(
+    data: np.typing.NDArray[np.float64], voltages: np.typing.NDArray[np.float64]
+) -> np.typing.NDArray[np.float64]:
+    responses = np.diff(data, axis=1) / 100
+    predicted = data[:, 0] + voltages @ responses.T
+    return np.std(predicted, axis=1)
+
+
+@pytest.mark.parametrize(
+    ["voltage_range", "max_diff", "voltage_step"],
+    [[(-500, 500), 1000, 50], [(-500, 500), 100, 50], [(-300, 400), 120, 40]],
+)
+def test_find_quantized_voltage_corrections_is_best_on_grid(
+    voltage_range: tuple[int, int], max_diff: int, voltage_step: float
+):
+    data = small_mirror_data(3)
+    initial_voltages = np.zeros(3)
+    result = find_quantized_voltage_corrections(
+        data, 100, initial_voltages, voltage_range, max_diff, voltage_step
+    )
+    assert result["optimal"]
+
+    grid = voltage_step * np.arange(
+        math.ceil(voltage_range[0] / voltage_step),
+        math.floor(voltage_range[1] / voltage_step) + 1,
+    )
+    candidates = np.stack(np.meshgrid(grid, grid, grid), axis=-1).reshape(-1, 3)
+    candidates = candidates.astype(np.float64)
+    candidates = candidates[
+        voltages_fit_constraints(candidates, voltage_range, max_diff)
+    ]
+    residuals = brute_force_residuals(data, candidates)
+
+    np.testing.assert_allclose(result["residual"], np.min(residuals), rtol=1e-9)
+    np.testing.assert_allclose(
+        brute_force_residuals(data, result["voltages"][np.newaxis, :])[0],
+        result["residual"],
+        rtol=1e-9,
+    )
+    assert result["continuous_residual"] <= result["residual"] + 1e-12
+
+
+def test_find_quantized_voltage_corrections_fits_constraints(
+    scans: tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]],
+):
+    data, initial_voltages = scans
+    result = find_quantized_voltage_corrections(
+        data, -100, initial_voltages, (-1000, 1000), 100, 5, baseline_voltage_scan=-1
+    )
+    voltages = result["voltages"]
+    np.testing.assert_array_equal(voltages % 5, 0)
+    np.testing.assert_allclose(voltages, initial_voltages + result["corrections"])
+    # exactly, with no tolerance for rounding
+    assert voltages_fit_constraints(voltages, (-1000, 1000), 100)
+    assert result["optimal"]
+
+    # no worse than rounding the restrained solution to the grid, when that fits
+    continuous = initial_voltages + find_voltage_corrections_with_restraints(
+        data, -100, initial_voltages, (-1000, 1000), 100, baseline_voltage_scan=-1
+    )
+    rounded = 5 * np.round(continuous / 5)
+    if voltages_fit_constraints(rounded, (-1000, 1000), 100):
+        responses = np.diff(data[:, ::-1], axis=1) / -100
+        predicted = data[:, -1] + (rounded - initial_voltages) @ responses.T
+        assert result["residual"] <= np.std(predicted) + 1e-9
+
+
+def test_find_quantized_voltage_corrections_time_limit():
+    data = small_mirror_data(12)
+    result = find_quantized_voltage_corrections(
+        data, 100, np.zeros(12), (-1000, 1000), 30, 1, time_limit=0.0
+    )
+    # the seed is returned when there is no time to search
+    assert not result["optimal"]
+    assert voltages_fit_constraints(result["voltages"], (-1000, 1000), 30)
+
+
+def test_find_quantized_voltage_corrections_cut_short_without_voltages():
+    # with no seed and no time to search, nothing is known about the grid
+    with (
+        patch("bimorph_mirror_analysis.quantize._Search.seed"),
+        pytest.raises(TimeoutError),
+    ):
+        find_quantized_voltage_corrections(
+            small_mirror_data(4), 100, np.zeros(4), (-1000, 1000), 30, 1, time_limit=0.0
+        )
+
+
+@pytest.mark.parametrize(
+    ["voltage_range", "max_diff", "voltage_step"],
+    [[(-500, 500), 100, 0], [(10, 40), 100, 50]],
+)
+def test_find_quantized_voltage_corrections_invalid(
+    voltage_range: tuple[int, int], max_diff: int, voltage_step: float
+):
+    with pytest.raises(ValueError):
+        find_quantized_voltage_corrections(
+            small_mirror_data(3),
+            100,
+            np.array([20.0, 20.0, 20.0]),
+            voltage_range,
+            max_diff,
+            voltage_step,
+        )
@@ -0,0 +1,72 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bimorph_mirror_analysis.constraints import voltages_fit_constraints
+from bimorph_mirror_analysis.ramp import plan_voltage_ramp, save_voltage_ramp
+
+
+def test_plan_voltage_ramp():
+    initial_voltages = np.array([0.0, 0.0, 0.0, 0.0])
+    target_voltages = np.array([500.0, 250.0, -100.0, 0.0])
+    ramp = plan_voltage_ramp(initial_voltages, target_voltages, (-1000, 1000), 500, 100)
+
+    assert ramp.shape == (6, 4)
+    np.testing.assert_array_equal(ramp[0], initial_voltages)
+    np.testing.assert_array_equal(ramp[-1], target_voltages)
+    assert np.all(np.abs(np.diff(ramp, axis=0)) <= 100 + 1e-9)
+    assert np.all(voltages_fit_constraints(ramp, (-1000, 1000), 500))
+
+
+def test_plan_voltage_ramp_at_limits():
+    initial_voltages = np.array([0.0, 300.0, 0.0])
+    target_voltages = np.array([600.0, 900.0, 600.0])
+    ramp = plan_voltage_ramp(initial_voltages, target_voltages, (0, 900), 300, 7)
+    assert len(ramp) == 87
+    np.testing.assert_array_equal(ramp[-1], target_voltages)
+
+
+def test_plan_voltage_ramp_no_change():
+    voltages = np.array([10.0, 20.0])
+    ramp = plan_voltage_ramp(voltages, voltages, (-100, 100), 50, 5)
+    np.testing.assert_array_equal(ramp, [voltages, voltages])
+
+
+@pytest.mark.parametrize(
+    ["initial_voltages", "target_voltages", "max_step"],
+    [
+        [[0.0, 600.0], [0.0, 0.0], 10.0],
+        [[0.0, 0.0], [0.0, 600.0], 10.0],
+        [[0.0, 0.0], [0.0, 0.0, 0.0], 10.0],
+        [[0.0, 0.0], [10.0, 10.0], 0.0],
+    ],
+)
+def test_plan_voltage_ramp_invalid(
+    initial_voltages: list[float], target_voltages: list[float], max_step: float
+):
+    with pytest.raises(ValueError):
+        plan_voltage_ramp(
+            np.array(initial_voltages),
+            np.array(target_voltages),
+            (-1000, 1000),
+            500,
+            max_step,
+        )
+
+
+def test_save_voltage_ramp(tmp_path: Path):
+    ramp = plan_voltage_ramp(
+        np.zeros(3), np.array([30.0, 20.0, 10.0]), (0, 100), 50, 10
+    )
+    file_path = tmp_path / "ramp.csv"
+    save_voltage_ramp(ramp, str(file_path))
+
+    table = pd.read_csv(file_path, index_col="step")
+    assert list(table.columns) == [
+        "voltage_channel_1",
+        "voltage_channel_2",
+        "voltage_channel_3",
+    ]
+    np.testing.assert_allclose(table.to_numpy(), ramp)
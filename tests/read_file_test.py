@@ -4,7 +4,11 @@ import numpy as np
 import pandas as pd
 import pytest
 
-from bimorph_mirror_analysis.read_file import read_bluesky_plan_output
+from bimorph_mirror_analysis.read_file import (
+    read_baseline_scan,
+    read_bluesky_plan_output,
+    read_bluesky_plan_output_with_statistics,
+)
 
 
 def test_read_raw_data(raw_data: pd.DataFrame, raw_data_pivoted: pd.DataFrame):
@@ -48,3 +52,62 @@ def test_read_raw_data_fail(raw_data_pivoted: pd.DataFrame):
         pd.testing.assert_frame_equal(pivoted, expected_output)
         np.testing.assert_array_equal(initial_voltages, np.array([0.0, 0.0, 0.0]))
         np.testing.assert_equal(increment, np.float64(100.0))
+
+
+def test_read_baseline_scan(raw_data: pd.DataFrame, raw_data_pivoted: pd.DataFrame):
+    with patch("bimorph_mirror_analysis.read_file.pd.read_csv") as mock_read_csv:
+        mock_read_csv.return_value = raw_data[raw_data["pencil_beam_scan_number"] == 2]
+        slit_positions, centroids, voltages = read_baseline_scan("input_path")
+        np.testing.assert_array_equal(
+            slit_positions,
+            raw_data_pivoted["slit_position_x"].to_numpy(),  # type: ignore
+        )
+        np.testing.assert_array_equal(
+            centroids,
+            raw_data_pivoted["pencil_beam_scan_2"].to_numpy(),  # type: ignore
+        )
+        np.testing.assert_array_equal(voltages, np.array([100, 100, 0]))
+
+
+def test_read_baseline_scan_multiple_voltages(raw_data: pd.DataFrame):
+    with patch("bimorph_mirror_analysis.read_file.pd.read_csv") as mock_read_csv:
+        mock_read_csv.return_value = raw_data
+        with pytest.raises(ValueError):
+            read_baseline_scan("input_path")
+
+
+def test_read_raw_data_with_statistics(
+    raw_data: pd.DataFrame, raw_data_pivoted: pd.DataFrame
+):
+    # measure every slit position twice, the second time offset by 0.1
+    repeated = pd.concat(
+        [
+            raw_data,
+            raw_data.assign(centroid_position_x=raw_data.centroid_position_x + 0.1),
+        ]
+    ).reset_index(drop=True)
+    with patch("bimorph_mirror_analysis.read_file.pd.read_csv") as mock_read_csv:
+        mock_read_csv.return_value = repeated
+        pivoted, initial_voltages, increment, counts, variances = (
+            read_bluesky_plan_output_with_statistics("input_path")
+        )
+    expected = raw_data_pivoted.copy()
+    expected[expected.columns[1:]] += 0.05
+    pd.testing.assert_frame_equal(pivoted, expected)
+    np.testing.assert_array_equal(initial_voltages, np.array([0.0, 0.0, 0.0]))
+    np.testing.assert_equal(increment, np.float64(100.0))
+    assert list(counts.columns) == list(pivoted.columns)
+    np.testing.assert_array_equal(counts[counts.columns[1:]], 2)
+    np.testing.assert_allclose(variances[variances.columns[1:]], 0.005)
+
+
+def test_read_raw_data_single_measurements_have_no_variance(
+    raw_data: pd.DataFrame,
+):
+    with patch("bimorph_mirror_analysis.read_file.pd.read_csv") as mock_read_csv:
+        mock_read_csv.return_value = raw_data
+        _, _, _, counts, variances = read_bluesky_plan_output_with_statistics(
+            "input_path"
+        )
+    np.testing.assert_array_equal(counts[counts.columns[1:]], 1)
+    assert variances[variances.columns[1:]].isna().all().all()
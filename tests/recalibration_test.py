@@ -0,0 +1,112 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    process_pencil_beam_scans,
+)
+from bimorph_mirror_analysis.recalibration import IncrementalRecalibration
+
+
+@pytest.fixture
+def recalibration() -> IncrementalRecalibration:
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    initial_voltages = np.loadtxt(
+        "tests/data/8_actuator_initial_voltages.txt", delimiter=","
+    )
+    interaction_matrix, _ = process_pencil_beam_scans(data, -100, -1)
+    return IncrementalRecalibration(
+        np.arange(len(data), dtype=np.float64),
+        interaction_matrix,
+        data[:, -1],
+        initial_voltages,
+    )
+
+
+def test_voltage_corrections_match_pinv(recalibration: IncrementalRecalibration):
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    np.testing.assert_allclose(
+        recalibration.voltage_corrections(),
+        find_voltage_corrections(data, -100, baseline_voltage_scan=-1),
+        atol=0.011,
+    )
+
+
+def test_update_without_drift(recalibration: IncrementalRecalibration):
+    step = np.linspace(-20, 20, 8)
+    matrix = recalibration.interaction_matrix.copy()
+    centroids = recalibration.baseline_centroids + matrix[:, 1:] @ step
+
+    drift = recalibration.update(recalibration.voltages + step, centroids)
+    assert drift == pytest.approx(0, abs=1e-9)
+    assert not recalibration.needs_full_rescan
+    np.testing.assert_allclose(recalibration.interaction_matrix, matrix, atol=1e-12)
+
+
+def test_update_with_drift(recalibration: IncrementalRecalibration):
+    rng = np.random.default_rng(0)
+    step = np.linspace(-20, 20, 8)
+    true_matrix = recalibration.interaction_matrix[:, 1:] * 1.5
+    measured_change = true_matrix @ step + rng.normal(0, 1e-3, len(true_matrix))
+    centroids = recalibration.baseline_centroids + measured_change
+
+    drift = recalibration.update(recalibration.voltages + step, centroids)
+    assert drift > recalibration.drift_threshold
+    assert recalibration.needs_full_rescan
+
+    # the updated matrix reproduces the measured change, and the factorisation
+    # was updated to match it
+    np.testing.assert_allclose(
+        recalibration.interaction_matrix[:, 1:] @ step, measured_change
+    )
+    desired_corrections = np.mean(centroids) - centroids
+    np.testing.assert_allclose(
+        recalibration.voltage_corrections(),
+        (np.linalg.pinv(recalibration.interaction_matrix) @ desired_corrections)[1:],
+        atol=0.006,
+    )
+
+
+def test_update_without_step(recalibration: IncrementalRecalibration):
+    step = np.linspace(-20, 20, 8)
+    centroids = (
+        recalibration.baseline_centroids
+        + 1.5 * recalibration.interaction_matrix[:, 1:] @ step
+    )
+    recalibration.update(recalibration.voltages + step, centroids)
+    assert recalibration.needs_full_rescan
+    matrix = recalibration.interaction_matrix.copy()
+    corrections = recalibration.voltage_corrections()
+
+    # a new baseline scan at the same voltages leaves the matrix as it is, and does
+    # not report the drift of the earlier update again
+    drift = recalibration.update(recalibration.voltages, centroids + 0.01)
+    assert drift == 0
+    assert not recalibration.needs_full_rescan
+    np.testing.assert_array_equal(recalibration.interaction_matrix, matrix)
+    np.testing.assert_array_equal(recalibration.baseline_centroids, centroids + 0.01)
+    np.testing.assert_allclose(recalibration.voltage_corrections(), corrections)
+
+
+def test_update_wrong_number_of_voltages(recalibration: IncrementalRecalibration):
+    with pytest.raises(ValueError):
+        recalibration.update(np.zeros(3), recalibration.baseline_centroids)
+
+
+def test_save_and_load(recalibration: IncrementalRecalibration, tmp_path: Path):
+    recalibration.update(
+        recalibration.voltages + 10, recalibration.baseline_centroids + 0.1
+    )
+    recalibration.save(str(tmp_path / "state.npz"))
+    loaded = IncrementalRecalibration.load(str(tmp_path / "state.npz"))
+
+    np.testing.assert_array_equal(
+        loaded.interaction_matrix, recalibration.interaction_matrix
+    )
+    np.testing.assert_array_equal(loaded.voltages, recalibration.voltages)
+    assert loaded.drift == recalibration.drift
+    np.testing.assert_array_equal(
+        loaded.voltage_corrections(), recalibration.voltage_corrections()
+    )
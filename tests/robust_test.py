@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    solve_voltage_corrections,
+    weighted_gram,
+)
+from bimorph_mirror_analysis.robust import (
+    find_robust_voltage_corrections,
+    robust_weights,
+)
+
+
+@pytest.fixture
+def clean_data() -> np.typing.NDArray[np.float64]:
+    # scans of a mirror which can be corrected exactly, apart from a little noise
+    rng = np.random.default_rng(0)
+    interaction_matrix = rng.normal(0, 0.01, (100, 6))
+    corrections = rng.uniform(-100, 100, 6)
+    baseline = 5 - interaction_matrix @ corrections + rng.normal(0, 0.01, 100)
+    return np.column_stack(
+        [baseline + 100 * interaction_matrix[:, :i].sum(axis=1) for i in range(7)]
+    )
+
+
+@pytest.mark.parametrize("loss", ["huber", "tukey"])
+def test_robust_corrections_ignore_bad_slit_positions(
+    clean_data: np.typing.NDArray[np.float64], loss: str
+):
+    glitched = clean_data.copy()
+    glitched[[10, 50, 90]] += np.array([[2.0], [-3.0], [4.0]])
+    expected = find_voltage_corrections(clean_data, 100)
+
+    fit = find_robust_voltage_corrections(glitched, 100, loss=loss)  # type: ignore
+
+    assert fit["converged"]
+    assert {10, 50, 90} <= set(fit["downweighted"])
+    assert len(fit["downweighted"]) <= 5
+    np.testing.assert_allclose(fit["corrections"], expected, atol=0.5)
+    assert np.max(np.abs(find_voltage_corrections(glitched, 100) - expected)) > 5
+
+
+def test_robust_corrections_match_least_squares_without_outliers(
+    clean_data: np.typing.NDArray[np.float64],
+):
+    fit = find_robust_voltage_corrections(clean_data, 100)
+    np.testing.assert_allclose(
+        fit["corrections"], find_voltage_corrections(clean_data, 100), atol=0.5
+    )
+
+
+def test_robust_solver_backend(clean_data: np.typing.NDArray[np.float64]):
+    glitched = clean_data.copy()
+    glitched[[10, 50, 90]] += np.array([[2.0], [-3.0], [4.0]])
+    result = solve_voltage_corrections(glitched, 100, solver="robust")
+    np.testing.assert_array_equal(
+        result["corrections"],
+        find_robust_voltage_corrections(glitched, 100)["corrections"],
+    )
+
+
+def test_robust_weights():
+    residuals = np.array([0.1, -0.1, 0.2, -0.2, 0.0, 10.0])
+    huber = robust_weights(residuals, "huber")
+    tukey = robust_weights(residuals, "tukey")
+    np.testing.assert_array_equal(huber[:5], 1.0)
+    assert 0 < huber[5] < 0.1
+    assert tukey[5] == 0
+    np.testing.assert_array_equal(robust_weights(np.zeros(4)), np.ones(4))
+    with pytest.raises(ValueError):
+        robust_weights(residuals, "cauchy")  # type: ignore
+
+
+def test_weighted_gram_matches_diagonal_weights():
+    rng = np.random.default_rng(0)
+    basis = rng.normal(size=(20, 4))
+    weights = rng.uniform(0, 1, (3, 20))
+    np.testing.assert_allclose(
+        weighted_gram(basis, weights[0]), basis.T @ np.diag(weights[0]) @ basis
+    )
+    np.testing.assert_allclose(
+        weighted_gram(basis, weights),
+        [basis.T @ np.diag(row_weights) @ basis for row_weights in weights],
+    )
+
+
+@pytest.mark.parametrize("chunk_elements", [1, 50, 2**22])
+def test_weighted_gram_batch_matches_each_resample(chunk_elements: int):
+    rng = np.random.default_rng(1)
+    basis = rng.normal(size=(20, 4))
+    weights = rng.multinomial(20, np.full(20, 1 / 20), size=7).astype(np.float64)
+    batched = weighted_gram(basis, weights, chunk_elements)
+    assert batched.shape == (7, 4, 4)
+    for gram, row_weights in zip(batched, weights, strict=True):
+        np.testing.assert_allclose(gram, weighted_gram(basis, row_weights))
+
+
+def test_robust_corrections_index_error(clean_data: np.typing.NDArray[np.float64]):
+    with pytest.raises(IndexError):
+        find_robust_voltage_corrections(clean_data, 100, baseline_voltage_scan=7)
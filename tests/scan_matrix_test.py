@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bimorph_mirror_analysis.maths import find_voltage_corrections
+from bimorph_mirror_analysis.read_file import read_scan_matrix
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+
+def test_scan_matrix_dataframe_round_trip(raw_data_pivoted: pd.DataFrame):
+    scans = ScanMatrix.from_dataframe(raw_data_pivoted)
+    assert scans.shape == (len(raw_data_pivoted), 4)
+    assert scans.centroids.flags.c_contiguous
+    np.testing.assert_array_equal(scans.scan_ids, [0, 1, 2, 3])
+    pd.testing.assert_frame_equal(scans.to_dataframe(), raw_data_pivoted)
+
+
+def test_scan_matrix_from_unsorted_dataframe(raw_data_pivoted: pd.DataFrame):
+    scans = ScanMatrix.from_dataframe(raw_data_pivoted[::-1])
+    np.testing.assert_array_equal(
+        scans.slit_positions, raw_data_pivoted["slit_position_x"]
+    )
+    np.testing.assert_array_equal(scans.scan(2), raw_data_pivoted["pencil_beam_scan_2"])
+
+
+def test_scan_matrix_select_slit_range_is_a_view(raw_data_scans: ScanMatrix):
+    selected = raw_data_scans.select_slit_range((1.1, 8.5))
+    assert selected.slit_positions[0] >= 1.1
+    assert selected.slit_positions[-1] <= 8.5
+    assert selected.shape == (len(selected.slit_positions), 4)
+    assert np.shares_memory(selected.centroids, raw_data_scans.centroids)
+    assert selected.centroids.flags.c_contiguous
+
+    # the ends of the range are included
+    ends = raw_data_scans.select_slit_range((1.0, 2.0))
+    np.testing.assert_array_equal(ends.slit_positions, [1.0, 1.5, 2.0])
+    assert raw_data_scans.select_slit_range(None).shape == raw_data_scans.shape
+
+
+def test_scan_matrix_missing_scan(raw_data_scans: ScanMatrix):
+    with pytest.raises(IndexError):
+        raw_data_scans.scan(4)
+
+
+@pytest.mark.parametrize(
+    ["centroids", "voltages"],
+    [[np.zeros((3, 2)), None], [np.zeros((2, 3)), np.zeros((2, 4))]],
+)
+def test_scan_matrix_invalid_shapes(
+    centroids: np.typing.NDArray[np.float64],
+    voltages: np.typing.NDArray[np.float64] | None,
+):
+    with pytest.raises(ValueError):
+        ScanMatrix([0.0, 1.0], centroids, [0, 1, 2], voltages)
+
+
+def test_read_scan_matrix(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    initial_voltages = np.array([0.0, 10.0, 20.0])
+    generate_bluesky_plan_output(
+        3, 20, initial_voltages=initial_voltages, seed=0
+    ).to_csv(file_path, index=False)
+    scans, read_initial_voltages, increment = read_scan_matrix(str(file_path))
+
+    assert scans.shape == (20, 4)
+    np.testing.assert_array_equal(read_initial_voltages, initial_voltages)
+    assert scans.voltages is not None
+    np.testing.assert_array_equal(
+        scans.voltages - initial_voltages,
+        increment * np.tril(np.ones((4, 3)), k=-1),
+    )
+    # the maths functions take the scans directly
+    np.testing.assert_array_equal(
+        find_voltage_corrections(scans, increment),
+        find_voltage_corrections(scans.centroids, increment),
+    )
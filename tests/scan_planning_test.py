@@ -0,0 +1,88 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import process_pencil_beam_scans
+from bimorph_mirror_analysis.scan_planning import select_slit_positions
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+
+
+@pytest.fixture
+def synthetic_pencil_beam_scans() -> tuple[
+    np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]
+]:
+    data_frame = generate_bluesky_plan_output(16, 1000, noise=1e-3, seed=2)
+    data = data_frame.pivot_table(
+        values="centroid_position_x",
+        index="slit_position_x",
+        columns="pencil_beam_scan_number",
+    ).to_numpy()
+    return process_pencil_beam_scans(data, 100)  # type: ignore
+
+
+@pytest.mark.parametrize("criterion", ["D", "A"])
+def test_select_slit_positions_within_tolerance(
+    synthetic_pencil_beam_scans: tuple[
+        np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]
+    ],
+    criterion: str,
+):
+    interaction_matrix, desired_corrections = synthetic_pencil_beam_scans
+    selected, error = select_slit_positions(
+        interaction_matrix,
+        desired_corrections,
+        0.05,
+        criterion,  # type: ignore
+    )
+    assert interaction_matrix.shape[1] <= len(selected) < len(interaction_matrix)
+    assert error <= 0.05
+    assert np.all(np.diff(selected) > 0)
+
+    # check the reported error against a direct solve on the selected rows
+    full = np.linalg.pinv(interaction_matrix) @ desired_corrections
+    subset = (
+        np.linalg.pinv(interaction_matrix[selected]) @ desired_corrections[selected]
+    )
+    np.testing.assert_allclose(
+        np.linalg.norm(subset[1:] - full[1:]) / np.linalg.norm(full[1:]),
+        error,
+        rtol=1e-3,
+    )
+
+
+def test_select_slit_positions_zero_tolerance_uses_every_row(
+    synthetic_pencil_beam_scans: tuple[
+        np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]
+    ],
+):
+    interaction_matrix, desired_corrections = synthetic_pencil_beam_scans
+    selected, _ = select_slit_positions(
+        interaction_matrix[:100], desired_corrections[:100], 0
+    )
+    np.testing.assert_array_equal(selected, np.arange(100))
+
+
+def test_select_slit_positions_fits_only_to_confirm(
+    synthetic_pencil_beam_scans: tuple[
+        np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]
+    ],
+):
+    # the stopping criterion is estimated from the maintained inverse, so the
+    # subset is only fitted once it is expected to be within tolerance
+    interaction_matrix, desired_corrections = synthetic_pencil_beam_scans
+    with patch(
+        "bimorph_mirror_analysis.scan_planning.np.linalg.lstsq",
+        wraps=np.linalg.lstsq,
+    ) as lstsq:
+        selected, error = select_slit_positions(
+            interaction_matrix, desired_corrections, 0.01
+        )
+    assert error <= 0.01
+    assert len(selected) > 100
+    assert lstsq.call_count <= 2
+
+
+def test_select_slit_positions_invalid_criterion():
+    with pytest.raises(ValueError):
+        select_slit_positions(np.ones((4, 2)), np.ones(4), criterion="E")  # type: ignore
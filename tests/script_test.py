@@ -2,9 +2,18 @@ import numpy as np
 import pytest
 
 from bimorph_mirror_analysis.maths import (
+    SOLVERS,
+    SolverConstraints,
     check_voltages_fit_constraints,
+    estimate_condition_number,
     find_voltage_corrections,
     find_voltage_corrections_with_restraints,
+    process_pencil_beam_scans,
+    register_solver,
+    select_solver,
+    slit_position_weights,
+    solve_voltage_corrections,
+    weight_rows,
 )
 
 
@@ -128,6 +137,7 @@ def test_find_voltage_corrections_with_restraints_index_error_throw(
         (np.array([0, 0, 0]), (-1000, 1000), 500, True),  # np arrays should work
         ([-1000, -500, 0, 500, 1000], (-1000, 1000), 500, True),
         ([0, 0, 501], (-1000, 1000), 500, False),  # diff too big
+        ([0, 0, -501], (-1000, 1000), 500, False),  # falling diff too big
         ([1000, 1000, 1001], (-1000, 1000), 500, False),  # value out of range
     ],
 )
@@ -138,3 +148,260 @@ def test_check_voltages_fit_constraints(
     expected: bool,
 ):
     assert check_voltages_fit_constraints(voltages, voltage_range, max_diff) == expected
+
+
+@pytest.mark.parametrize(
+    "actuator_data",
+    [
+        [
+            "tests/data/8_actuator_data.txt",
+            "tests/data/8_actuator_output.txt",
+            "tests/data/8_actuator_initial_voltages.txt",
+        ],
+    ],
+    indirect=True,
+)
+def test_find_voltage_corrections_with_restraints_initial_guess(
+    actuator_data: tuple[
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+    ],
+):
+    data, expected_corrections, initial_voltages = actuator_data
+    np.testing.assert_almost_equal(
+        find_voltage_corrections_with_restraints(
+            data,
+            -100,
+            initial_voltages,
+            (-1000, 1000),
+            500,
+            baseline_voltage_scan=-1,
+            initial_guess=expected_corrections,
+        ),
+        expected_corrections,
+        decimal=1,
+    )
+    with pytest.raises(ValueError):
+        find_voltage_corrections_with_restraints(
+            data,
+            -100,
+            initial_voltages,
+            (-1000, 1000),
+            500,
+            baseline_voltage_scan=-1,
+            initial_guess=expected_corrections[1:],
+        )
+
+
+def test_slit_position_weights():
+    counts = np.array([[2, 2], [2, 2], [1, 1], [4, 4]], dtype=np.float64)
+    variances = np.array([[1.0, 1.0], [4.0, 4.0], [np.nan, np.nan], [4.0, 4.0]])
+    weights = slit_position_weights(counts, variances)
+    # the variances of the means are 0.5, 2, the median 1, and 1
+    np.testing.assert_allclose(weights / weights[2], [2.0, 0.5, 1.0, 1.0])
+    assert np.mean(weights) == pytest.approx(1.0)
+
+    np.testing.assert_array_equal(
+        slit_position_weights(np.ones((3, 2)), np.full((3, 2), np.nan)), np.ones(3)
+    )
+
+
+def test_weighted_corrections_ignore_zero_weight_rows():
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    corrupted = data.copy()
+    corrupted[0] += 10
+    weights = np.ones(len(data))
+    weights[0] = 0
+    np.testing.assert_allclose(
+        find_voltage_corrections(corrupted, -100, -1, weights=weights),
+        find_voltage_corrections(data[1:], -100, -1),
+        atol=0.011,
+    )
+    np.testing.assert_array_equal(
+        find_voltage_corrections(data, -100, -1, weights=np.full(len(data), 2.0)),
+        find_voltage_corrections(data, -100, -1),
+    )
+
+
+@pytest.mark.parametrize("weights", [np.ones(3), -np.ones(4)])
+def test_weight_rows_invalid_weights(weights: np.typing.NDArray[np.float64]):
+    with pytest.raises(ValueError):
+        weight_rows(np.ones((4, 2)), np.ones(4), weights)
+
+
+@pytest.mark.parametrize("solver", ["pinv", "lstsq", "regularized", "sparse"])
+@pytest.mark.parametrize(
+    "actuator_data",
+    [
+        [
+            "tests/data/8_actuator_data.txt",
+            "tests/data/8_actuator_output.txt",
+            "tests/data/8_actuator_initial_voltages.txt",
+        ],
+    ],
+    indirect=True,
+)
+def test_unrestrained_solvers_agree(
+    actuator_data: tuple[
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+    ],
+    solver: str,
+):
+    data, _, _ = actuator_data
+    expected = find_voltage_corrections(data, -100, baseline_voltage_scan=-1)
+    result = solve_voltage_corrections(
+        data, -100, solver=solver, baseline_voltage_scan=-1
+    )
+    assert result["solver"] == solver
+    assert result["fits_constraints"] is None
+    assert result["elapsed"] >= 0
+    np.testing.assert_allclose(
+        result["corrections"], expected, atol=0.05 * np.max(np.abs(expected))
+    )
+
+
+@pytest.mark.parametrize("max_diff", [500, 100, 20])
+@pytest.mark.parametrize(
+    "actuator_data",
+    [
+        [
+            "tests/data/8_actuator_data.txt",
+            "tests/data/8_actuator_output.txt",
+            "tests/data/8_actuator_initial_voltages.txt",
+        ],
+        [
+            "tests/data/16_actuator_data.txt",
+            "tests/data/16_actuator_output.txt",
+            "tests/data/16_actuator_initial_voltages.txt",
+        ],
+    ],
+    indirect=True,
+)
+def test_qp_solver_matches_slsqp(
+    actuator_data: tuple[
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+    ],
+    max_diff: int,
+):
+    data, _, initial_voltages = actuator_data
+    results = [
+        solve_voltage_corrections(
+            data,
+            -100,
+            initial_voltages,
+            (-1000, 1000),
+            max_diff,
+            solver=solver,
+            baseline_voltage_scan=-1,
+        )
+        for solver in ("qp", "slsqp")
+    ]
+    assert results[0]["fits_constraints"]
+    np.testing.assert_allclose(
+        results[0]["corrections"], results[1]["corrections"], atol=0.1
+    )
+
+
+@pytest.mark.parametrize(
+    "actuator_data",
+    [
+        [
+            "tests/data/8_actuator_data.txt",
+            "tests/data/8_actuator_output.txt",
+            "tests/data/8_actuator_initial_voltages.txt",
+        ],
+    ],
+    indirect=True,
+)
+def test_auto_solver(
+    actuator_data: tuple[
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+        np.typing.NDArray[np.float64],
+    ],
+):
+    data, _, initial_voltages = actuator_data
+    loose = solve_voltage_corrections(
+        data, -100, initial_voltages, (-1000, 1000), 500, baseline_voltage_scan=-1
+    )
+    assert not SOLVERS[loose["solver"]]["constrained"]
+    assert loose["fits_constraints"]
+
+    tight = solve_voltage_corrections(
+        data, -100, initial_voltages, (-1000, 1000), 20, baseline_voltage_scan=-1
+    )
+    assert SOLVERS[tight["solver"]]["constrained"]
+    assert tight["fits_constraints"]
+
+
+def test_select_solver():
+    timings = [
+        {
+            "num_slit_positions": 100,
+            "num_actuators": 8,
+            "times": {"pinv": 1.0, "lstsq": 2.0, "qp": 1.0, "slsqp": 2.0},
+        },
+        {
+            "num_slit_positions": 10000,
+            "num_actuators": 128,
+            "times": {"pinv": 2.0, "lstsq": 1.0, "qp": 2.0, "slsqp": None},
+        },
+    ]
+    assert select_solver(120, 10, False, timings=timings) == "pinv"
+    assert select_solver(120, 10, True, timings=timings) == "qp"
+    assert select_solver(8000, 100, False, timings=timings) == "lstsq"
+    assert select_solver(8000, 100, True, timings=timings) == "qp"
+    assert select_solver(120, 10, False, 1e14, timings=timings) == "regularized"
+    assert select_solver(120, 10, True, 1e14, timings=timings) == "slsqp"
+    # the bundled timings
+    assert select_solver(1000, 16, True) in SOLVERS
+
+
+def test_estimate_condition_number():
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    interaction_matrix, _ = process_pencil_beam_scans(data, -100)
+    assert 1 < estimate_condition_number(interaction_matrix) < 1e10
+
+    interaction_matrix[:, 2] = interaction_matrix[:, 1]
+    assert estimate_condition_number(interaction_matrix) > 1e10
+
+
+def test_register_solver():
+    @register_solver("zeros", False, "no corrections at all")
+    def solve_zeros(  # pyright: ignore[reportUnusedFunction]
+        interaction_matrix: np.typing.NDArray[np.float64],
+        desired_corrections: np.typing.NDArray[np.float64],
+        constraints: SolverConstraints | None,
+        initial_guess: np.typing.NDArray[np.float64] | None,
+    ) -> np.typing.NDArray[np.float64]:
+        return np.zeros_like(interaction_matrix[0])
+
+    try:
+        data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+        result = solve_voltage_corrections(data, -100, solver="zeros")
+        np.testing.assert_array_equal(result["corrections"], np.zeros(8))
+    finally:
+        del SOLVERS["zeros"]
+
+
+def test_solve_voltage_corrections_invalid_arguments():
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    with pytest.raises(ValueError):
+        solve_voltage_corrections(data, -100, solver="newton")
+    with pytest.raises(ValueError):
+        # the qp solver needs constraints
+        solve_voltage_corrections(data, -100, solver="qp")
+    with pytest.raises(ValueError):
+        solve_voltage_corrections(
+            data,
+            -100,
+            voltage_range=(-1000, 1000),
+            max_consecutive_voltage_difference=500,
+        )
+    with pytest.raises(IndexError):
+        solve_voltage_corrections(data, -100, baseline_voltage_scan=9)
@@ -0,0 +1,102 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    process_pencil_beam_scans,
+)
+from bimorph_mirror_analysis.sparse import (
+    banded_interaction_matrix,
+    find_sparse_voltage_corrections,
+    influence_bands,
+    randomized_svd,
+    sparse_interaction_matrix,
+)
+from bimorph_mirror_analysis.synthetic import influence_functions
+
+
+@pytest.fixture
+def long_mirror_data() -> np.typing.NDArray[np.float64]:
+    slit_positions = np.linspace(0, 100, 1600)
+    interaction_matrix = influence_functions(slit_positions, 64)
+    baseline = np.sin(slit_positions / 7)
+    return np.column_stack(
+        [
+            baseline + 100 * interaction_matrix[:, :i].sum(axis=1)
+            for i in range(interaction_matrix.shape[1] + 1)
+        ]
+    )
+
+
+@pytest.mark.parametrize("solver", ["lsmr", "svd"])
+def test_sparse_corrections_match_dense(
+    long_mirror_data: np.typing.NDArray[np.float64], solver: str
+):
+    dense = find_voltage_corrections(long_mirror_data, 100)
+    corrections = find_sparse_voltage_corrections(
+        long_mirror_data,
+        100,
+        solver=solver,  # type: ignore
+    )
+    np.testing.assert_allclose(corrections, dense, atol=1e-2 * np.max(np.abs(dense)))
+
+
+def test_sparse_interaction_matrix_is_banded(
+    long_mirror_data: np.typing.NDArray[np.float64],
+):
+    interaction_matrix, _ = process_pencil_beam_scans(long_mirror_data, 100)
+    matrix = sparse_interaction_matrix(interaction_matrix)
+    # each actuator only influences the few slit positions around it
+    assert matrix.nnz < 0.15 * np.prod(matrix.shape)
+    np.testing.assert_array_equal(matrix[:, [0]].toarray().ravel(), 1.0)
+
+    bands = influence_bands(interaction_matrix[:, 1:])
+    assert bands.shape == (64, 2)
+    assert np.all(np.diff(bands[:, 0]) >= 0)
+    assert np.all(bands[:, 1] > bands[:, 0])
+
+    banded = sparse_interaction_matrix(interaction_matrix, bandwidth=10)
+    rows, cols = banded[:, 1:].nonzero()
+    peaks = np.argmax(np.abs(interaction_matrix[:, 1:]), axis=0)
+    assert np.all(np.abs(rows - peaks[cols]) <= 10)
+
+
+def test_randomized_svd_matches_svd():
+    matrix = np.random.default_rng(0).normal(size=(200, 20))
+    u, singular_values, vt = randomized_svd(matrix, 20)
+    np.testing.assert_allclose(singular_values, np.linalg.svd(matrix)[1])
+    np.testing.assert_allclose(u @ np.diag(singular_values) @ vt, matrix, atol=1e-10)
+
+    _, truncated, _ = randomized_svd(matrix, 5)
+    assert truncated.shape == (5,)
+
+
+def test_sparse_corrections_invalid_arguments(
+    long_mirror_data: np.typing.NDArray[np.float64],
+):
+    with pytest.raises(ValueError):
+        find_sparse_voltage_corrections(long_mirror_data, 100, solver="qr")  # type: ignore
+    with pytest.raises(IndexError):
+        find_sparse_voltage_corrections(long_mirror_data, 100, baseline_voltage_scan=65)
+
+
+def test_banded_interaction_matrix_from_scans(
+    long_mirror_data: np.typing.NDArray[np.float64],
+):
+    interaction_matrix, _ = process_pencil_beam_scans(long_mirror_data, 100)
+    for bandwidth in (None, 10):
+        expected = sparse_interaction_matrix(interaction_matrix, bandwidth=bandwidth)
+        matrix = banded_interaction_matrix(
+            long_mirror_data, 100, bandwidth=bandwidth, block_size=5
+        )
+        assert matrix.nnz == expected.nnz
+        np.testing.assert_allclose(matrix.toarray(), expected.toarray())
+
+    tracemalloc.start()
+    matrix = banded_interaction_matrix(long_mirror_data, 100, block_size=4)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the dense interaction matrix is never built
+    assert peak < 0.5 * interaction_matrix.nbytes
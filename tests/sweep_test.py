@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import find_voltage_corrections_with_restraints
+from bimorph_mirror_analysis.sweep import pareto_front, sweep_constraints
+
+
+@pytest.fixture
+def scans() -> tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]]:
+    data = np.loadtxt("tests/data/8_actuator_data.txt", delimiter=",")
+    initial_voltages = np.loadtxt(
+        "tests/data/8_actuator_initial_voltages.txt", delimiter=","
+    )
+    return data, initial_voltages
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_sweep_constraints(
+    scans: tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]],
+    max_workers: int,
+):
+    data, initial_voltages = scans
+    table = sweep_constraints(
+        data,
+        -100,
+        initial_voltages,
+        [(-1000, 1000), (-500, 500)],
+        [100, 500],
+        baseline_voltage_scan=-1,
+        max_workers=max_workers,
+    )
+    assert list(table.columns) == [
+        "voltage_range_min",
+        "voltage_range_max",
+        "max_consecutive_voltage_difference",
+        "residual",
+        "pareto",
+        "voltage_corrections",
+    ]
+    assert len(table) == 4
+    assert table["pareto"].any()
+
+    # warm starting should find the same solution as a cold start
+    tight = table.iloc[2]
+    np.testing.assert_allclose(
+        tight["voltage_corrections"],
+        find_voltage_corrections_with_restraints(
+            data, -100, initial_voltages, (-500, 500), 100, baseline_voltage_scan=-1
+        ),
+        atol=1,
+    )
+
+
+def test_sweep_constraints_empty_grid(
+    scans: tuple[np.typing.NDArray[np.float64], np.typing.NDArray[np.float64]],
+):
+    data, initial_voltages = scans
+    with pytest.raises(ValueError):
+        sweep_constraints(data, -100, initial_voltages, [], [100])
+
+
+def test_pareto_front():
+    widths = np.array([2000, 2000, 1000, 1000])
+    max_differences = np.array([500, 100, 500, 100])
+    residuals = np.array([1.0, 2.0, 1.0, 3.0])
+    # the first setting is no better than the third, which has a tighter range
+    np.testing.assert_array_equal(
+        pareto_front(widths, max_differences, residuals), [False, True, True, True]
+    )
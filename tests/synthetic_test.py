@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import find_voltage_corrections
+from bimorph_mirror_analysis.read_file import read_bluesky_plan_output
+from bimorph_mirror_analysis.synthetic import (
+    generate_bluesky_plan_output,
+    influence_functions,
+)
+
+
+@pytest.mark.parametrize("repeats", [1, 3])
+def test_synthetic_data_round_trip(tmp_path: Path, repeats: int):
+    initial_voltages = np.linspace(-50, 50, 8)
+    file_path = tmp_path / "synthetic.csv"
+    generate_bluesky_plan_output(
+        8, 50, initial_voltages=initial_voltages, repeats=repeats, seed=0
+    ).to_csv(file_path, index=False)
+
+    pivoted, read_initial_voltages, increment = read_bluesky_plan_output(str(file_path))
+    assert pivoted.shape == (50, 10)
+    np.testing.assert_allclose(read_initial_voltages, initial_voltages)
+    assert increment == 100
+
+    # without noise the measured interaction matrix is the model's
+    data = pivoted[pivoted.columns[1:]].to_numpy()
+    slit_positions = pivoted["slit_position_x"].to_numpy()
+    np.testing.assert_allclose(
+        np.diff(data, axis=1) / increment,  # type: ignore
+        influence_functions(slit_positions, 8),  # type: ignore
+        atol=1e-12,
+    )
+
+
+def test_synthetic_data_corrections_flatten_centroids():
+    data_frame = generate_bluesky_plan_output(16, 400, noise=1e-3, seed=1)
+    data = (
+        data_frame.pivot_table(
+            values="centroid_position_x",
+            index="slit_position_x",
+            columns="pencil_beam_scan_number",
+        )
+        .to_numpy()
+        .astype(np.float64)
+    )
+    corrections = find_voltage_corrections(data, 100)
+    predicted = data[:, 0] + np.diff(data, axis=1) / 100 @ corrections
+    assert np.std(predicted) < 0.2 * np.std(data[:, 0])
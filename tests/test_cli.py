@@ -1,6 +1,7 @@
 import subprocess
 import sys
-from unittest.mock import MagicMock, patch
+from pathlib import Path
+from unittest.mock import ANY, MagicMock, patch
 
 import numpy as np
 import pandas as pd
@@ -8,7 +9,14 @@ import pytest
 from typer.testing import CliRunner
 
 from bimorph_mirror_analysis import __version__
-from bimorph_mirror_analysis.__main__ import app, calculate_optimal_voltages
+from bimorph_mirror_analysis.__main__ import (
+    app,
+    calculate_optimal_voltages,
+    read_optimal_voltages,
+)
+from bimorph_mirror_analysis.maths import find_voltage_corrections_with_restraints
+from bimorph_mirror_analysis.scan_matrix import ScanMatrix
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
 
 runner = CliRunner()
 
@@ -59,6 +67,11 @@ def test_outpath_option(outpath: str | bool):
             max_consecutive_voltage_difference=500,
             baseline_voltage_scan=0,
             slit_range=None,
+            weighted=False,
+            num_basis_functions=None,
+            basis="legendre",
+            solver=None,
+            analysis=ANY,
         )
         assert "The optimal voltages are: [72.14, 50.98, 18.59]" in result.stdout
 
@@ -77,12 +90,12 @@ def test_human_readable_option(human_readable: str | bool):
             "bimorph_mirror_analysis.__main__.calculate_optimal_voltages"
         ) as mock_calculate_optimal_voltages,
         patch(
-            "bimorph_mirror_analysis.__main__.read_bluesky_plan_output"
-        ) as mock_read_bluesky_plan_output,
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
     ):
-        # Create a mock DataFrame
-        mock_pivoted = MagicMock(spec=pd.DataFrame)
-        mock_read_bluesky_plan_output.return_value = (mock_pivoted,)
+        # Create a mock ScanMatrix
+        mock_scans = MagicMock(spec=ScanMatrix)
+        mock_read_scan_matrix.return_value = (mock_scans,)
         mock_calculate_optimal_voltages.return_value = np.array([72.14, 50.98, 18.59])
 
         if type(human_readable) is str:
@@ -98,7 +111,7 @@ def test_human_readable_option(human_readable: str | bool):
                     f"{human_readable}",
                 ],
             )
-            mock_pivoted.to_csv.assert_called_once()
+            mock_scans.to_dataframe.return_value.to_csv.assert_called_once()
         else:
             result = runner.invoke(
                 app,
@@ -117,6 +130,11 @@ def test_human_readable_option(human_readable: str | bool):
             max_consecutive_voltage_difference=500,
             baseline_voltage_scan=0,
             slit_range=None,
+            weighted=False,
+            num_basis_functions=None,
+            basis="legendre",
+            solver=None,
+            analysis=ANY,
         )
         assert "The optimal voltages are: [72.14, 50.98, 18.59]" in result.stdout
 
@@ -128,18 +146,17 @@ def test_human_readable_option(human_readable: str | bool):
         [False],
     ],
 )
-def test_slit_range_option(slit_range: str | bool, raw_data_pivoted: pd.DataFrame):
+def test_slit_range_option(slit_range: str | bool, raw_data_scans: ScanMatrix):
     with (
         patch("bimorph_mirror_analysis.__main__.np.savetxt") as mock_np_save,
         patch(
             "bimorph_mirror_analysis.__main__.calculate_optimal_voltages"
         ) as mock_calculate_optimal_voltages,
         patch(
-            "bimorph_mirror_analysis.__main__.read_bluesky_plan_output"
-        ) as mock_read_bluesky_plan_output,
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
     ):
-        # Create a mock DataFrame
-        mock_read_bluesky_plan_output.return_value = (raw_data_pivoted, [0, 0, 0], 100)
+        mock_read_scan_matrix.return_value = (raw_data_scans, [0, 0, 0], 100)
         mock_calculate_optimal_voltages.side_effect = calculate_optimal_voltages
 
         if type(slit_range) is str:
@@ -165,6 +182,11 @@ def test_slit_range_option(slit_range: str | bool, raw_data_pivoted: pd.DataFram
                     float(slit_range.split(" ")[0]),
                     float(slit_range.split(" ")[1]),
                 ),
+                weighted=False,
+                num_basis_functions=None,
+                basis="legendre",
+                solver=None,
+                analysis=ANY,
             )
 
         else:
@@ -184,28 +206,33 @@ def test_slit_range_option(slit_range: str | bool, raw_data_pivoted: pd.DataFram
                 max_consecutive_voltage_difference=500,
                 baseline_voltage_scan=0,
                 slit_range=None,
+                weighted=False,
+                num_basis_functions=None,
+                basis="legendre",
+                solver=None,
+                analysis=ANY,
             )
             assert "The optimal voltages are: [72.14, 50.98, 18.59]" in result.stdout
         mock_np_save.assert_called_once()
 
 
 @pytest.mark.parametrize("output_dir", ["outdir", "outdir/"])
-def test_generate_plots(raw_data_pivoted: pd.DataFrame, output_dir: str):
+def test_generate_plots(raw_data_scans: ScanMatrix, output_dir: str):
     with (
         patch(
-            "bimorph_mirror_analysis.__main__.InfluenceFunctionPlot.save_plot"
+            "bimorph_mirror_analysis.plots.InfluenceFunctionPlot.save_plot"
         ) as mock_InfluenceFunctionPlot_save_plot,
         patch(
-            "bimorph_mirror_analysis.__main__.MirrorSurfacePlot.save_plot"
+            "bimorph_mirror_analysis.plots.MirrorSurfacePlot.save_plot"
         ) as mock_MirrorSurfacePlot_save_plot,
         patch(
-            "bimorph_mirror_analysis.__main__.PencilBeamScanPlot.save_plot"
+            "bimorph_mirror_analysis.plots.PencilBeamScanPlot.save_plot"
         ) as mock_PencilBeamScanPlot_save_plot,
         patch(
-            "bimorph_mirror_analysis.__main__.read_bluesky_plan_output"
-        ) as mock_read_bluesky_plan_output,
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
     ):
-        mock_read_bluesky_plan_output.return_value = [raw_data_pivoted, [0, 0, 0], 100]
+        mock_read_scan_matrix.return_value = [raw_data_scans, [0, 0, 0], 100]
         _ = runner.invoke(
             app,
             [
@@ -230,12 +257,618 @@ def test_generate_plots(raw_data_pivoted: pd.DataFrame, output_dir: str):
                 f"{output_dir}mirror_surface_plot.png"
             )
 
-        mock_read_bluesky_plan_output.assert_called_once()
+        mock_read_scan_matrix.assert_called_once()
         assert mock_PencilBeamScanPlot_save_plot.call_count == 4
         assert mock_InfluenceFunctionPlot_save_plot.call_count == 3
         mock_MirrorSurfacePlot_save_plot.assert_called_once()
 
 
+@pytest.mark.parametrize(
+    ["max_voltage", "expect_restrained_solve"],
+    [
+        ["1000", False],  # unrestrained solution already fits the constraints
+        ["50", True],
+    ],
+)
+def test_generate_plots_skips_restrained_solve_when_feasible(
+    raw_data_scans: ScanMatrix, max_voltage: str, expect_restrained_solve: bool
+):
+    with (
+        patch("bimorph_mirror_analysis.plots.InfluenceFunctionPlot.save_plot"),
+        patch("bimorph_mirror_analysis.plots.MirrorSurfacePlot.save_plot"),
+        patch("bimorph_mirror_analysis.plots.PencilBeamScanPlot.save_plot"),
+        patch(
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
+        patch(
+            "bimorph_mirror_analysis.analysis.find_voltage_corrections_with_restraints"
+        ) as mock_find_voltage_corrections_with_restraints,
+    ):
+        mock_read_scan_matrix.return_value = [raw_data_scans, [0, 0, 0], 100]
+        mock_find_voltage_corrections_with_restraints.return_value = np.zeros(3)
+        result = runner.invoke(
+            app,
+            ["generate-plots", "input.csv", "outdir", "-1000", max_voltage, "500"],
+        )
+        assert result.exit_code == 0
+        assert (
+            mock_find_voltage_corrections_with_restraints.called
+            == expect_restrained_solve
+        )
+
+
+def test_generate_plots_defer_rendering(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(3, 40, seed=0).to_csv(file_path, index=False)
+    result = runner.invoke(
+        app,
+        [
+            "generate-plots",
+            str(file_path),
+            str(tmp_path),
+            "-1000",
+            "1000",
+            "500",
+            "--defer-rendering",
+        ],
+    )
+    assert result.exit_code == 0
+    assert list(tmp_path.glob("*.png")) == []
+
+    plot_dir = tmp_path / "plots"
+    plot_dir.mkdir()
+    result = runner.invoke(
+        app, ["render", str(tmp_path / "plot_data.npz"), str(plot_dir)]
+    )
+    assert result.exit_code == 0
+    assert "8 plots have been saved" in result.stdout
+    assert (plot_dir / "mirror_surface_plot.png").exists()
+    assert len(list(plot_dir.glob("pencil_beam_scan_*.png"))) == 4
+
+
+def test_generate_plots_defer_rendering_does_not_import_matplotlib(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(3, 40, seed=0).to_csv(file_path, index=False)
+    # a fresh interpreter, as the other tests have already imported matplotlib
+    script = f"""
+import sys
+from bimorph_mirror_analysis.__main__ import app
+app(
+    ["generate-plots", {str(file_path)!r}, {str(tmp_path)!r}, "-1000", "1000",
+     "500", "--defer-rendering"],
+    standalone_mode=False,
+)
+print("matplotlib" in sys.modules)
+"""
+    output = subprocess.check_output([sys.executable, "-c", script]).decode()
+    assert (tmp_path / "plot_data.npz").exists()
+    assert output.strip().endswith("False")
+
+
+def test_generate_plots_voltages_path(raw_data_scans: ScanMatrix, tmp_path: Path):
+    voltages_path = tmp_path / "voltages.csv"
+    np.savetxt(voltages_path, np.array([10.0, 11.0, 12.0]), fmt="%.2f")
+    with (
+        patch("bimorph_mirror_analysis.plots.InfluenceFunctionPlot.save_plot"),
+        patch("bimorph_mirror_analysis.plots.MirrorSurfacePlot.save_plot"),
+        patch("bimorph_mirror_analysis.plots.PencilBeamScanPlot.save_plot"),
+        patch(
+            "bimorph_mirror_analysis.analysis.read_scan_matrix"
+        ) as mock_read_scan_matrix,
+        patch(
+            "bimorph_mirror_analysis.analysis.find_voltage_corrections_with_restraints"
+        ) as mock_find_voltage_corrections_with_restraints,
+        patch(
+            "bimorph_mirror_analysis.plots.MirrorSurfacePlot.__init__",
+            return_value=None,
+        ) as mock_MirrorSurfacePlot_init,
+    ):
+        mock_read_scan_matrix.return_value = [raw_data_scans, [0, 0, 0], 100]
+        result = runner.invoke(
+            app,
+            [
+                "generate-plots",
+                "input.csv",
+                "outdir",
+                "-1000",
+                "1000",
+                "1",
+                "--voltages-path",
+                str(voltages_path),
+            ],
+        )
+        assert result.exit_code == 0
+        mock_find_voltage_corrections_with_restraints.assert_not_called()
+
+        # the restrained prediction uses the saved voltages
+        data = raw_data_scans.centroids
+        interaction_matrix = np.diff(data, axis=1) / 100  # type: ignore
+        baseline = data[:, 0]  # type: ignore
+        np.testing.assert_allclose(
+            mock_MirrorSurfacePlot_init.call_args[0][3],
+            baseline + interaction_matrix @ np.array([10.0, 11.0, 12.0]),  # type: ignore
+        )
+
+
+def test_read_optimal_voltages_wrong_length(tmp_path: Path):
+    voltages_path = tmp_path / "voltages.csv"
+    np.savetxt(voltages_path, np.array([10.0, 11.0]), fmt="%.2f")
+    with pytest.raises(ValueError):
+        read_optimal_voltages(str(voltages_path), 3)
+
+
+def test_calculate_voltages_profile(raw_data_scans: ScanMatrix, tmp_path: Path):
+    with patch(
+        "bimorph_mirror_analysis.analysis.read_scan_matrix"
+    ) as mock_read_scan_matrix:
+        mock_read_scan_matrix.return_value = (raw_data_scans, [0, 0, 0], 100)
+        file_path = str(tmp_path / "raw_data.csv")
+        result = runner.invoke(
+            app,
+            [
+                "calculate-voltages",
+                file_path,
+                "-1000",
+                "1000",
+                "500",
+                "--output-path",
+                str(tmp_path / "out.csv"),
+                "--profile",
+            ],
+        )
+        assert result.exit_code == 0
+        assert "solver_path=unrestrained" in result.stdout
+        (trace_path,) = tmp_path.glob("raw_data_profile_*.json")
+        assert trace_path.exists()
+
+
+def test_plan_slit_positions(tmp_path: Path):
+    file_path = tmp_path / "synthetic.csv"
+    generate_bluesky_plan_output(8, 500, noise=1e-3, seed=0).to_csv(
+        file_path, index=False
+    )
+    output_path = tmp_path / "slit_positions.csv"
+    result = runner.invoke(
+        app,
+        [
+            "plan-slit-positions",
+            str(file_path),
+            "--tolerance",
+            "0.05",
+            "--output-path",
+            str(output_path),
+            "--time-per-point",
+            "1",
+        ],
+    )
+    assert result.exit_code == 0
+    slit_positions = np.loadtxt(output_path)
+    assert 9 <= len(slit_positions) < 500
+    saving = (500 - len(slit_positions)) * 9
+    assert f"The expected time saving is {saving} seconds" in result.stdout
+
+
+def test_recalibrate(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 200, seed=0).to_csv(file_path, index=False)
+    state_path = tmp_path / "state.npz"
+    result = runner.invoke(
+        app, ["start-recalibration", str(file_path), str(state_path)]
+    )
+    assert result.exit_code == 0
+
+    # a baseline scan of the same mirror after a correction was applied
+    voltages = np.linspace(-50, 50, 8)
+    scan = generate_bluesky_plan_output(8, 200, initial_voltages=voltages, seed=0)
+    baseline_scan_path = tmp_path / "baseline.csv"
+    scan[scan["pencil_beam_scan_number"] == 0].to_csv(baseline_scan_path, index=False)
+    output_path = tmp_path / "voltages.csv"
+    result = runner.invoke(
+        app,
+        [
+            "recalibrate",
+            str(state_path),
+            str(baseline_scan_path),
+            "--output-path",
+            str(output_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "full set of pencil beam scans" not in result.stdout
+    assert len(np.loadtxt(output_path)) == 8
+
+
+def test_calculate_voltages_reads_file_once(tmp_path: Path):
+    pytest.importorskip("pyarrow")
+    from bimorph_mirror_analysis.read_file import read_scan_matrix
+
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 30, seed=0).to_csv(file_path, index=False)
+    with patch(
+        "bimorph_mirror_analysis.analysis.read_scan_matrix",
+        side_effect=read_scan_matrix,
+    ) as mock_read_scan_matrix:
+        result = runner.invoke(
+            app,
+            [
+                "calculate-voltages",
+                str(file_path),
+                "-1000",
+                "1000",
+                "50",
+                "--output-path",
+                str(tmp_path / "voltages.csv"),
+                "--human-readable",
+                str(tmp_path / "table.csv"),
+                "--columnar-output",
+                str(tmp_path / "run"),
+                "--history",
+                str(tmp_path / "history.db"),
+                "--mirror-id",
+                "vfm",
+            ],
+        )
+    assert result.exit_code == 0
+    mock_read_scan_matrix.assert_called_once()
+
+
+def test_calculate_voltages_history_requires_mirror_id(tmp_path: Path):
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            "--history",
+            str(tmp_path / "history.db"),
+            str(tmp_path / "scans.csv"),
+            "-1000",
+            "1000",
+            "500",
+        ],
+    )
+    assert result.exit_code != 0
+
+
+def test_calculate_voltages_history_and_check_drift(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 200, seed=0).to_csv(file_path, index=False)
+    history_path = str(tmp_path / "history.db")
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            "--history",
+            history_path,
+            "--mirror-id",
+            "vfm",
+            str(file_path),
+            "-1000",
+            "1000",
+            "500",
+        ],
+    )
+    assert result.exit_code == 0
+    assert "recorded" in result.stdout
+
+    result = runner.invoke(app, ["list-calibrations", history_path])
+    assert result.exit_code == 0
+    assert "vfm" in result.stdout
+
+    result = runner.invoke(app, ["check-drift", str(file_path), history_path, "vfm"])
+    assert result.exit_code == 0
+    assert "should be recalibrated" not in result.stdout
+
+    result = runner.invoke(
+        app, ["check-drift", str(file_path), history_path, "other_mirror"]
+    )
+    assert result.exit_code != 0
+
+
+def test_estimate_uncertainty(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 200, noise=0.01, seed=0).to_csv(
+        file_path, index=False
+    )
+    output_path = tmp_path / "intervals.csv"
+    result = runner.invoke(
+        app,
+        [
+            "estimate-uncertainty",
+            str(file_path),
+            "--num-resamples",
+            "200",
+            "--seed",
+            "0",
+            "--output-path",
+            str(output_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "95% confidence intervals" in result.stdout
+    intervals = pd.read_csv(output_path)
+    assert list(intervals.columns) == [
+        "actuator",
+        "correction",
+        "standard_error",
+        "lower",
+        "upper",
+    ]
+    assert len(intervals) == 8
+
+
+def test_cross_validate(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 200, noise=0.01, seed=0).to_csv(
+        file_path, index=False
+    )
+    output_path = tmp_path / "cross_validation.csv"
+    result = runner.invoke(
+        app,
+        [
+            "cross-validate",
+            str(file_path),
+            "--num-influential",
+            "3",
+            "--output-path",
+            str(output_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "Leave-one-out RMS residual" in result.stdout
+    assert "The most influential slit positions" in result.stdout
+    table = pd.read_csv(output_path)
+    assert list(table.columns) == [
+        "slit_position_x",
+        "leverage",
+        "residual",
+        "loo_residual",
+        "cooks_distance",
+        "high_leverage",
+    ]
+    assert len(table) == 200
+
+
+def test_sweep_constraints(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 100, seed=0).to_csv(file_path, index=False)
+    output_path = tmp_path / "sweep.csv"
+    plot_path = tmp_path / "pareto.png"
+    result = runner.invoke(
+        app,
+        [
+            "sweep-constraints",
+            str(file_path),
+            "--voltage-range",
+            "-1000,1000",
+            "--voltage-range",
+            "-100,100",
+            "--max-consecutive-voltage-difference",
+            "50",
+            "--max-consecutive-voltage-difference",
+            "500",
+            "--max-workers",
+            "1",
+            "--output-path",
+            str(output_path),
+            "--plot-path",
+            str(plot_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert len(pd.read_csv(output_path)) == 4
+    assert plot_path.exists()
+
+    result = runner.invoke(
+        app,
+        [
+            "sweep-constraints",
+            str(file_path),
+            "--voltage-range",
+            "-1000",
+            "--max-consecutive-voltage-difference",
+            "50",
+        ],
+    )
+    assert result.exit_code != 0
+
+
+def test_robust_voltages(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    scans = generate_bluesky_plan_output(4, 101, seed=0)
+    scans.loc[scans["slit_position_x"] == 50.0, "centroid_position_x"] += 100
+    scans.to_csv(file_path, index=False)
+    output_path = tmp_path / "voltages.csv"
+    result = runner.invoke(
+        app,
+        ["robust-voltages", str(file_path), "--output-path", str(output_path)],
+    )
+    assert result.exit_code == 0
+    assert "slit position 50.0" in result.stdout
+    assert len(np.loadtxt(output_path)) == 4
+
+
+def test_fit_influence_functions(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 500, noise=0.001, seed=0).to_csv(
+        file_path, index=False
+    )
+    model_path = tmp_path / "model.npz"
+    result = runner.invoke(
+        app,
+        [
+            "fit-influence-functions",
+            str(file_path),
+            str(model_path),
+            "--basis-functions",
+            "20",
+            "--basis",
+            "bspline",
+        ],
+    )
+    assert result.exit_code == 0
+    assert "25.0x smaller" in result.stdout
+    assert model_path.exists()
+
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            "--basis-functions",
+            "20",
+            "--output-path",
+            str(tmp_path / "voltages.csv"),
+            str(file_path),
+            "-1000",
+            "1000",
+            "500",
+        ],
+    )
+    assert result.exit_code == 0
+
+
+def test_calculate_voltages_with_influence_model(tmp_path: Path):
+    fine_path = tmp_path / "fine.csv"
+    generate_bluesky_plan_output(4, 500, noise=0.001, seed=0).to_csv(
+        fine_path, index=False
+    )
+    model_path = tmp_path / "model"
+    result = runner.invoke(
+        app,
+        [
+            "fit-influence-functions",
+            str(fine_path),
+            str(model_path),
+            "--basis-functions",
+            "20",
+        ],
+    )
+    assert result.exit_code == 0
+    assert model_path.exists()
+
+    # the stored model rebuilds the interaction matrix at a coarser slit sampling
+    coarse_path = tmp_path / "coarse.csv"
+    generate_bluesky_plan_output(4, 50, noise=0.001, seed=0).to_csv(
+        coarse_path, index=False
+    )
+    output_path = tmp_path / "voltages.csv"
+    with patch("bimorph_mirror_analysis.analysis.SmoothInfluenceModel.fit") as mock_fit:
+        result = runner.invoke(
+            app,
+            [
+                "calculate-voltages",
+                str(coarse_path),
+                "-1000",
+                "1000",
+                "500",
+                "--influence-model",
+                str(model_path),
+                "--output-path",
+                str(output_path),
+            ],
+        )
+    assert result.exit_code == 0
+    mock_fit.assert_not_called()
+    assert len(np.loadtxt(output_path)) == 4
+
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            str(coarse_path),
+            "-1000",
+            "1000",
+            "500",
+            "--influence-model",
+            str(tmp_path / "missing"),
+        ],
+    )
+    assert result.exit_code != 0
+    assert "There is no influence model" in result.output
+
+
+def test_recalibrate_without_npz_suffix(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 200, seed=0).to_csv(file_path, index=False)
+    state_path = str(tmp_path / "state")
+    result = runner.invoke(app, ["start-recalibration", str(file_path), state_path])
+    assert result.exit_code == 0
+    assert not (tmp_path / "state.npz").exists()
+
+    scan = generate_bluesky_plan_output(8, 200, seed=0)
+    baseline_scan_path = tmp_path / "baseline.csv"
+    scan[scan["pencil_beam_scan_number"] == 0].to_csv(baseline_scan_path, index=False)
+    result = runner.invoke(
+        app,
+        [
+            "recalibrate",
+            state_path,
+            str(baseline_scan_path),
+            "--output-path",
+            str(tmp_path / "voltages.csv"),
+        ],
+    )
+    assert result.exit_code == 0
+    assert len(np.loadtxt(tmp_path / "voltages.csv")) == 8
+
+
+def test_calculate_voltages_warm_start(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 200, seed=0).to_csv(file_path, index=False)
+    history_path = str(tmp_path / "history.db")
+    args = [
+        "calculate-voltages",
+        str(file_path),
+        "-1000",
+        "1000",
+        "50",
+        "--output-path",
+        str(tmp_path / "voltages.csv"),
+        "--history",
+        history_path,
+        "--mirror-id",
+        "vfm",
+        "--warm-start",
+    ]
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0
+    assert "There is no calibration of vfm to warm start from" in result.stdout
+    first_voltages = np.loadtxt(tmp_path / "voltages.csv")
+
+    with patch(
+        "bimorph_mirror_analysis.analysis.find_voltage_corrections_with_restraints",
+        side_effect=find_voltage_corrections_with_restraints,
+    ) as mock_find_voltage_corrections_with_restraints:
+        result = runner.invoke(app, args)
+    assert result.exit_code == 0
+    assert "Warm starting from the calibration" in result.stdout
+    # the generated scans start from zero voltages
+    np.testing.assert_allclose(
+        mock_find_voltage_corrections_with_restraints.call_args.kwargs["initial_guess"],
+        first_voltages,
+    )
+
+
+def test_calculate_voltages_warm_start_requires_history():
+    result = runner.invoke(
+        app,
+        ["calculate-voltages", "scans.csv", "-1000", "1000", "50", "--warm-start"],
+    )
+    assert result.exit_code != 0
+
+
+def test_check_drift_missing_history(tmp_path: Path):
+    history_path = tmp_path / "history.db"
+    result = runner.invoke(app, ["check-drift", "scans.csv", str(history_path), "vfm"])
+    assert result.exit_code != 0
+    assert not history_path.exists()
+
+
+def test_list_calibrations_missing_history(tmp_path: Path):
+    history_path = tmp_path / "history.db"
+    result = runner.invoke(app, ["list-calibrations", str(history_path)])
+    assert result.exit_code != 0
+    assert not history_path.exists()
+
+
 def test_cli_version():
     cmd = [
         sys.executable,
@@ -247,3 +880,242 @@ def test_cli_version():
         subprocess.check_output(cmd).decode().strip("Version: ").strip("\n")
         == __version__
     )
+
+
+def test_plan_ramp(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(
+        3, 20, initial_voltages=np.array([0.0, 100.0, 200.0])
+    ).to_csv(file_path, index=False)
+    voltages_path = tmp_path / "voltages.csv"
+    np.savetxt(voltages_path, np.array([300.0, 200.0, 100.0]), fmt="%.2f")
+    result = runner.invoke(
+        app,
+        [
+            "plan-ramp",
+            str(file_path),
+            str(voltages_path),
+            "-500",
+            "500",
+            "200",
+            "--max-step",
+            "100",
+        ],
+    )
+    assert result.exit_code == 0
+    assert "ramp of 3 steps" in result.stdout
+    ramp = pd.read_csv(tmp_path / "voltages_ramp.csv", index_col="step")
+    np.testing.assert_allclose(ramp.iloc[-1], [300.0, 200.0, 100.0])
+
+
+def test_quantize_voltages(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 50, seed=0).to_csv(file_path, index=False)
+    output_path = tmp_path / "voltages.csv"
+    result = runner.invoke(
+        app,
+        [
+            "quantize-voltages",
+            str(file_path),
+            "-1000",
+            "1000",
+            "50",
+            "--voltage-step",
+            "10",
+            "--output-path",
+            str(output_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "The best voltages on a grid of 10.0 V were found" in result.stdout
+    voltages = np.loadtxt(output_path)
+    np.testing.assert_array_equal(voltages % 10, 0)
+    assert np.max(np.abs(np.diff(voltages))) <= 50
+
+
+@pytest.mark.parametrize(
+    ["error", "message"],
+    [
+        [TimeoutError("cut short"), "try a longer --time-limit"],
+        [ValueError("No voltages fit the constraints"), "No voltages fit"],
+    ],
+)
+def test_quantize_voltages_without_voltages(
+    tmp_path: Path, error: Exception, message: str
+):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 30, seed=0).to_csv(file_path, index=False)
+    with patch(
+        "bimorph_mirror_analysis.__main__.find_quantized_voltage_corrections",
+        side_effect=error,
+    ):
+        result = runner.invoke(
+            app, ["quantize-voltages", str(file_path), "-1000", "1000", "50"]
+        )
+    assert result.exit_code == 1
+    assert message in result.stdout
+    # only a search which finished shows that no voltages fit
+    assert ("No voltages fit" in result.stdout) == isinstance(error, ValueError)
+
+
+def test_accumulate_and_merge_interaction_matrices(tmp_path: Path):
+    state_paths: list[str] = []
+    for seed in range(3):
+        file_path = tmp_path / f"scans_{seed}.csv"
+        generate_bluesky_plan_output(4, 30, seed=seed, noise=0.01).to_csv(
+            file_path, index=False
+        )
+        state_path = str(tmp_path / f"matrices_{seed % 2}.npz")
+        result = runner.invoke(
+            app, ["accumulate-interaction-matrix", str(file_path), state_path]
+        )
+        assert result.exit_code == 0
+        assert f"averaged over {seed // 2 + 1} sessions" in result.stdout
+        if state_path not in state_paths:
+            state_paths.append(state_path)
+
+    merged_path = str(tmp_path / "merged.npz")
+    result = runner.invoke(
+        app, ["merge-interaction-matrices", merged_path, *state_paths]
+    )
+    assert result.exit_code == 0
+    assert "3 sessions from 2 files" in result.stdout
+
+    result = runner.invoke(
+        app,
+        [
+            "start-recalibration",
+            str(tmp_path / "scans_0.csv"),
+            str(tmp_path / "recalibration.npz"),
+            "--interaction-matrix-path",
+            merged_path,
+        ],
+    )
+    assert result.exit_code == 0
+    with (
+        np.load(tmp_path / "recalibration.npz") as state,
+        np.load(merged_path) as merged,
+    ):
+        np.testing.assert_allclose(state["interaction_matrix"], merged["mean"])
+
+
+def test_accumulate_interaction_matrix_without_npz_suffix(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 30, seed=0).to_csv(file_path, index=False)
+    state_path = str(tmp_path / "state")
+    for count in (1, 2):
+        result = runner.invoke(
+            app, ["accumulate-interaction-matrix", str(file_path), state_path]
+        )
+        assert result.exit_code == 0
+        assert f"averaged over {count} sessions" in result.stdout
+    assert not (tmp_path / "state.npz").exists()
+
+
+def test_what_if(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 50, seed=0).to_csv(file_path, index=False)
+    output_path = tmp_path / "failures.csv"
+    result = runner.invoke(
+        app,
+        [
+            "what-if",
+            str(file_path),
+            "--frozen-actuator",
+            "2",
+            "--frozen-actuator",
+            "5",
+            "--output-path",
+            str(output_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "RMS residual after the failure of each actuator" in result.stdout
+    assert "With actuators 2, 5 frozen" in result.stdout
+    failures = pd.read_csv(output_path)
+    assert list(failures.columns) == ["actuator", "residual", "penalty"]
+    assert len(failures) == 8
+
+
+def test_what_if_invalid_actuator(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 50, seed=0).to_csv(file_path, index=False)
+    result = runner.invoke(app, ["what-if", str(file_path), "--frozen-actuator", "9"])
+    assert result.exit_code != 0
+
+
+def test_calculate_voltages_columnar_output(tmp_path: Path):
+    pytest.importorskip("pyarrow")
+    from bimorph_mirror_analysis.columnar import read_columnar
+
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(4, 30, seed=0).to_csv(file_path, index=False)
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            str(file_path),
+            "-1000",
+            "1000",
+            "500",
+            "--output-path",
+            str(tmp_path / "voltages.csv"),
+            "--columnar-output",
+            str(tmp_path / "run"),
+            "--columnar-format",
+            "arrow",
+        ],
+    )
+    assert result.exit_code == 0
+    assert "The columnar tables have been saved" in result.stdout
+    voltages, metadata = read_columnar(str(tmp_path / "run_voltages.arrow"))
+    np.testing.assert_allclose(
+        voltages["optimal_voltage"].to_numpy(),
+        np.loadtxt(tmp_path / "voltages.csv"),
+    )
+    assert metadata["max_consecutive_voltage_difference"] == 500
+
+
+def test_calculate_voltages_columnar_format_invalid():
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            "tests/data/raw_data.csv",
+            "-1000",
+            "1000",
+            "500",
+            "--columnar-format",
+            "csv",
+        ],
+    )
+    assert result.exit_code != 0
+
+
+def test_calculate_voltages_solver(tmp_path: Path):
+    file_path = tmp_path / "scans.csv"
+    generate_bluesky_plan_output(8, 50, seed=0).to_csv(file_path, index=False)
+    output_path = tmp_path / "voltages.csv"
+    result = runner.invoke(
+        app,
+        [
+            "calculate-voltages",
+            str(file_path),
+            "-1000",
+            "1000",
+            "50",
+            "--solver",
+            "qp",
+            "--output-path",
+            str(output_path),
+        ],
+    )
+    assert result.exit_code == 0
+    assert "The qp solver found the voltages in" in result.stdout
+    assert len(np.loadtxt(output_path)) == 8
+
+    result = runner.invoke(
+        app,
+        ["calculate-voltages", str(file_path), "-1000", "1000", "50", "--solver", "x"],
+    )
+    assert result.exit_code != 0
@@ -0,0 +1,190 @@
+import numpy as np
+import pytest
+
+from bimorph_mirror_analysis.maths import (
+    find_voltage_corrections,
+    process_pencil_beam_scans,
+    weight_rows,
+)
+from bimorph_mirror_analysis.synthetic import generate_bluesky_plan_output
+from bimorph_mirror_analysis.uncertainty import (
+    _resample_rows,  # type: ignore
+    bootstrap_voltage_corrections,
+    cross_validate_voltage_corrections,
+)
+
+
+@pytest.fixture
+def noisy_data() -> np.typing.NDArray[np.float64]:
+    scans = generate_bluesky_plan_output(8, 300, noise=0.01, seed=0)
+    return (
+        scans.pivot_table(
+            index="slit_position_x",
+            columns="pencil_beam_scan_number",
+            values="centroid_position_x",
+        )
+        .to_numpy()
+        .astype(np.float64)
+    )
+
+
+@pytest.mark.parametrize("method", ["rows", "residuals"])
+def test_bootstrap_intervals_contain_point_estimate(
+    noisy_data: np.typing.NDArray[np.float64], method: str
+):
+    intervals = bootstrap_voltage_corrections(
+        noisy_data,
+        100,
+        num_resamples=500,
+        method=method,  # type: ignore
+        seed=0,
+    )
+    np.testing.assert_array_equal(
+        intervals["corrections"], find_voltage_corrections(noisy_data, 100)
+    )
+    assert intervals["lower"].shape == (8,)
+    assert np.all(intervals["lower"] <= intervals["corrections"] + 0.01)
+    assert np.all(intervals["corrections"] - 0.01 <= intervals["upper"])
+    assert np.all(intervals["standard_error"] > 0)
+
+
+def test_bootstrap_is_reproducible_with_seed(
+    noisy_data: np.typing.NDArray[np.float64],
+):
+    first = bootstrap_voltage_corrections(noisy_data, 100, num_resamples=50, seed=1)
+    second = bootstrap_voltage_corrections(noisy_data, 100, num_resamples=50, seed=1)
+    np.testing.assert_array_equal(first["lower"], second["lower"])
+
+
+def test_resample_rows_matches_lstsq_on_each_resample():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(40, 5))
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(data, 1.0)
+    resampled = _resample_rows(
+        interaction_matrix, desired_corrections, 4, np.random.default_rng(1)
+    )
+    weights = np.random.default_rng(1).multinomial(40, np.full(40, 1 / 40), size=4)
+    for corrections, counts in zip(resampled, weights, strict=True):
+        rows = np.repeat(np.arange(40), counts)
+        np.testing.assert_allclose(
+            corrections,
+            np.linalg.lstsq(interaction_matrix[rows], desired_corrections[rows])[0],
+            atol=1e-10,
+        )
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"confidence_level": 1.0}, {"num_resamples": 0}, {"method": "columns"}],
+)
+def test_bootstrap_invalid_arguments(
+    noisy_data: np.typing.NDArray[np.float64], kwargs: dict[str, object]
+):
+    with pytest.raises(ValueError):
+        bootstrap_voltage_corrections(noisy_data, 100, **kwargs)  # type: ignore
+
+
+def test_bootstrap_index_error(noisy_data: np.typing.NDArray[np.float64]):
+    with pytest.raises(IndexError):
+        bootstrap_voltage_corrections(noisy_data, 100, baseline_voltage_scan=9)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_cross_validation_matches_refits(
+    noisy_data: np.typing.NDArray[np.float64], weighted: bool
+):
+    data = noisy_data[::10]
+    weights = np.linspace(0.5, 2, data.shape[0]) if weighted else None
+    validation = cross_validate_voltage_corrections(data, 100, weights=weights)
+
+    interaction_matrix, desired_corrections = process_pencil_beam_scans(data, 100)
+    if weights is not None:
+        interaction_matrix, desired_corrections = weight_rows(
+            interaction_matrix, desired_corrections, weights
+        )
+    for row in range(len(desired_corrections)):
+        kept = np.arange(len(desired_corrections)) != row
+        solution = np.linalg.lstsq(
+            interaction_matrix[kept], desired_corrections[kept], rcond=None
+        )[0]
+        np.testing.assert_allclose(
+            validation["loo_residuals"][row],
+            desired_corrections[row] - interaction_matrix[row] @ solution,
+            atol=1e-10,
+        )
+    solution = np.linalg.lstsq(interaction_matrix, desired_corrections, rcond=None)[0]
+    np.testing.assert_allclose(
+        validation["corrections"], np.round(solution[1:], 2), atol=0.011
+    )
+    assert validation["cv_rms_error"] >= validation["rms_error"]
+
+
+def test_cross_validation_influential_rows(noisy_data: np.typing.NDArray[np.float64]):
+    data = noisy_data.copy()
+    # well above the misfit of the synthetic mirror to the linear model
+    data[150] += 5
+    validation = cross_validate_voltage_corrections(data, 100, num_influential=3)
+    assert len(validation["influential_rows"]) == 3
+    assert validation["influential_rows"][0] == 150
+    assert np.all(
+        np.diff(validation["cooks_distance"][validation["influential_rows"]]) <= 0
+    )
+    assert validation["leverage"].sum() == pytest.approx(data.shape[1])
+
+
+def brute_force_loo_residuals(
+    interaction_matrix: np.typing.NDArray[np.float64],
+    desired_corrections: np.typing.NDArray[np.float64],
+) -> np.typing.NDArray[np.float64]:
+    loo_residuals = np.empty(len(desired_corrections))
+    for row in range(len(desired_corrections)):
+        kept = np.arange(len(desired_corrections)) != row
+        solution = np.linalg.pinv(interaction_matrix[kept]) @ desired_corrections[kept]
+        loo_residuals[row] = (
+            desired_corrections[row] - interaction_matrix[row] @ solution
+        )
+    return loo_residuals
+
+
+def test_cross_validation_row_determining_fit():
+    # with as many slit positions as unknowns, every slit position determines the fit
+    data = np.array([[0.0, 1.0, 3.0], [1.0, 1.5, 1.0], [2.0, 4.0, 2.5]])
+    validation = cross_validate_voltage_corrections(data, 100)
+    assert np.all(validation["high_leverage"])
+    assert validation["rms_error"] == pytest.approx(0)
+    np.testing.assert_allclose(
+        validation["loo_residuals"],
+        brute_force_loo_residuals(*process_pencil_beam_scans(data, 100)),
+        atol=1e-10,
+    )
+
+
+def test_cross_validation_rank_deficient_matches_refits():
+    rng = np.random.default_rng(0)
+    responses = rng.normal(0, 0.01, (30, 4))
+    # the last two actuators respond the same, and only one slit position sees the
+    # first, so it has a leverage of 1
+    responses[:, 3] = responses[:, 2]
+    responses[:, 0] = 0
+    responses[7, 0] = 0.02
+    baseline = rng.normal(0, 0.1, 30)
+    data = np.column_stack(
+        [baseline + 100 * responses[:, :i].sum(axis=1) for i in range(5)]
+    )
+    validation = cross_validate_voltage_corrections(data, 100)
+
+    assert np.flatnonzero(validation["high_leverage"]).tolist() == [7]
+    assert np.all(np.isfinite(validation["loo_residuals"]))
+    assert np.all(np.isfinite(validation["cooks_distance"]))
+    np.testing.assert_allclose(
+        validation["loo_residuals"],
+        brute_force_loo_residuals(*process_pencil_beam_scans(data, 100)),
+        atol=1e-10,
+    )
+
+
+def test_cross_validation_invalid_arguments(noisy_data: np.typing.NDArray[np.float64]):
+    with pytest.raises(IndexError):
+        cross_validate_voltage_corrections(noisy_data, 100, baseline_voltage_scan=9)
+    with pytest.raises(ValueError):
+        cross_validate_voltage_corrections(noisy_data, 100, num_influential=-1)